@@ -0,0 +1,141 @@
+import io
+import os
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from .models import ImageDerivative
+
+logger = logging.getLogger('apps.common')
+
+# 各类图片生成的派生宽度（像素），只生成小于原图宽度的尺寸
+DERIVATIVE_WIDTHS = {
+    'avatar': (64, 128, 256),
+    'cover': (320, 640, 1280),
+}
+DERIVATIVE_FORMATS = (('webp', 'WEBP'), ('jpg', 'JPEG'))
+DERIVATIVE_MAX_SOURCE_BYTES = 20 * 1024 * 1024
+VARIANTS_CACHE_TIMEOUT = 60 * 60 * 24
+VARIANTS_MISS_TIMEOUT = 60
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='image-derivatives')
+
+
+def variant_name(original, width, ext):
+    """派生图与原图同目录：covers/abc.png -> covers/abc@320w.webp"""
+    base, _ = os.path.splitext(original)
+    return f"{base}@{width}w.{ext}"
+
+
+def render_derivatives(data, widths):
+    """
+    按宽度等比缩放并编码为 WebP / JPEG
+    :return: [(width, ext, bytes), ...]
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source)
+        image = image.convert('RGBA' if 'A' in image.getbands() or image.mode == 'P' else 'RGB')
+        results = []
+        for width in sorted(widths):
+            if width >= image.width:
+                break
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.LANCZOS)
+            for ext, fmt in DERIVATIVE_FORMATS:
+                frame = resized.convert('RGB') if fmt == 'JPEG' else resized
+                out = io.BytesIO()
+                frame.save(out, fmt, quality=82)
+                results.append((width, ext, out.getvalue()))
+    return results
+
+
+def generate_derivatives(original, name, kind, load, save):
+    """
+    读取原图，生成派生图并记录可用宽度
+    :param original: 原图引用（本地路径或 URL），序列化器按它查找派生图
+    :param name: 原图在存储中的名称，派生图按它命名保存
+    :param load: load(name) 从存储读取原图
+    :param save: save(name, bytes) 写入存储
+    :return: 生成的宽度列表
+    """
+    try:
+        data = load(name)
+        if len(data) > DERIVATIVE_MAX_SOURCE_BYTES:
+            return []
+        rendered = render_derivatives(data, DERIVATIVE_WIDTHS[kind])
+    except ImportError:
+        logger.warning("Pillow is not installed, skipping image derivatives")
+        return []
+    except Exception as e:
+        logger.warning(f"Image derivatives failed for {original}: {str(e)}")
+        return []
+
+    for width, ext, content in rendered:
+        save(variant_name(name, width, ext), content)
+    widths = sorted({width for width, _, _ in rendered})
+    ImageDerivative.objects.update_or_create(original=original, defaults={"widths": widths})
+    cache.set(_variants_key(original), widths, timeout=VARIANTS_CACHE_TIMEOUT)
+    return widths
+
+
+def _run(*args):
+    try:
+        generate_derivatives(*args)
+    except Exception:
+        logger.exception("Image derivatives job failed")
+    finally:
+        if threading.current_thread() is not threading.main_thread():
+            connections.close_all()
+
+
+def schedule_derivatives(original, name, kind, load, save, size=None):
+    """
+    事务提交后在后台线程生成派生图，不阻塞上传请求
+    队列中只保存存储名称，原图在任务执行时再读取，积压的任务不占用内存
+    """
+    if size is not None and size > DERIVATIVE_MAX_SOURCE_BYTES:
+        return
+    transaction.on_commit(lambda: _executor.submit(_run, original, name, kind, load, save))
+
+
+def load_from_default_storage(name):
+    with default_storage.open(name, 'rb') as f:
+        return f.read()
+
+
+def save_to_default_storage(name, content):
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    default_storage.save(name, ContentFile(content))
+
+
+def _variants_key(original):
+    return f"image:variants:{hashlib.md5(original.encode('utf-8')).hexdigest()}"
+
+
+def get_variant_widths(original):
+    widths = cache.get(_variants_key(original))
+    if widths is None:
+        widths = ImageDerivative.objects.filter(original=original).values_list('widths', flat=True).first() or []
+        # 尚未生成时短暂缓存，后台任务完成后会直接写入
+        cache.set(_variants_key(original), widths, timeout=VARIANTS_CACHE_TIMEOUT if widths else VARIANTS_MISS_TIMEOUT)
+    return widths
+
+
+def best_variant(original, size):
+    """
+    返回不小于 size 的最小派生图，没有合适尺寸时返回原图
+    接口请求的 Accept 头不反映 <img> 的解码能力，统一返回 WebP；同名 .jpg 供不支持 WebP 的客户端替换后缀回退
+    """
+    if not original or not size:
+        return original
+    widths = [width for width in get_variant_widths(original) if width >= size]
+    if not widths:
+        return original
+    return variant_name(original, min(widths), 'webp')
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.9 on 2026-10-18 02:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UploadedObject",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="创建时间"),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="更新时间"),
+                ),
+                (
+                    "key",
+                    models.CharField(
+                        max_length=500, unique=True, verbose_name="对象Key"
+                    ),
+                ),
+                ("url", models.CharField(max_length=500, verbose_name="访问地址")),
+                (
+                    "upload_type",
+                    models.CharField(max_length=32, verbose_name="上传类型"),
+                ),
+                ("size", models.BigIntegerField(default=0, verbose_name="文件大小")),
+                (
+                    "uploaded_by",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="上传者",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "上传文件",
+                "verbose_name_plural": "上传文件",
+                "db_table": "uploaded_objects",
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.9 on 2026-10-18 02:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("common", "0001_uploaded_object"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ContentIndex",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="创建时间"),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="更新时间"),
+                ),
+                (
+                    "digest",
+                    models.CharField(
+                        max_length=64, unique=True, verbose_name="SHA-256"
+                    ),
+                ),
+                ("key", models.CharField(max_length=500, verbose_name="对象Key")),
+                ("url", models.CharField(max_length=500, verbose_name="访问地址")),
+                ("size", models.BigIntegerField(default=0, verbose_name="文件大小")),
+            ],
+            options={
+                "verbose_name": "文件内容索引",
+                "verbose_name_plural": "文件内容索引",
+                "db_table": "content_index",
+            },
+        ),
+    ]
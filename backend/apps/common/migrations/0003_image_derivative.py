@@ -0,0 +1,45 @@
+# Generated by Django 5.2.9 on 2026-10-18 02:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("common", "0002_content_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImageDerivative",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="创建时间"),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="更新时间"),
+                ),
+                (
+                    "original",
+                    models.CharField(max_length=500, unique=True, verbose_name="原图"),
+                ),
+                ("widths", models.JSONField(default=list, verbose_name="已生成宽度")),
+            ],
+            options={
+                "verbose_name": "图片派生尺寸",
+                "verbose_name_plural": "图片派生尺寸",
+                "db_table": "image_derivatives",
+            },
+        ),
+    ]
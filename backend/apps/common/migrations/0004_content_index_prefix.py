@@ -0,0 +1,38 @@
+# Generated by Django 5.2.9 on 2026-10-18 03:26
+
+from django.db import migrations, models
+
+
+def backfill_prefix(apps, schema_editor):
+    # 已有记录的前缀取自对象 Key 的目录部分（build_object_key 生成 "{prefix}/{uuid}.{ext}"）
+    ContentIndex = apps.get_model("common", "ContentIndex")
+    for index in ContentIndex.objects.all().only("id", "key"):
+        index.prefix = index.key.rsplit("/", 1)[0] if "/" in index.key else ""
+        index.save(update_fields=["prefix"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("common", "0003_image_derivative"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="contentindex",
+            name="prefix",
+            field=models.CharField(default="", max_length=100, verbose_name="路径前缀"),
+        ),
+        migrations.RunPython(backfill_prefix, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="contentindex",
+            name="digest",
+            field=models.CharField(max_length=64, verbose_name="SHA-256"),
+        ),
+        migrations.AddConstraint(
+            model_name="contentindex",
+            constraint=models.UniqueConstraint(
+                fields=("prefix", "digest"), name="content_index_prefix_digest_uniq"
+            ),
+        ),
+    ]
@@ -9,3 +9,68 @@ class TimeStampedModel(models.Model):
 
     class Meta:
         abstract = True
+
+
+class UploadedObject(TimeStampedModel):
+    """
+    已上传到对象存储的文件记录（直传完成回调写入）
+    """
+    key = models.CharField(max_length=500, unique=True, verbose_name="对象Key")
+    url = models.CharField(max_length=500, verbose_name="访问地址")
+    upload_type = models.CharField(max_length=32, verbose_name="上传类型")
+    size = models.BigIntegerField(default=0, verbose_name="文件大小")
+    uploaded_by = models.ForeignKey(
+        'users.User',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name="上传者"
+    )
+
+    class Meta:
+        db_table = "uploaded_objects"
+        verbose_name = "上传文件"
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return self.key
+
+
+class ContentIndex(TimeStampedModel):
+    """
+    内容寻址索引：(路径前缀, 文件 SHA-256) -> 对象 Key，同一类型的重复上传直接复用已有对象
+    不同上传类型的前缀对应不同的存储目录与访问策略，相同内容不跨类型复用
+    """
+    prefix = models.CharField(max_length=100, default="", verbose_name="路径前缀")
+    digest = models.CharField(max_length=64, verbose_name="SHA-256")
+    key = models.CharField(max_length=500, verbose_name="对象Key")
+    url = models.CharField(max_length=500, verbose_name="访问地址")
+    size = models.BigIntegerField(default=0, verbose_name="文件大小")
+
+    class Meta:
+        db_table = "content_index"
+        verbose_name = "文件内容索引"
+        verbose_name_plural = verbose_name
+        constraints = [
+            models.UniqueConstraint(fields=['prefix', 'digest'], name='content_index_prefix_digest_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.prefix}:{self.digest}"
+
+
+class ImageDerivative(TimeStampedModel):
+    """
+    图片派生尺寸记录：原图（本地路径或对象存储 URL）-> 已生成的宽度列表
+    """
+    original = models.CharField(max_length=500, unique=True, verbose_name="原图")
+    widths = models.JSONField(default=list, verbose_name="已生成宽度")
+
+    class Meta:
+        db_table = "image_derivatives"
+        verbose_name = "图片派生尺寸"
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return self.original
@@ -0,0 +1,138 @@
+import base64
+import json
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ParseError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+
+class KeysetPagination(BasePagination):
+    """
+    键集（游标）分页
+    按 ordering 字段的最后一行取值定位下一页，不执行 COUNT 与 OFFSET，
+    深页与首页开销一致。视图可通过 keyset_ordering 覆盖默认排序，
+    排序字段最后一项必须唯一（通常为 id）。
+    游标只对应固定排序，携带 ordering / search 参数时返回 400，
+    不会静默丢弃请求的排序或相关度排序。
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering = ('sort_order', '-created_at', '-id')
+    invalid_cursor_message = '无效的游标'
+    conflicting_params = (api_settings.ORDERING_PARAM, api_settings.SEARCH_PARAM)
+    conflicting_params_message = '游标分页不支持 {params} 参数'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        conflicts = [name for name in self.conflicting_params if request.query_params.get(name)]
+        if conflicts:
+            raise ParseError(self.conflicting_params_message.format(params='、'.join(conflicts)))
+
+        self.page_size = self.get_page_size(request)
+        self.ordering = getattr(view, 'keyset_ordering', self.ordering)
+        self.model = queryset.model
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self._after(position))
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.next_cursor = self.encode_cursor(rows[-1]) if self.has_more else None
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+            if page_size > 0:
+                return min(page_size, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+
+    def get_paginated_response(self, data):
+        return Response({
+            'results': data,
+            'next_cursor': self.next_cursor,
+            'has_more': self.has_more,
+        })
+
+    def get_pagination_meta(self):
+        return {
+            'total': None,  # 键集分页不统计总数
+            'page_size': self.page_size,
+            'next_cursor': self.next_cursor,
+            'has_more': self.has_more,
+        }
+
+    def _field_names(self):
+        return [field.lstrip('-') for field in self.ordering]
+
+    def encode_cursor(self, instance):
+        values = []
+        for name in self._field_names():
+            value = getattr(instance, name)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            names = self._field_names()
+            if not isinstance(values, list) or len(values) != len(names):
+                raise ValueError(encoded)
+            return [
+                self.model._meta.get_field(name).to_python(value)
+                for name, value in zip(names, values)
+            ]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def _after(self, position):
+        """
+        构造“排在 position 之后”的条件：
+        (a > x) OR (a = x AND b < y) OR (a = x AND b = y AND c < z) ...
+        """
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+
+class CatalogPagination(PageNumberPagination):
+    """
+    默认页码分页；请求携带 cursor 参数（首页可传空值）时切换为键集分页
+    """
+    keyset_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.keyset_class.cursor_query_param in request.query_params:
+            self.keyset = self.keyset_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_pagination_meta(self):
+        if self.keyset is not None:
+            return self.keyset.get_pagination_meta()
+        return {
+            'total': self.page.paginator.count,
+            'page': self.page.number,
+            'page_size': self.page.paginator.per_page,
+        }
@@ -1,12 +1,60 @@
+import io
 import os
 import uuid
+import hashlib
+import time
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from qcloud_cos import CosConfig
 from qcloud_cos import CosS3Client
+from qcloud_cos.cos_exception import CosServiceError
 from django.conf import settings
+from apps.common.models import ContentIndex
+from .registry import LazyService
+from .cos_local import LocalCosClient
 
 logger = logging.getLogger('apps.common')
 
+MB = 1024 * 1024
+PART_UPLOAD_RETRIES = 3
+
+
+# 上传类型 -> 对象路径前缀，服务端中转上传与直传共用
+UPLOAD_PREFIX_MAP = {
+    'avatar': 'avatars',
+    'course_cover': 'courses/covers',
+    'category_cover': 'categories/covers',
+    'material': 'materials',
+    'document': 'documents',
+    'image': 'images',
+    'file': 'files'
+}
+
+
+def build_object_key(path_prefix, filename):
+    """按原文件扩展名生成随机对象 Key"""
+    ext = filename.split('.')[-1] if '.' in filename else 'tmp'
+    return f"{path_prefix}/{uuid.uuid4().hex}.{ext}"
+
+
+def sha256_file(file_obj):
+    """分块计算文件 SHA-256，完成后将读取位置复位"""
+    hasher = hashlib.sha256()
+    file_obj.seek(0)
+    for chunk in iter(lambda: file_obj.read(MB), b''):
+        hasher.update(chunk)
+    file_obj.seek(0)
+    return hasher.hexdigest()
+
+
+def _int_env(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        logger.error(f"Invalid {name}")
+        raise ValueError(f"{name} must be an integer")
+
 class CosService:
     def __init__(self):
         self.secret_id = os.environ.get("TENCENT_SECRET_ID")
@@ -14,40 +62,178 @@ class CosService:
         self.region = os.environ.get("TENCENT_COS_REGION")
         self.bucket = os.environ.get("TENCENT_COS_BUCKET")
         self.scheme = 'https'
-        
+        self.local_dir = os.environ.get("TENCENT_COS_LOCAL_DIR", "")
+
+        # 超过阈值的文件走分片上传，分片由有界线程池并行上传
+        self.multipart_threshold = _int_env("TENCENT_COS_MULTIPART_THRESHOLD", 20 * MB)
+        self.part_size = _int_env("TENCENT_COS_PART_SIZE", 8 * MB)
+        self.upload_workers = _int_env("TENCENT_COS_UPLOAD_WORKERS", 4)
+        if self.part_size < MB or self.upload_workers < 1:
+            logger.error("Invalid COS multipart configuration")
+            raise ValueError("TENCENT_COS_PART_SIZE must be at least 1MB and TENCENT_COS_UPLOAD_WORKERS at least 1")
+
+        if self.local_dir:
+            # 本地替身存储，无需云端凭证
+            self.bucket = self.bucket or "local"
+            self.client = LocalCosClient(self.local_dir)
+            return
+
         if not all([self.secret_id, self.secret_key, self.region, self.bucket]):
             logger.error("COS configuration missing")
             raise ValueError("COS configuration missing")
 
+        pool_size = _int_env("TENCENT_COS_POOL_SIZE", 10)
+
+        # 客户端在进程内复用（见 get_cos_service），保持长连接以避免每次上传重新握手
         self.config = CosConfig(
             Region=self.region, 
             SecretId=self.secret_id, 
             SecretKey=self.secret_key, 
-            Scheme=self.scheme
+            Scheme=self.scheme,
+            KeepAlive=True,
+            PoolConnections=pool_size,
+            PoolMaxSize=pool_size
         )
         self.client = CosS3Client(self.config)
 
-    def upload_file(self, file_obj, path_prefix="uploads"):
+    def get_url(self, key):
+        if self.local_dir:
+            return f"{settings.MEDIA_URL}{key}"
+        return f"{self.scheme}://{self.bucket}.cos.{self.region}.myqcloud.com/{key}"
+
+    def upload_file(self, file_obj, path_prefix="uploads", digest=None):
         """
         上传文件到 COS
         :param file_obj: 文件对象 (InMemoryUploadedFile)
         :param path_prefix: 路径前缀
+        :param digest: 文件 SHA-256（上传时已计算则传入，否则在此读取计算）
         :return: 完整 URL
         """
         try:
-            ext = file_obj.name.split('.')[-1] if '.' in file_obj.name else 'tmp'
-            filename = f"{uuid.uuid4().hex}.{ext}"
-            key = f"{path_prefix}/{filename}"
+            # 同一前缀下内容相同的文件直接复用已有对象，不再重复上传
+            digest = digest or sha256_file(file_obj)
+            existing = ContentIndex.objects.filter(prefix=path_prefix, digest=digest).values_list('url', flat=True).first()
+            if existing:
+                return existing
+
+            key = build_object_key(path_prefix, file_obj.name)
             
-            response = self.client.upload_file_from_buffer(
-                Bucket=self.bucket,
-                Body=file_obj,
-                Key=key
-            )
+            size = getattr(file_obj, 'size', None)
+            if size is not None and size > self.multipart_threshold:
+                self.upload_multipart(file_obj, key)
+            else:
+                self.client.upload_file_from_buffer(
+                    Bucket=self.bucket,
+                    Body=file_obj,
+                    Key=key
+                )
             
-            # 构建 URL
-            url = f"{self.scheme}://{self.bucket}.cos.{self.region}.myqcloud.com/{key}"
-            return url
+            url = self.get_url(key)
+            # 并发上传同一内容时以先写入的记录为准
+            index, _ = ContentIndex.objects.get_or_create(
+                prefix=path_prefix,
+                digest=digest,
+                defaults={"key": key, "url": url, "size": size or 0}
+            )
+            return index.url
         except Exception as e:
             logger.error(f"COS upload failed: {str(e)}")
             raise e
+
+    def put_bytes(self, key, data):
+        """写入小对象（如派生图）到指定 Key"""
+        self.client.upload_file_from_buffer(Bucket=self.bucket, Body=io.BytesIO(data), Key=key)
+
+    def get_bytes(self, key):
+        """读取小对象（如待生成派生图的原图）内容"""
+        response = self.client.get_object(Bucket=self.bucket, Key=key)
+        return response['Body'].get_raw_stream().read()
+
+    def key_from_url(self, url):
+        """get_url 的逆运算，不属于本存储的 URL 返回 None"""
+        prefix = self.get_url("")
+        return url[len(prefix):] if url.startswith(prefix) else None
+
+    def presign_upload(self, key, expires=600):
+        """生成浏览器直传用的预签名 PUT URL"""
+        return self.client.get_presigned_url(Bucket=self.bucket, Key=key, Method='PUT', Expired=expires)
+
+    def head(self, key):
+        """返回对象元信息，对象不存在时返回 None"""
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)
+        except CosServiceError as e:
+            if e.get_status_code() == 404:
+                return None
+            raise
+
+    def upload_multipart(self, file_obj, key):
+        """
+        分片上传：按 part_size 流式读取文件，同时在途的分片不超过 2 * upload_workers，
+        内存占用与文件大小无关。任一分片重试耗尽后中止整个上传。
+        """
+        upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=key)["UploadId"]
+        slots = threading.BoundedSemaphore(self.upload_workers * 2)
+        failed = threading.Event()
+
+        def on_done(future):
+            if future.exception() is not None:
+                failed.set()
+            slots.release()
+
+        try:
+            futures = []
+            with ThreadPoolExecutor(max_workers=self.upload_workers) as pool:
+                for number, chunk in enumerate(self._read_parts(file_obj), start=1):
+                    slots.acquire()
+                    if failed.is_set():
+                        slots.release()
+                        break
+                    future = pool.submit(self._upload_part, key, upload_id, number, chunk)
+                    future.add_done_callback(on_done)
+                    futures.append(future)
+            parts = [future.result() for future in futures]
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={"Part": parts}
+            )
+        except Exception:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            raise
+
+    def _read_parts(self, file_obj):
+        # 逐段读取；UploadedFile.chunks() 对内存文件会忽略 chunk_size 一次性返回全部内容
+        if hasattr(file_obj, 'seek'):
+            file_obj.seek(0)
+        while True:
+            chunk = file_obj.read(self.part_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def _upload_part(self, key, upload_id, number, body):
+        for attempt in range(1, PART_UPLOAD_RETRIES + 1):
+            try:
+                response = self.client.upload_part(
+                    Bucket=self.bucket,
+                    Key=key,
+                    Body=body,
+                    PartNumber=number,
+                    UploadId=upload_id
+                )
+                return {"PartNumber": number, "ETag": response["ETag"]}
+            except Exception as e:
+                if attempt == PART_UPLOAD_RETRIES:
+                    raise
+                logger.warning(f"COS part {number} upload failed (attempt {attempt}): {str(e)}")
+                time.sleep(0.5 * 2 ** (attempt - 1))
+
+
+cos_service = LazyService(CosService)
+
+
+def get_cos_service():
+    """返回进程内共享的 CosService 实例"""
+    return cos_service.get()
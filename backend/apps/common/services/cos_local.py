@@ -0,0 +1,92 @@
+import io
+import os
+import shutil
+import threading
+import uuid
+from pathlib import Path
+from qcloud_cos.cos_exception import CosServiceError
+
+
+class LocalStreamBody:
+    """对应 SDK 的 StreamBody，只实现 get_raw_stream"""
+    def __init__(self, path):
+        self.path = path
+
+    def get_raw_stream(self):
+        with open(self.path, "rb") as f:
+            return io.BytesIO(f.read())
+
+
+class LocalCosClient:
+    """
+    本地替身存储，实现 CosService 用到的 CosS3Client 接口子集。
+    设置 TENCENT_COS_LOCAL_DIR 后启用，用于离线开发与测试，对象写入 <root>/<key>。
+    """
+    def __init__(self, root):
+        self.root = root
+        self.uploads = {}
+        self._lock = threading.Lock()
+
+    def _path(self, bucket, key):
+        path = os.path.normpath(os.path.join(self.root, key))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise ValueError(f"Invalid key: {key}")
+        return path
+
+    def _write(self, path, body):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            if isinstance(body, (bytes, bytearray)):
+                f.write(body)
+            else:
+                shutil.copyfileobj(body, f)
+
+    def upload_file_from_buffer(self, Bucket, Key, Body, **kwargs):
+        self._write(self._path(Bucket, Key), Body)
+        return {"ETag": f'"{uuid.uuid4().hex}"'}
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self.uploads[upload_id] = {"bucket": Bucket, "key": Key}
+        return {"Bucket": Bucket, "Key": Key, "UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, Body, PartNumber, UploadId, **kwargs):
+        if UploadId not in self.uploads:
+            raise ValueError(f"No such upload: {UploadId}")
+        etag = uuid.uuid4().hex
+        self._write(os.path.join(self.root, ".multipart", UploadId, f"{PartNumber:05d}-{etag}"), Body)
+        return {"ETag": f'"{etag}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        part_dir = os.path.join(self.root, ".multipart", UploadId)
+        path = self._path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as out:
+            for part in sorted(MultipartUpload["Part"], key=lambda p: p["PartNumber"]):
+                etag = part["ETag"].strip('"')
+                with open(os.path.join(part_dir, f"{part['PartNumber']:05d}-{etag}"), "rb") as f:
+                    shutil.copyfileobj(f, out)
+        self.abort_multipart_upload(Bucket, Key, UploadId)
+        return {"Bucket": Bucket, "Key": Key}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        with self._lock:
+            self.uploads.pop(UploadId, None)
+        shutil.rmtree(os.path.join(self.root, ".multipart", UploadId), ignore_errors=True)
+
+    def get_presigned_url(self, Bucket, Key, Method, Expired=300, **kwargs):
+        # 本地存储没有签名机制，直接返回目标文件路径
+        return Path(self._path(Bucket, Key)).as_uri()
+
+    def head_object(self, Bucket, Key, **kwargs):
+        path = self._path(Bucket, Key)
+        if not os.path.exists(path):
+            raise CosServiceError("HEAD", {"code": "NoSuchKey", "message": "Not Found"}, 404)
+        return {"Content-Length": str(os.path.getsize(path))}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        path = self._path(Bucket, Key)
+        if not os.path.exists(path):
+            raise CosServiceError("GET", {"code": "NoSuchKey", "message": "Not Found"}, 404)
+        return {"Body": LocalStreamBody(path), "Content-Length": str(os.path.getsize(path))}
@@ -0,0 +1,29 @@
+import threading
+
+
+class LazyService:
+    """
+    进程级单例：首次使用时创建服务实例，之后在同一进程内复用。
+    配置校验在创建时完成，校验失败不缓存，下次调用会重新尝试。
+    set() / reset() 供测试替换或重建实例。
+    """
+    def __init__(self, factory):
+        self.factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self.factory()
+                instance = self._instance
+        return instance
+
+    def set(self, instance):
+        with self._lock:
+            self._instance = instance
+
+    def reset(self):
+        self.set(None)
@@ -1,4 +1,5 @@
 import os
+import json
 import time
 import random
 import base64
@@ -6,11 +7,70 @@ import hmac
 import hashlib
 import logging
 import string
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from urllib.parse import urlparse
 import jwt
+import requests
 from django.conf import settings
+from .registry import LazyService
 
 logger = logging.getLogger('apps.common')
 
+PLAY_SIGNATURE_TTL = 7200  # 2小时有效期
+VOD_API_VERSION = "2018-07-17"
+MEDIA_INFO_BATCH_SIZE = 20  # DescribeMediaInfos 单次最多 20 个 FileId
+
+
+class PlaySignatureCache:
+    """
+    进程内播放签名缓存，按 (file_id, 权益等级[, 用户]) 复用签名直到过期前 margin 秒。
+    超出容量时淘汰最久未使用的条目，并记录命中/未命中次数。
+    """
+    def __init__(self, max_entries=1024, margin=600):
+        self.max_entries = max_entries
+        self.margin = margin
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry["psign_expire"] - self.margin <= time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+play_signature_cache = PlaySignatureCache(
+    max_entries=int(os.environ.get("TENCENT_PSIGN_CACHE_SIZE", "1024")),
+    margin=int(os.environ.get("TENCENT_PSIGN_REUSE_MARGIN", "600")),
+)
+
 class VodService:
     def __init__(self):
         self.secret_id = os.environ.get("TENCENT_SECRET_ID")
@@ -25,7 +85,11 @@ class VodService:
         self.class_id = os.environ.get("TENCENT_CLASS_ID", "")
         
         # Play config defaults
-        self.rlimit = int(os.environ.get("TENCENT_RLIMIT", "3"))
+        try:
+            self.rlimit = int(os.environ.get("TENCENT_RLIMIT", "3"))
+        except ValueError:
+            logger.error("Invalid TENCENT_RLIMIT")
+            raise ValueError("TENCENT_RLIMIT must be an integer")
         self.audio_video_type = os.environ.get("TENCENT_AUDIO_VIDEO_TYPE", "Original")
         # private_encryption_definition should be int if present
         self.private_encryption_definition = os.environ.get("TENCENT_PRIVATE_ENCRYPTION_DEFINITION") 
@@ -34,6 +98,92 @@ class VodService:
             logger.error("VOD configuration missing")
             raise ValueError("VOD configuration missing")
 
+        if not str(self.sub_app_id).isdigit():
+            logger.error(f"Invalid VOD app id: {self.sub_app_id}")
+            raise ValueError("TENCENT_VOD_SUB_APP_ID must be numeric")
+
+        # 云 API 地址可指向本地替身服务（见 vod_fake.FakeVodServer）
+        self.api_endpoint = os.environ.get("TENCENT_VOD_ENDPOINT", "https://vod.tencentcloudapi.com")
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        """进程内复用的 HTTP 会话，保持长连接"""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self._session = session
+        return self._session
+
+    def call_api(self, action, params):
+        """
+        调用 VOD 云 API（TC3-HMAC-SHA256 签名）
+        参考: https://cloud.tencent.com/document/api/266/31756
+        """
+        host = urlparse(self.api_endpoint).netloc
+        timestamp = int(time.time())
+        date = datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime("%Y-%m-%d")
+        payload = json.dumps(params)
+        content_type = "application/json; charset=utf-8"
+
+        signed_headers = "content-type;host"
+        canonical_request = "\n".join([
+            "POST", "/", "",
+            f"content-type:{content_type}\nhost:{host}\n",
+            signed_headers,
+            hashlib.sha256(payload.encode("utf-8")).hexdigest(),
+        ])
+        credential_scope = f"{date}/vod/tc3_request"
+        string_to_sign = "\n".join([
+            "TC3-HMAC-SHA256", str(timestamp), credential_scope,
+            hashlib.sha256(canonical_request.encode("utf-8")).hexdigest(),
+        ])
+        key = ("TC3" + self.secret_key).encode("utf-8")
+        for part in (date, "vod", "tc3_request"):
+            key = hmac.new(key, part.encode("utf-8"), hashlib.sha256).digest()
+        signature = hmac.new(key, string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+
+        response = self.session.post(self.api_endpoint, data=payload, timeout=10, headers={
+            "Authorization": f"TC3-HMAC-SHA256 Credential={self.secret_id}/{credential_scope}, SignedHeaders={signed_headers}, Signature={signature}",
+            "Content-Type": content_type,
+            "Host": host,
+            "X-TC-Action": action,
+            "X-TC-Timestamp": str(timestamp),
+            "X-TC-Version": VOD_API_VERSION,
+        })
+        response.raise_for_status()
+        body = response.json()["Response"]
+        if "Error" in body:
+            raise ValueError(f"VOD {action} failed: {body['Error'].get('Code')} {body['Error'].get('Message')}")
+        return body
+
+    def describe_media_infos(self, file_ids):
+        """
+        批量查询媒体信息（最多 MEDIA_INFO_BATCH_SIZE 个）
+        :return: {file_id: {"duration": 秒, "width", "height", "cover_url"}}，不存在的 FileId 不返回
+        """
+        body = self.call_api("DescribeMediaInfos", {
+            "FileIds": list(file_ids),
+            "Filters": ["basicInfo", "metaData"],
+            "SubAppId": int(self.sub_app_id),
+        })
+        result = {}
+        for info in body.get("MediaInfoSet") or []:
+            meta = info.get("MetaData") or {}
+            basic = info.get("BasicInfo") or {}
+            result[info["FileId"]] = {
+                "duration": meta.get("Duration") or 0,
+                "width": meta.get("Width") or 0,
+                "height": meta.get("Height") or 0,
+                "cover_url": basic.get("CoverUrl") or "",
+            }
+        return result
+
     def get_upload_signature(self):
         """
         生成 VOD 上传签名 (Client Upload Signature)
@@ -84,9 +234,11 @@ class VodService:
         characters = string.ascii_lowercase + string.digits
         return ''.join(random.choices(characters, k=length))
 
-    def get_play_signature(self, file_id):
+    def get_play_signature(self, file_id, tier=0, user_id=None):
         """
         生成视频播放签名 (Video Play Signature)
+        同一视频、同一权益等级的签名在过期前 margin 秒内复用，见 PlaySignatureCache；
+        设置了 rlimit 时腾讯云按签名限制播放 IP 数，签名只在同一用户内复用，未知用户不缓存
         """
         if not file_id:
             raise ValueError("file_id is required")
@@ -95,8 +247,17 @@ class VodService:
              logger.error("TENCENT_PLAY_KEY missing")
              raise ValueError("TENCENT_PLAY_KEY missing")
 
+        key = None
+        if not self.rlimit:
+            key = (self.sub_app_id, file_id, tier)
+        elif user_id is not None:
+            key = (self.sub_app_id, file_id, tier, user_id)
+        cached = play_signature_cache.get(key) if key is not None else None
+        if cached is not None:
+            return dict(cached)
+
         current_time = int(time.time())
-        psign_expire = current_time + 7200  # 2小时有效期
+        psign_expire = current_time + PLAY_SIGNATURE_TTL
         url_time_expire = hex(psign_expire)[2:]
         random_str = self.generate_random_str()
 
@@ -126,17 +287,26 @@ class VodService:
             "contentInfo": content_info
         }
 
-        print(f"DEBUG VOD Payload: {payload}")
-
         signature = jwt.encode(
             payload,
             self.play_key,
             algorithm='HS256'
         )
 
-        return {
+        result = {
             "signature": signature,
             "psign_expire": psign_expire,
             "app_id": self.sub_app_id,
             "license_url": self.license_url
         }
+        if key is not None:
+            play_signature_cache.set(key, result)
+        return dict(result)
+
+
+vod_service = LazyService(VodService)
+
+
+def get_vod_service():
+    """返回进程内共享的 VodService 实例"""
+    return vod_service.get()
@@ -0,0 +1,94 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeVodServer:
+    """
+    本地 VOD 云 API 替身，仅实现 DescribeMediaInfos，用于离线开发与测试。
+    用法:
+        with FakeVodServer({"file-1": {"Duration": 530.2, "Width": 1920, "Height": 1080}}) as server:
+            os.environ["TENCENT_VOD_ENDPOINT"] = server.endpoint
+    同时统计请求数与最大并发数，便于验证批量与并发上限。
+    """
+    def __init__(self, media=None, latency=0.0):
+        self.media = media or {}
+        self.latency = latency
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = None
+
+    @property
+    def endpoint(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                with fake._lock:
+                    fake.requests += 1
+                    fake.in_flight += 1
+                    fake.max_in_flight = max(fake.max_in_flight, fake.in_flight)
+                try:
+                    params = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                    if fake.latency:
+                        time.sleep(fake.latency)
+                    body = fake.handle(self.headers.get("X-TC-Action"), params, self.headers.get("Authorization", ""))
+                finally:
+                    with fake._lock:
+                        fake.in_flight -= 1
+                data = json.dumps({"Response": body}).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def handle(self, action, params, authorization):
+        if not authorization.startswith("TC3-HMAC-SHA256 "):
+            return {"Error": {"Code": "AuthFailure.SignatureFailure", "Message": "missing signature"}}
+        if action != "DescribeMediaInfos":
+            return {"Error": {"Code": "InvalidAction", "Message": action}}
+        media_set, missing = [], []
+        for file_id in params.get("FileIds", []):
+            media = self.media.get(file_id)
+            if media is None:
+                missing.append(file_id)
+                continue
+            media_set.append({
+                "FileId": file_id,
+                "BasicInfo": {"CoverUrl": media.get("CoverUrl", "")},
+                "MetaData": {
+                    "Duration": media.get("Duration", 0),
+                    "Width": media.get("Width", 0),
+                    "Height": media.get("Height", 0),
+                },
+            })
+        return {"MediaInfoSet": media_set, "NotExistFileIdSet": missing, "RequestId": "fake"}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
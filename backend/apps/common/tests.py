@@ -1,8 +1,21 @@
 from django.contrib.auth import get_user_model
 from rest_framework.test import APITestCase
 from rest_framework import status
+import io
+import os
+import importlib.util
+from unittest import skipUnless
+import hashlib
+import tempfile
+import shutil
 from unittest.mock import patch
+from .services.cos import CosService, cos_service
+from .models import UploadedObject, ContentIndex, ImageDerivative
+from .images import generate_derivatives, best_variant
+from .services.vod import VodService, get_vod_service, play_signature_cache, vod_service
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from apps.courses.models import CourseCategory, Course, CourseChapter, CourseLesson
 
 User = get_user_model()
 
@@ -13,7 +26,7 @@ class CommonServiceTests(APITestCase):
             password='userpassword'
         )
 
-    @patch('apps.common.views.VodService')
+    @patch('apps.common.views.get_vod_service')
     def test_vod_signature(self, mock_vod_service):
         """测试 VOD 签名生成"""
         # Mock return value
@@ -26,7 +39,7 @@ class CommonServiceTests(APITestCase):
         self.assertTrue(response.data['success'])
         self.assertEqual(response.data['data']['signature'], "mock_signature")
 
-    @patch('apps.common.views.CosService')
+    @patch('apps.common.views.get_cos_service')
     def test_image_upload(self, mock_cos_service):
         """测试图片上传"""
         mock_instance = mock_cos_service.return_value
@@ -40,3 +53,294 @@ class CommonServiceTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertTrue(response.data['success'])
         self.assertEqual(response.data['data']['url'], "http://mock-cos-url.com/image.jpg")
+
+
+VOD_ENV = {
+    "TENCENT_SECRET_ID": "id",
+    "TENCENT_SECRET_KEY": "key",
+    "TENCENT_VOD_SUB_APP_ID": "1500000000",
+    "TENCENT_PLAY_KEY": "play-key",
+}
+
+
+@patch.dict('os.environ', VOD_ENV)
+class PlaySignatureCacheTests(APITestCase):
+    def setUp(self):
+        play_signature_cache.clear()
+
+    def test_reuse_until_margin(self):
+        """测试同一视频与等级复用签名，临近过期后重新签发"""
+        first = VodService().get_play_signature("f1", tier=1, user_id=1)
+        self.assertEqual(VodService().get_play_signature("f1", tier=1, user_id=1), first)
+        self.assertNotEqual(VodService().get_play_signature("f1", tier=2, user_id=1)["signature"], first["signature"])
+        self.assertEqual(play_signature_cache.stats(), {"hits": 1, "misses": 2, "size": 2})
+
+        with patch('apps.common.services.vod.time.time', return_value=first["psign_expire"] - play_signature_cache.margin):
+            self.assertIsNone(play_signature_cache.get(("1500000000", "f1", 1, 1)))
+
+    def test_rlimit_scoped_per_user(self):
+        """测试设置 rlimit 时签名按用户区分，关闭后所有用户共享"""
+        first = VodService().get_play_signature("f1", user_id=1)
+        second = VodService().get_play_signature("f1", user_id=2)
+        self.assertNotEqual(first["signature"], second["signature"])
+        self.assertEqual(VodService().get_play_signature("f1", user_id=1), first)
+        # 未知用户无法区分，不复用签名
+        self.assertNotEqual(VodService().get_play_signature("f1")["signature"], VodService().get_play_signature("f1")["signature"])
+
+        with patch.dict('os.environ', {"TENCENT_RLIMIT": "0"}):
+            shared = VodService().get_play_signature("f1", user_id=1)
+            self.assertEqual(VodService().get_play_signature("f1", user_id=2), shared)
+
+    def test_lru_eviction(self):
+        """测试超出容量时淘汰最久未使用的签名"""
+        with patch.object(play_signature_cache, 'max_entries', 2):
+            service = VodService()
+            service.get_play_signature("a", user_id=1)
+            service.get_play_signature("b", user_id=1)
+            service.get_play_signature("a", user_id=1)
+            service.get_play_signature("c", user_id=1)
+            self.assertEqual(play_signature_cache.stats()["size"], 2)
+            self.assertIsNone(play_signature_cache.get(("1500000000", "b", 0, 1)))
+            self.assertIsNotNone(play_signature_cache.get(("1500000000", "a", 0, 1)))
+
+
+@patch.dict('os.environ', VOD_ENV)
+class BatchPlaySignatureTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        play_signature_cache.clear()
+        vod_service.reset()
+        self.addCleanup(vod_service.reset)
+        self.user = User.objects.create_user(phone='18888888888', password='password123')
+        category = CourseCategory.objects.create(name="分类")
+        self.course = Course.objects.create(title="课程", category=category, instructor="T", access_level=0)
+        self.chapters = [CourseChapter.objects.create(course=self.course, title=f"章{i}") for i in range(2)]
+        for i, chapter in enumerate(self.chapters):
+            CourseLesson.objects.create(chapter=chapter, course=self.course, title=f"课{i}", video_file_id=f"f{i}")
+        self.client.force_authenticate(user=self.user)
+
+    def test_sign_course_and_chapter(self):
+        """测试一次请求为整门课程或单个章节的课时签名"""
+        response = self.client.get('/api/common/vod/signature/', {"type": "play", "course_id": self.course.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual({r['file_id'] for r in response.data['data']['results']}, {"f0", "f1"})
+
+        response = self.client.get('/api/common/vod/signature/', {
+            "type": "play", "course_id": self.course.id, "chapter_id": self.chapters[1].id
+        })
+        self.assertEqual([r['file_id'] for r in response.data['data']['results']], ["f1"])
+        self.assertEqual(play_signature_cache.stats()["hits"], 1)
+
+    def test_entitlement_checked_once(self):
+        """测试课程等级不足时整批拒绝"""
+        self.course.access_level = 2
+        self.course.save()
+        response = self.client.get('/api/common/vod/signature/', {"type": "play", "course_id": self.course.id})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+@patch.dict('os.environ', VOD_ENV)
+class ServiceSingletonTests(APITestCase):
+    def setUp(self):
+        vod_service.reset()
+        self.addCleanup(vod_service.reset)
+
+    def test_created_once_and_swappable(self):
+        """测试服务实例进程内复用，并可通过 set/reset 替换或重建"""
+        service = get_vod_service()
+        self.assertIs(get_vod_service(), service)
+
+        fake = object()
+        vod_service.set(fake)
+        self.assertIs(get_vod_service(), fake)
+
+        vod_service.reset()
+        self.assertIsNot(get_vod_service(), service)
+
+    def test_invalid_config_not_cached(self):
+        """测试配置校验失败时不缓存实例"""
+        with patch.dict('os.environ', {"TENCENT_VOD_SUB_APP_ID": "app"}):
+            with self.assertRaises(ValueError):
+                get_vod_service()
+        self.assertIsInstance(get_vod_service(), VodService)
+
+
+class LocalCosTestMixin:
+    """使用临时目录作为本地 COS 存储，测试结束后清理目录并重置服务实例"""
+    cos_env = {}
+
+    def setUp(self):
+        super().setUp()
+        self.local_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.local_dir, ignore_errors=True)
+        env = patch.dict('os.environ', {"TENCENT_COS_LOCAL_DIR": self.local_dir, **self.cos_env})
+        env.start()
+        self.addCleanup(env.stop)
+        cos_service.reset()
+        self.addCleanup(cos_service.reset)
+
+
+class MultipartUploadTests(LocalCosTestMixin, APITestCase):
+    cos_env = {
+        "TENCENT_COS_MULTIPART_THRESHOLD": str(1024 * 1024),
+        "TENCENT_COS_PART_SIZE": str(1024 * 1024),
+        "TENCENT_COS_UPLOAD_WORKERS": "2",
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.content = os.urandom(1024 * 1024 * 5 // 2)
+
+    def test_large_file_uploaded_in_parts(self):
+        """测试超过阈值的文件分片上传并在本地存储中完整合并"""
+        service = CosService()
+        with patch.object(service.client, 'upload_part', wraps=service.client.upload_part) as upload_part:
+            url = service.upload_file(SimpleUploadedFile("big.pdf", self.content), path_prefix="materials")
+        self.assertEqual(upload_part.call_count, 3)
+        key = url[len('/media/'):]
+        with open(os.path.join(self.local_dir, key), 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertFalse(os.listdir(os.path.join(self.local_dir, '.multipart')))
+
+    @patch('apps.common.services.cos.time.sleep')
+    def test_part_retry_and_abort(self, _sleep):
+        """测试分片失败后重试，重试耗尽时中止上传"""
+        service = CosService()
+        upload_part = service.client.upload_part
+        calls = {"count": 0}
+
+        def flaky(**kwargs):
+            calls["count"] += 1
+            if calls["count"] == 1:
+                raise IOError("connection reset")
+            return upload_part(**kwargs)
+
+        with patch.object(service.client, 'upload_part', side_effect=flaky):
+            service.upload_file(SimpleUploadedFile("big.pdf", self.content))
+
+        with patch.object(service.client, 'upload_part', side_effect=IOError("down")):
+            with self.assertRaises(IOError):
+                service.upload_file(SimpleUploadedFile("big.pdf", os.urandom(len(self.content))))
+        self.assertEqual(service.client.uploads, {})
+
+
+class DirectUploadTests(LocalCosTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(phone='18888888888', password='password123')
+        self.client.force_authenticate(user=self.user)
+
+    def test_presign_and_complete(self):
+        """测试直传预签名按上传类型生成路径，完成回调记录对象"""
+        response = self.client.post('/api/common/upload/presign/', {"type": "course_cover", "filename": "a.png"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.data['data']
+        self.assertTrue(data['key'].startswith('courses/covers/') and data['key'].endswith('.png'))
+
+        complete = {"upload_token": data['upload_token']}
+        response = self.client.post('/api/common/upload/complete/', complete, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        # 模拟浏览器直传到存储
+        path = os.path.join(self.local_dir, data['key'])
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(b'png')
+
+        response = self.client.post('/api/common/upload/complete/', complete, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        obj = UploadedObject.objects.get(key=data['key'])
+        self.assertEqual((obj.size, obj.upload_type, obj.uploaded_by), (3, "course_cover", self.user))
+        self.assertEqual(response.data['data']['url'], obj.url)
+
+    def test_complete_rejects_foreign_token(self):
+        """测试不能使用他人的上传凭证"""
+        response = self.client.post('/api/common/upload/presign/', {"filename": "a.png"}, format='json')
+        other = User.objects.create_user(phone='17777777777', password='password123')
+        self.client.force_authenticate(user=other)
+        response = self.client.post('/api/common/upload/complete/', {"upload_token": response.data['data']['upload_token']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.post('/api/common/upload/complete/', {"upload_token": "bogus"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+
+class ContentDedupTests(LocalCosTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser(phone='13800138000', password='password123')
+        self.client.force_authenticate(user=self.admin)
+
+    def test_repeat_upload_reuses_object(self):
+        """测试同一类型相同内容重复上传返回已有地址且不再写入存储，不同类型不复用"""
+        first = self.client.post('/api/common/upload/file/?type=material', {'file': SimpleUploadedFile("a.pdf", b"same")}, format='multipart')
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        with patch('apps.common.services.cos_local.LocalCosClient.upload_file_from_buffer') as upload:
+            second = self.client.post('/api/common/upload/file/?type=material', {'file': SimpleUploadedFile("b.pdf", b"same")}, format='multipart')
+        upload.assert_not_called()
+        self.assertEqual(second.data['data']['url'], first.data['data']['url'])
+
+        index = ContentIndex.objects.get()
+        self.assertEqual((index.prefix, index.digest), ("materials", hashlib.sha256(b"same").hexdigest()))
+        response = self.client.post('/api/common/upload/presign/', {"filename": "c.pdf", "sha256": index.digest, "type": "material"}, format='json')
+        self.assertEqual(response.data['data'], {"duplicate": True, "url": first.data['data']['url']})
+
+        response = self.client.post('/api/common/upload/presign/', {"filename": "c.pdf", "sha256": index.digest, "type": "document"}, format='json')
+        self.assertFalse(response.data['data']['duplicate'])
+        third = self.client.post('/api/common/upload/file/?type=document', {'file': SimpleUploadedFile("c.pdf", b"same")}, format='multipart')
+        self.assertTrue(third.data['data']['url'].startswith('/media/documents/'))
+        self.assertEqual(ContentIndex.objects.count(), 2)
+
+
+def make_png(width, height):
+    from PIL import Image
+    out = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 80, 40)).save(out, 'PNG')
+    return out.getvalue()
+
+
+class ImmediateExecutor:
+    def submit(self, fn, *args):
+        fn(*args)
+
+
+@skipUnless(importlib.util.find_spec('PIL'), "Pillow is not installed")
+class ImageDerivativeTests(LocalCosTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_generate_and_pick_best_variant(self):
+        """测试生成小于原图的派生尺寸并按请求尺寸选择"""
+        saved = {}
+        source = make_png(200, 100)
+        widths = generate_derivatives("avatars/1.png", "avatars/1.png", 'avatar', lambda name: source, saved.__setitem__)
+        self.assertEqual(widths, [64, 128])
+        self.assertEqual(set(saved), {"avatars/1@64w.webp", "avatars/1@64w.jpg", "avatars/1@128w.webp", "avatars/1@128w.jpg"})
+        self.assertEqual(best_variant("avatars/1.png", 100), "avatars/1@128w.webp")
+        self.assertEqual(best_variant("avatars/1.png", 40), "avatars/1@64w.webp")
+        self.assertEqual(best_variant("avatars/1.png", 512), "avatars/1.png")
+
+    @patch('apps.common.images._executor', ImmediateExecutor())
+    def test_cover_upload_schedules_derivatives(self):
+        """测试封面上传后在事务提交时生成派生图"""
+        admin = User.objects.create_superuser(phone='13800138000', password='password123')
+        self.client.force_authenticate(user=admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/common/upload/file/?type=course_cover', {
+                'file': SimpleUploadedFile("cover.png", make_png(800, 450), content_type="image/png")
+            }, format='multipart')
+        url = response.data['data']['url']
+        self.assertEqual(ImageDerivative.objects.get(original=url).widths, [320, 640])
+        key = url[len('/media/'):]
+        self.assertTrue(os.path.exists(os.path.join(self.local_dir, key.replace('.png', '@320w.webp'))))
+
+    def test_profile_avatar_size(self):
+        """测试用户信息按 avatar_size 返回派生头像"""
+        user = User.objects.create_user(phone='18888888888', password='password123', avatar="avatars/1_1.png")
+        ImageDerivative.objects.create(original="avatars/1_1.png", widths=[64, 128])
+        self.client.force_authenticate(user=user)
+        response = self.client.get('/api/auth/profile?avatar_size=64')
+        self.assertTrue(response.data['data']['avatar'].endswith('/media/avatars/1_1@64w.webp'))
+        response = self.client.get('/api/auth/profile')
+        self.assertTrue(response.data['data']['avatar'].endswith('/media/avatars/1_1.png'))
+
@@ -0,0 +1,46 @@
+from collections import defaultdict
+from django.core.cache import cache
+
+CATEGORY_TREE_CACHE_TIMEOUT = 60 * 60
+
+
+def category_tree_cache_key(model):
+    return f"category_tree:{model._meta.label_lower}"
+
+
+def build_category_tree(queryset):
+    """
+    一次查询取出全部分类，在内存中组装父子关系
+    :param queryset: 分类查询集（模型需有 parent 外键及 related_name='children'）
+    :return: 一级分类列表，children 已预填充，RecursiveField 序列化时不再查询
+    """
+    nodes = list(queryset)
+    children_map = defaultdict(list)
+    for node in nodes:
+        children_map[node.parent_id].append(node)
+
+    for node in nodes:
+        # 与 prefetch_related 相同的方式写入预取缓存
+        children = node.children.all()
+        children._result_cache = children_map.get(node.id, [])
+        children._prefetch_done = True
+        node._prefetched_objects_cache = {'children': children}
+
+    return children_map[None]
+
+
+def get_category_tree(queryset, serializer_class):
+    """
+    返回序列化后的分类树，结果缓存至分类发生变更
+    """
+    key = category_tree_cache_key(queryset.model)
+    data = cache.get(key)
+    if data is None:
+        roots = build_category_tree(queryset)
+        data = serializer_class(roots, many=True).data
+        cache.set(key, data, timeout=CATEGORY_TREE_CACHE_TIMEOUT)
+    return data
+
+
+def invalidate_category_tree(model):
+    cache.delete(category_tree_cache_key(model))
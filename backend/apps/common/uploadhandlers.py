@@ -0,0 +1,25 @@
+import hashlib
+from django.core.files.uploadhandler import FileUploadHandler
+
+
+class Sha256UploadHandler(FileUploadHandler):
+    """
+    在上传数据流经时计算 SHA-256，数据原样交给后续 handler 保存。
+    需放在 request.upload_handlers 最前面，结果按表单字段名存入 digests。
+    """
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.digests = {}
+        self._hasher = None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self._hasher = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self._hasher.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        self.digests[self.field_name] = self._hasher.hexdigest()
+        return None
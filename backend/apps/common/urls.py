@@ -1,7 +1,9 @@
 from django.urls import path
-from .views import FileUploadView, VodSignatureView
+from .views import FileUploadView, VodSignatureView, DirectUploadPresignView, DirectUploadCompleteView
 
 urlpatterns = [
     path('upload/file/', FileUploadView.as_view(), name='upload_file'),
+    path('upload/presign/', DirectUploadPresignView.as_view(), name='upload_presign'),
+    path('upload/complete/', DirectUploadCompleteView.as_view(), name='upload_complete'),
     path('vod/signature/', VodSignatureView.as_view(), name='vod_signature'),
 ]
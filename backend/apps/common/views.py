@@ -1,11 +1,19 @@
+import hashlib
+from django.core import signing
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.parsers import MultiPartParser, FormParser
 
 from config.response import ok, error
-from .services.vod import VodService
-from .services.cos import CosService
+from .services.vod import get_vod_service
+from .services.cos import get_cos_service, build_object_key, UPLOAD_PREFIX_MAP
+from .models import UploadedObject, ContentIndex
+from .uploadhandlers import Sha256UploadHandler
+from .images import schedule_derivatives, get_variant_widths
+from apps.membership.entitlements import get_lesson_levels, check_access
 
 class UnifiedModelViewSet(ModelViewSet):
     """
@@ -15,6 +23,11 @@ class UnifiedModelViewSet(ModelViewSet):
     def list(self, request, *args, **kwargs):
         response = super().list(request, *args, **kwargs)
         
+        # Paginators that describe their own position (e.g. keyset pagination)
+        paginator = getattr(self, 'paginator', None)
+        if paginator is not None and hasattr(paginator, 'get_pagination_meta') and isinstance(response.data, dict) and 'results' in response.data:
+            return ok(data=response.data['results'], meta={'pagination': paginator.get_pagination_meta()})
+
         # Handle paginated response
         if isinstance(response.data, dict) and 'results' in response.data and 'count' in response.data:
             data = response.data['results']
@@ -63,11 +76,48 @@ class UnifiedModelViewSet(ModelViewSet):
         return ok(message="deleted")
 
 
+class ConditionalGetMixin:
+    """
+    Conditional GET support (ETag / 304).
+    Views compute cheap validators first; a matching If-None-Match
+    returns 304 without calling render().
+    No Last-Modified: validators derived from max(updated_at) move backwards
+    when rows are deleted, so If-Modified-Since could answer 304 for stale content.
+    """
+    def conditional_response(self, request, parts, render):
+        if parts is None:
+            return render()
+
+        digest = hashlib.md5("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+        etag = quote_etag(digest)
+
+        response = get_conditional_response(request._request, etag=etag)
+        if response is None:
+            response = render()
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            response['Cache-Control'] = 'no-cache'
+        return response
+
+
+# Upload types that get resized WebP/JPEG derivatives in the background
+IMAGE_DERIVATIVE_KINDS = {
+    'avatar': 'avatar',
+    'course_cover': 'cover',
+    'category_cover': 'cover',
+    'workflow_category_cover': 'cover',
+}
+
+
 class FileUploadView(APIView):
     permission_classes = [IsAuthenticated]
     parser_classes = [MultiPartParser, FormParser]
 
     def post(self, request):
+        # Hash the upload while it streams in, before request.FILES is parsed
+        hasher = Sha256UploadHandler(request._request)
+        request._request.upload_handlers.insert(0, hasher)
+
         file_obj = request.FILES.get('file')
         if not file_obj:
             return error("VALIDATION_ERROR", "No file provided", status=400)
@@ -75,27 +125,95 @@ class FileUploadView(APIView):
         # Get upload type from query params
         upload_type = request.query_params.get('type', 'image')
         
-        # Map type to path prefix
-        prefix_map = {
-            'avatar': 'avatars',
-            'course_cover': 'courses/covers',
-            'category_cover': 'categories/covers',
-            'material': 'materials',
-            'document': 'documents',
-            'image': 'images',
-            'file': 'files'
-        }
-        
-        path_prefix = prefix_map.get(upload_type, 'uploads')
+        path_prefix = UPLOAD_PREFIX_MAP.get(upload_type, 'uploads')
         
         try:
-            service = CosService()
-            url = service.upload_file(file_obj, path_prefix=path_prefix)
+            service = get_cos_service()
+            url = service.upload_file(file_obj, path_prefix=path_prefix, digest=hasher.digests.get('file'))
+            kind = IMAGE_DERIVATIVE_KINDS.get(upload_type)
+            key = service.key_from_url(url)
+            if kind and key and not get_variant_widths(url):
+                schedule_derivatives(url, key, kind, service.get_bytes, service.put_bytes, size=file_obj.size)
             return ok({"url": url})
         except Exception as e:
             return error("SERVER_ERROR", str(e), status=500)
 
 
+DIRECT_UPLOAD_EXPIRES = 600
+DIRECT_UPLOAD_SALT = "common.direct_upload"
+
+
+class DirectUploadPresignView(APIView):
+    """
+    Direct-to-storage upload, step 1: return a presigned PUT URL.
+    The browser uploads the file itself, then calls DirectUploadCompleteView with upload_token.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        filename = request.data.get('filename')
+        if not filename:
+            return error("VALIDATION_ERROR", "filename is required", status=422)
+
+        upload_type = request.data.get('type', 'image')
+        path_prefix = UPLOAD_PREFIX_MAP.get(upload_type, 'uploads')
+
+        # Admins may pass the file's SHA-256 to reuse an existing object of the same upload type without uploading it again
+        sha256 = request.data.get('sha256')
+        if sha256 and request.user.is_staff:
+            existing = ContentIndex.objects.filter(prefix=path_prefix, digest=str(sha256).lower()).values_list('url', flat=True).first()
+            if existing:
+                return ok({"duplicate": True, "url": existing})
+
+        key = build_object_key(path_prefix, filename)
+        try:
+            put_url = get_cos_service().presign_upload(key, expires=DIRECT_UPLOAD_EXPIRES)
+        except Exception as e:
+            return error("SERVER_ERROR", str(e), status=500)
+
+        token = signing.dumps({"key": key, "type": upload_type, "user": request.user.pk}, salt=DIRECT_UPLOAD_SALT)
+        return ok({
+            "duplicate": False,
+            "key": key,
+            "method": "PUT",
+            "put_url": put_url,
+            "expires": DIRECT_UPLOAD_EXPIRES,
+            "upload_token": token,
+        })
+
+
+class DirectUploadCompleteView(APIView):
+    """Direct-to-storage upload, step 2: verify the object exists and record it."""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        try:
+            payload = signing.loads(request.data.get('upload_token') or '', salt=DIRECT_UPLOAD_SALT, max_age=DIRECT_UPLOAD_EXPIRES * 6)
+        except signing.BadSignature:
+            return error("VALIDATION_ERROR", "Invalid or expired upload_token", status=422)
+        if payload["user"] != request.user.pk:
+            return error("PERMISSION_DENIED", "upload_token belongs to another user", status=403)
+
+        try:
+            service = get_cos_service()
+            meta = service.head(payload["key"])
+        except Exception as e:
+            return error("SERVER_ERROR", str(e), status=500)
+        if meta is None:
+            return error("NOT_FOUND", "Object has not been uploaded", status=404)
+
+        obj, _ = UploadedObject.objects.get_or_create(
+            key=payload["key"],
+            defaults={
+                "url": service.get_url(payload["key"]),
+                "upload_type": payload["type"],
+                "size": int(meta.get("Content-Length") or 0),
+                "uploaded_by": request.user,
+            }
+        )
+        return ok({"url": obj.url, "key": obj.key})
+
+
 class VodSignatureView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -104,11 +222,12 @@ class VodSignatureView(APIView):
         Get VOD signatures.
         Query Params:
         - type: 'upload' (default) or 'play'
-        - file_id: required if type is 'play'
+        - file_id: required if type is 'play', unless course_id is given
+        - course_id / chapter_id: sign every lesson of a course (or one of its chapters) in one request
         """
         try:
             sig_type = request.query_params.get('type', 'upload')
-            service = VodService()
+            service = get_vod_service()
 
             if sig_type == 'upload':
                 # Only admin can upload (adjust as needed)
@@ -119,13 +238,22 @@ class VodSignatureView(APIView):
                 return ok({"signature": signature})
             
             elif sig_type == 'play':
+                if request.query_params.get('course_id'):
+                    return self.get_batch_play_signatures(request, service)
+
                 file_id = request.query_params.get('file_id')
                 if not file_id:
                     return error("VALIDATION_ERROR", "file_id is required for play signature", status=422)
                 
-                # TODO: Add logic to check if user has access to this video
-                
-                result = service.get_play_signature(file_id)
+                # Require the lowest level among lessons using this video; unreferenced videos are admin-only
+                file_levels = get_lesson_levels()["files"]
+                if file_id not in file_levels and not request.user.is_staff:
+                    return error("NOT_FOUND", "视频不存在", status=404)
+                denied = check_access(request.user, file_levels.get(file_id, 0))
+                if denied:
+                    return error(*denied, status=403)
+
+                result = service.get_play_signature(file_id, tier=file_levels.get(file_id, 0), user_id=request.user.pk)
                 return ok(result)
             
             else:
@@ -133,3 +261,38 @@ class VodSignatureView(APIView):
 
         except Exception as e:
             return error("SERVER_ERROR", str(e), status=500)
+
+    def get_batch_play_signatures(self, request, service):
+        """Authorize once for the whole course, then sign each lesson's video."""
+        try:
+            course_id = int(request.query_params['course_id'])
+            chapter_id = int(request.query_params['chapter_id']) if request.query_params.get('chapter_id') else None
+        except ValueError:
+            return error("VALIDATION_ERROR", "course_id and chapter_id must be integers", status=422)
+
+        course = get_lesson_levels()["courses"].get(course_id)
+        if course is None:
+            return error("NOT_FOUND", "课程不存在或暂无课时", status=404)
+        access_level, lessons = course
+
+        denied = check_access(request.user, access_level)
+        if denied:
+            return error(*denied, status=403)
+
+        results = []
+        for lesson_id, lesson_chapter_id, file_id in lessons:
+            if not file_id or (chapter_id is not None and lesson_chapter_id != chapter_id):
+                continue
+            signed = service.get_play_signature(file_id, tier=access_level, user_id=request.user.pk)
+            results.append({
+                "lesson_id": lesson_id,
+                "file_id": file_id,
+                "signature": signed["signature"],
+                "psign_expire": signed["psign_expire"],
+            })
+
+        return ok({
+            "results": results,
+            "app_id": service.sub_app_id,
+            "license_url": service.license_url,
+        })
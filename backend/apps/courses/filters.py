@@ -0,0 +1,31 @@
+from django.db.models import Case, When, IntegerField
+from rest_framework import filters
+from .search import search_course_ids, SEARCH_RESULT_LIMIT
+
+
+class CourseSearchFilter(filters.SearchFilter):
+    """
+    课程全文检索过滤器
+    数据库支持全文检索时按相关度排序（显式指定 ordering 时以 ordering 为准），
+    否则回退到 SearchFilter 的 icontains 搜索
+    相关度结果只保留前 SEARCH_RESULT_LIMIT 条，超出时设置 view.search_truncated，由视图写入响应 meta
+    """
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+
+        course_ids = search_course_ids(query, limit=SEARCH_RESULT_LIMIT + 1)
+        if course_ids is None:
+            return super().filter_queryset(request, queryset, view)
+        if not course_ids:
+            return queryset.none()
+        if len(course_ids) > SEARCH_RESULT_LIMIT:
+            course_ids = course_ids[:SEARCH_RESULT_LIMIT]
+            view.search_truncated = True
+
+        relevance = Case(
+            *[When(pk=pk, then=position) for position, pk in enumerate(course_ids)],
+            output_field=IntegerField(),
+        )
+        return queryset.filter(pk__in=course_ids).order_by(relevance)
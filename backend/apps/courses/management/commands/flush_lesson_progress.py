@@ -0,0 +1,24 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from apps.courses.progress import flush_progress, is_cache_shared
+
+
+class Command(BaseCommand):
+    help = 'Flush buffered lesson progress heartbeats from the cache into the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep flushing until interrupted')
+        parser.add_argument('--interval', type=int, default=settings.LESSON_PROGRESS_FLUSH_INTERVAL,
+                            help='Seconds between flushes in --loop mode')
+
+    def handle(self, *args, **options):
+        if not is_cache_shared():
+            self.stdout.write(self.style.WARNING("Default cache is process-local, heartbeats are written to the database directly"))
+            return
+        while True:
+            count = flush_progress()
+            self.stdout.write(self.style.SUCCESS(f"Flushed {count} lesson progress records"))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
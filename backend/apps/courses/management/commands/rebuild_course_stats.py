@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from apps.courses.services import rebuild_course_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild denormalized course statistics (chapter/lesson counts, total duration)'
+
+    def handle(self, *args, **options):
+        count = rebuild_course_stats()
+        self.stdout.write(self.style.SUCCESS(f'Successfully rebuilt statistics for {count} courses'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from apps.courses.models import Course, CourseSearchIndex
+from apps.courses.search import build_document
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the course full-text search index'
+
+    def handle(self, *args, **options):
+        count = 0
+        for course in Course.objects.prefetch_related('chapters__lessons').iterator(chunk_size=200):
+            CourseSearchIndex.objects.update_or_create(course=course, defaults=build_document(course))
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'Successfully indexed {count} courses'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from apps.courses.models import CourseLesson
+from apps.courses.services import sync_lesson_media
+
+
+class Command(BaseCommand):
+    help = 'Sync lesson duration, resolution and cover from Tencent VOD media info'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', type=int, help='Only sync lessons of this course')
+        parser.add_argument('--force', action='store_true', help='Re-sync lessons that are already up to date')
+        parser.add_argument('--workers', type=int, default=4, help='Concurrent VOD requests')
+
+    def handle(self, *args, **options):
+        queryset = CourseLesson.objects.all()
+        if options['course']:
+            queryset = queryset.filter(course_id=options['course'])
+        summary = sync_lesson_media(queryset, force=options['force'], workers=options['workers'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Synced {summary['lessons']} lessons: {summary['updated']} updated, "
+            f"{summary['missing']} missing in VOD, {summary['failed_batches']} failed batches"
+        ))
@@ -0,0 +1,155 @@
+# Generated by Django 5.2.9 on 2026-10-18 02:07
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# 索引表达式需与 apps/courses/search.py 中的 PG_VECTOR_SQL 一致
+PG_VECTOR_SQL = (
+    "setweight(to_tsvector('simple', title), 'A') || "
+    "setweight(to_tsvector('simple', instructor), 'B') || "
+    "setweight(to_tsvector('simple', outline), 'C') || "
+    "setweight(to_tsvector('simple', description), 'D')"
+)
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE course_search_fts USING fts5(
+        title, instructor, outline, description,
+        content='course_search_index', content_rowid='course_id', tokenize='unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER course_search_index_ai AFTER INSERT ON course_search_index BEGIN
+        INSERT INTO course_search_fts(rowid, title, instructor, outline, description)
+        VALUES (new.course_id, new.title, new.instructor, new.outline, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER course_search_index_ad AFTER DELETE ON course_search_index BEGIN
+        INSERT INTO course_search_fts(course_search_fts, rowid, title, instructor, outline, description)
+        VALUES ('delete', old.course_id, old.title, old.instructor, old.outline, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER course_search_index_au AFTER UPDATE ON course_search_index BEGIN
+        INSERT INTO course_search_fts(course_search_fts, rowid, title, instructor, outline, description)
+        VALUES ('delete', old.course_id, old.title, old.instructor, old.outline, old.description);
+        INSERT INTO course_search_fts(rowid, title, instructor, outline, description)
+        VALUES (new.course_id, new.title, new.instructor, new.outline, new.description);
+    END
+    """,
+]
+
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS course_search_index_au",
+    "DROP TRIGGER IF EXISTS course_search_index_ad",
+    "DROP TRIGGER IF EXISTS course_search_index_ai",
+    "DROP TABLE IF EXISTS course_search_fts",
+]
+
+POSTGRESQL_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX course_search_index_vector ON course_search_index USING GIN (({PG_VECTOR_SQL}))",
+    "CREATE INDEX courses_title_trgm ON courses USING GIN (title gin_trgm_ops)",
+]
+
+POSTGRESQL_REVERSE = [
+    "DROP INDEX IF EXISTS courses_title_trgm",
+    "DROP INDEX IF EXISTS course_search_index_vector",
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for sql in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+
+    return run
+
+
+# 迁移中固定一份分词规则（apps/courses/search.py 的 tokenize），不随应用代码变化
+_CJK_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]")
+_TOKEN_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[0-9A-Za-z]+")
+
+
+def _tokenize(text):
+    tokens = []
+    for match in _TOKEN_RE.finditer(text or ""):
+        run = match.group()
+        if _CJK_RE.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run.lower())
+    return tokens
+
+
+def _join_tokens(*texts):
+    return " ".join(token for text in texts for token in _tokenize(text))
+
+
+def build_document(course):
+    outline = []
+    for chapter in course.chapters.all():
+        outline.append(chapter.title)
+        outline.extend(lesson.title for lesson in chapter.lessons.all())
+    return {
+        "title": _join_tokens(course.title),
+        "instructor": _join_tokens(course.instructor),
+        "outline": _join_tokens(*outline),
+        "description": _join_tokens(course.description),
+    }
+
+
+def build_search_index(apps, schema_editor):
+    Course = apps.get_model("courses", "Course")
+    CourseSearchIndex = apps.get_model("courses", "CourseSearchIndex")
+    for course in Course.objects.prefetch_related("chapters__lessons"):
+        CourseSearchIndex.objects.update_or_create(
+            course=course, defaults=build_document(course)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0003_courselesson_duration_courselesson_resolution"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CourseSearchIndex",
+            fields=[
+                (
+                    "course",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="search_index",
+                        serialize=False,
+                        to="courses.course",
+                        verbose_name="课程",
+                    ),
+                ),
+                ("title", models.TextField(blank=True, verbose_name="标题分词")),
+                ("instructor", models.TextField(blank=True, verbose_name="讲师分词")),
+                ("outline", models.TextField(blank=True, verbose_name="章节课时分词")),
+                ("description", models.TextField(blank=True, verbose_name="描述分词")),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "课程检索索引",
+                "verbose_name_plural": "课程检索索引",
+                "db_table": "course_search_index",
+            },
+        ),
+        migrations.RunPython(
+            _run({"sqlite": SQLITE_FORWARD, "postgresql": POSTGRESQL_FORWARD}),
+            _run({"sqlite": SQLITE_REVERSE, "postgresql": POSTGRESQL_REVERSE}),
+        ),
+        migrations.RunPython(build_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.9 on 2026-10-18 02:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0004_course_search_index"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="course",
+            index=models.Index(
+                fields=["sort_order", "-created_at", "-id"], name="courses_keyset_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.9 on 2026-10-18 02:12
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_stats(apps, schema_editor):
+    from apps.courses.models import parse_duration
+
+    CourseLesson = apps.get_model("courses", "CourseLesson")
+    CourseChapter = apps.get_model("courses", "CourseChapter")
+    Course = apps.get_model("courses", "Course")
+
+    lessons = []
+    for lesson in CourseLesson.objects.exclude(duration="").only("id", "duration"):
+        seconds = parse_duration(lesson.duration)
+        if seconds:
+            lesson.duration_seconds = seconds
+            lessons.append(lesson)
+    CourseLesson.objects.bulk_update(lessons, ["duration_seconds"], batch_size=500)
+
+    def stat(model, expression):
+        return Coalesce(
+            Subquery(
+                model.objects.filter(course=OuterRef("pk"))
+                .order_by()
+                .values("course")
+                .annotate(value=expression)
+                .values("value")
+            ),
+            Value(0),
+        )
+
+    Course.objects.update(
+        chapter_count=stat(CourseChapter, Count("id")),
+        lesson_count=stat(CourseLesson, Count("id")),
+        total_duration_seconds=stat(CourseLesson, Sum("duration_seconds")),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0005_keyset_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="course",
+            name="chapter_count",
+            field=models.IntegerField(default=0, verbose_name="章节数"),
+        ),
+        migrations.AddField(
+            model_name="course",
+            name="lesson_count",
+            field=models.IntegerField(default=0, verbose_name="课时数"),
+        ),
+        migrations.AddField(
+            model_name="course",
+            name="total_duration_seconds",
+            field=models.IntegerField(default=0, verbose_name="总时长(秒)"),
+        ),
+        migrations.AddField(
+            model_name="courselesson",
+            name="duration_seconds",
+            field=models.IntegerField(
+                default=0, help_text="由 duration 解析", verbose_name="时长(秒)"
+            ),
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.9 on 2026-10-18 02:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0006_course_stats"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="courselesson",
+            name="media_synced_at",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="从 VOD 同步时长/分辨率/封面的时间",
+                null=True,
+                verbose_name="媒体信息同步时间",
+            ),
+        ),
+    ]
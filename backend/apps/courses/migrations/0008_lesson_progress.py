@@ -0,0 +1,86 @@
+# Generated by Django 5.2.9 on 2026-10-18 02:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0007_lesson_media_synced_at"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LessonProgress",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "position_seconds",
+                    models.IntegerField(default=0, verbose_name="播放位置(秒)"),
+                ),
+                (
+                    "duration_seconds",
+                    models.IntegerField(default=0, verbose_name="视频时长(秒)"),
+                ),
+                (
+                    "completed",
+                    models.BooleanField(default=False, verbose_name="是否看完"),
+                ),
+                ("updated_at", models.DateTimeField(verbose_name="最后观看时间")),
+                (
+                    "course",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="courses.course",
+                        verbose_name="所属课程",
+                    ),
+                ),
+                (
+                    "lesson",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="progress",
+                        to="courses.courselesson",
+                        verbose_name="课时",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="lesson_progress",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="用户",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "学习进度",
+                "verbose_name_plural": "学习进度",
+                "db_table": "course_lesson_progress",
+                "indexes": [
+                    models.Index(
+                        fields=["user", "course"], name="lesson_progress_user_course"
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user", "lesson"),
+                        name="lesson_progress_user_lesson_uniq",
+                    )
+                ],
+            },
+        ),
+    ]
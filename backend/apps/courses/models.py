@@ -1,5 +1,33 @@
+from django.conf import settings
 from django.db import models
 
+
+def parse_duration(value):
+    """
+    将 "08:50" / "1:02:03" 形式的时长解析为秒数，无法解析时返回 None
+    """
+    try:
+        parts = [int(p) for p in str(value).strip().split(':')]
+    except ValueError:
+        return None
+    if not parts or len(parts) > 3 or any(p < 0 for p in parts):
+        return None
+    seconds = 0
+    for part in parts:
+        seconds = seconds * 60 + part
+    return seconds
+
+
+def format_duration(seconds):
+    """将秒数格式化为 "08:50" / "1:02:03"，与 parse_duration 互逆"""
+    seconds = max(0, int(round(seconds)))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes:02d}:{seconds:02d}"
+
+
 class CourseCategory(models.Model):
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='children', verbose_name="父级分类")
     name = models.CharField(max_length=50, verbose_name="分类名称")
@@ -33,18 +61,40 @@ class Course(models.Model):
     is_published = models.BooleanField(default=False, verbose_name="是否发布")
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='UPDATING', verbose_name="状态")
     sort_order = models.IntegerField(default=0, verbose_name="排序值")
+    # 冗余统计，由章节/课时变更增量维护，可通过 rebuild_course_stats 命令重建
+    chapter_count = models.IntegerField(default=0, verbose_name="章节数")
+    lesson_count = models.IntegerField(default=0, verbose_name="课时数")
+    total_duration_seconds = models.IntegerField(default=0, verbose_name="总时长(秒)")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         db_table = "courses"
         ordering = ['sort_order', '-created_at']
+        indexes = [
+            # 键集分页 (sort_order, created_at, id)
+            models.Index(fields=['sort_order', '-created_at', '-id'], name='courses_keyset_idx'),
+        ]
         verbose_name = "课程"
         verbose_name_plural = verbose_name
 
     def __str__(self):
         return self.title
 
+    def listing_values(self):
+        """目录快照中展示的字段取值（updated_at 每次保存都会变化，不计入）"""
+        return tuple(
+            self.__dict__.get(field.attname) for field in self._meta.concrete_fields if field.attname != 'updated_at'
+        )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 记录加载时的分类、发布状态与展示字段，保存时据此确定需要更新的目录快照
+        instance._loaded_catalog = (instance.__dict__.get('category_id'), instance.__dict__.get('is_published'))
+        instance._loaded_listing = instance.listing_values()
+        return instance
+
 class CourseChapter(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='chapters', verbose_name="所属课程")
     title = models.CharField(max_length=100, verbose_name="章节名称")
@@ -62,6 +112,14 @@ class CourseChapter(models.Model):
     def __str__(self):
         return f"{self.course.title} - {self.title}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 记录加载时的所属课程，移动到其他课程时原课程也需重建索引并转移统计
+        instance._loaded_course_id = instance.__dict__.get('course_id')
+        instance._loaded_stats = instance.__dict__.get('course_id')
+        return instance
+
 class CourseLesson(models.Model):
     chapter = models.ForeignKey(CourseChapter, on_delete=models.CASCADE, related_name='lessons', verbose_name="所属章节")
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='lessons', verbose_name="所属课程") # 冗余字段方便查询
@@ -71,7 +129,9 @@ class CourseLesson(models.Model):
     video_file_id = models.CharField(max_length=100, verbose_name="视频FileId", help_text="腾讯云VOD FileId")
     video_url = models.CharField(max_length=500, blank=True, verbose_name="视频播放地址", help_text="VOD video url")
     duration = models.CharField(max_length=20, blank=True, verbose_name="时长", help_text="e.g. 08:50")
+    duration_seconds = models.IntegerField(default=0, verbose_name="时长(秒)", help_text="由 duration 解析")
     resolution = models.CharField(max_length=20, blank=True, verbose_name="分辨率", help_text="e.g. 1920x1080")
+    media_synced_at = models.DateTimeField(null=True, blank=True, verbose_name="媒体信息同步时间", help_text="从 VOD 同步时长/分辨率/封面的时间")
     sort_order = models.IntegerField(default=0, verbose_name="排序值")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -84,3 +144,69 @@ class CourseLesson(models.Model):
 
     def __str__(self):
         return self.title
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 记录加载时的统计相关字段，保存时据此计算增量
+        instance._loaded_stats = (instance.__dict__.get('course_id'), instance.__dict__.get('duration_seconds'))
+        instance._loaded_file_id = instance.__dict__.get('video_file_id')
+        instance._loaded_course_id = instance.__dict__.get('course_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        # 更换视频后需要重新同步媒体信息
+        if hasattr(self, '_loaded_file_id') and self._loaded_file_id != self.video_file_id:
+            self.media_synced_at = None
+        self._loaded_file_id = self.video_file_id
+        # 清空或无法解析的时长计为 0，避免保留旧值
+        self.duration_seconds = parse_duration(self.duration) or 0
+        super().save(*args, **kwargs)
+
+class CourseSearchIndex(models.Model):
+    """
+    课程全文检索文档，各字段均为分词后的文本（中文按二元切分）
+    SQLite 下由 FTS5 外部内容表 course_search_fts 通过触发器同步；
+    PostgreSQL 下使用 tsvector 表达式索引与 pg_trgm 三元组索引
+    """
+    course = models.OneToOneField(Course, on_delete=models.CASCADE, primary_key=True, related_name='search_index', verbose_name="课程")
+    title = models.TextField(blank=True, verbose_name="标题分词")
+    instructor = models.TextField(blank=True, verbose_name="讲师分词")
+    outline = models.TextField(blank=True, verbose_name="章节课时分词")
+    description = models.TextField(blank=True, verbose_name="描述分词")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "course_search_index"
+        verbose_name = "课程检索索引"
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return f"SearchIndex({self.course_id})"
+
+
+class LessonProgress(models.Model):
+    """
+    用户课时学习进度，由缓存中的播放心跳批量写入（见 progress.flush_progress），进程内缓存时心跳直接写入
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='lesson_progress', verbose_name="用户")
+    lesson = models.ForeignKey(CourseLesson, on_delete=models.CASCADE, related_name='progress', verbose_name="课时")
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='+', verbose_name="所属课程")  # 冗余字段方便按课程查询
+    position_seconds = models.IntegerField(default=0, verbose_name="播放位置(秒)")
+    duration_seconds = models.IntegerField(default=0, verbose_name="视频时长(秒)")
+    completed = models.BooleanField(default=False, verbose_name="是否看完")
+    updated_at = models.DateTimeField(verbose_name="最后观看时间")
+
+    class Meta:
+        db_table = "course_lesson_progress"
+        verbose_name = "学习进度"
+        verbose_name_plural = verbose_name
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'lesson'], name='lesson_progress_user_lesson_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'course'], name='lesson_progress_user_course'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}:{self.lesson_id}@{self.position_seconds}"
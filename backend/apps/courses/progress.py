@@ -0,0 +1,241 @@
+"""
+课时学习进度（写后缓冲）
+
+播放器每隔若干秒上报一次心跳，共享缓存（Redis）下心跳只写缓存：
+- progress:entry:{user}:{lesson} 保存该课时的最新进度；
+- 每次心跳领取一个递增序号，写入 progress:dirty:{seq} -> 进度键，作为待落库标记；
+- progress:version:{user}:{course} 随心跳切换，用于课程详情的 ETag。
+flush_progress 从上次落库的位置起逐批读取并删除标记，合并同一课时的多次心跳写入 LessonProgress，
+直到追上最新序号。由 flush_lesson_progress 命令定期执行，心跳请求在超过刷新间隔后也会在后台线程触发一次。
+读取时尚未写入的标记直接跳过，该课时的进度仍在缓存中，下一次心跳会重新落库。
+进程内缓存（LocMem 等）无法被其他进程与落库命令看到，此时心跳直接写数据库。
+"""
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connections, IntegrityError
+from django.db.models import Max
+from .models import LessonProgress
+
+logger = logging.getLogger('apps.courses')
+
+PROGRESS_SEQ_KEY = "progress:seq"
+PROGRESS_FLUSHED_KEY = "progress:flushed"
+PROGRESS_FLUSH_LOCK_KEY = "progress:flush:lock"
+PROGRESS_LAST_FLUSH_KEY = "progress:flush:last"
+# 缓存中的进度需保留到落库之后，远大于刷新间隔
+PROGRESS_ENTRY_TIMEOUT = 60 * 60 * 24
+PROGRESS_FLUSH_LOCK_TIMEOUT = 60 * 5
+PROGRESS_FLUSH_BATCH = 5000
+# 播放位置达到时长的 95% 视为看完（片尾字幕通常不会播放）
+COMPLETION_RATIO = 0.95
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='lesson-progress')
+
+
+def _entry_key(user_id, lesson_id):
+    return f"progress:entry:{user_id}:{lesson_id}"
+
+
+def _version_key(user_id, course_id):
+    return f"progress:version:{user_id}:{course_id}"
+
+
+def is_completed(position, duration):
+    return bool(duration) and position >= duration * COMPLETION_RATIO
+
+
+def is_cache_shared():
+    """默认缓存是否为多进程共享（Redis 等），进程内缓存不能用于缓冲心跳"""
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def get_progress_version(user_id, course_id):
+    """用户在该课程下的进度版本，尚无心跳时为空字符串"""
+    if not is_cache_shared():
+        latest = LessonProgress.objects.filter(user_id=user_id, course_id=course_id).aggregate(latest=Max('updated_at'))['latest']
+        return latest.isoformat() if latest else ""
+    return cache.get(_version_key(user_id, course_id)) or ""
+
+
+def record_heartbeat(user_id, lesson_id, course_id, position, duration, completed=False):
+    """
+    记录一次播放心跳，共享缓存下仅写缓存，否则直接写数据库
+    :return: 合并后的进度 dict
+    """
+    shared = is_cache_shared()
+    key = _entry_key(user_id, lesson_id)
+    previous = cache.get(key) if shared else None
+    entry = {
+        "user": user_id,
+        "lesson": lesson_id,
+        "course": course_id,
+        "position": int(position),
+        "duration": int(duration),
+        # 看完状态只会从未完成变为已完成，回看片头不会撤销
+        "completed": bool(completed) or is_completed(position, duration) or bool(previous and previous["completed"]),
+        "updated_at": time.time(),
+    }
+    if not shared:
+        try:
+            write_entries([entry])
+        except IntegrityError:
+            # 并发的首次心跳已插入该行，重试时转为更新
+            write_entries([entry])
+        return entry
+
+    cache.set(key, entry, timeout=PROGRESS_ENTRY_TIMEOUT)
+
+    cache.add(PROGRESS_SEQ_KEY, 0, timeout=None)
+    seq = cache.incr(PROGRESS_SEQ_KEY)
+    cache.set(f"progress:dirty:{seq}", key, timeout=PROGRESS_ENTRY_TIMEOUT)
+    cache.set(_version_key(user_id, course_id), uuid.uuid4().hex, timeout=PROGRESS_ENTRY_TIMEOUT)
+
+    maybe_flush()
+    return entry
+
+
+def maybe_flush():
+    """距上次落库超过 LESSON_PROGRESS_FLUSH_INTERVAL 时在后台线程落库一次"""
+    interval = getattr(settings, 'LESSON_PROGRESS_FLUSH_INTERVAL', 30)
+    now = time.time()
+    last = cache.get(PROGRESS_LAST_FLUSH_KEY)
+    if last is None:
+        cache.add(PROGRESS_LAST_FLUSH_KEY, now, timeout=None)
+        return
+    if now - last < interval:
+        return
+    cache.set(PROGRESS_LAST_FLUSH_KEY, now, timeout=None)
+    _executor.submit(_run_flush)
+
+
+def _run_flush():
+    try:
+        flush_progress()
+    except Exception:
+        logger.exception("Lesson progress flush failed")
+    finally:
+        if threading.current_thread() is not threading.main_thread():
+            connections.close_all()
+
+
+def flush_progress(batch_size=PROGRESS_FLUSH_BATCH):
+    """
+    将缓存中的待落库进度分批写入 LessonProgress，直到追上最新心跳
+    同一时刻只有一个进程执行
+    :return: 写入的进度条数
+    """
+    if not cache.add(PROGRESS_FLUSH_LOCK_KEY, 1, timeout=PROGRESS_FLUSH_LOCK_TIMEOUT):
+        return 0
+    try:
+        total = 0
+        flushed = cache.get(PROGRESS_FLUSHED_KEY) or 0
+        latest = cache.get(PROGRESS_SEQ_KEY) or 0
+        while flushed < latest:
+            end = min(latest, flushed + batch_size)
+            marker_keys = [f"progress:dirty:{seq}" for seq in range(flushed + 1, end + 1)]
+            entry_keys = set(cache.get_many(marker_keys).values())
+            total += write_entries(list(cache.get_many(list(entry_keys)).values()))
+            cache.delete_many(marker_keys)
+            cache.set(PROGRESS_FLUSHED_KEY, end, timeout=None)
+            cache.touch(PROGRESS_FLUSH_LOCK_KEY, PROGRESS_FLUSH_LOCK_TIMEOUT)
+            flushed = end
+        return total
+    finally:
+        cache.delete(PROGRESS_FLUSH_LOCK_KEY)
+
+
+def write_entries(entries):
+    """
+    将进度写入 LessonProgress：已有记录 bulk_update，其余 bulk_create
+    不使用 bulk_create(update_conflicts=True, unique_fields=...)，MySQL 不支持指定冲突字段
+    已看完的记录保持看完状态，合并结果回写到 entry
+    :return: 写入的进度条数
+    """
+    from apps.membership.entitlements import get_lesson_levels
+
+    # 跳过期间被删除的课时
+    lessons = get_lesson_levels()["lessons"]
+    entries = [entry for entry in entries if entry["lesson"] in lessons]
+    if not entries:
+        return 0
+
+    existing = {
+        (row.user_id, row.lesson_id): row
+        for row in LessonProgress.objects.filter(
+            user_id__in={entry["user"] for entry in entries},
+            lesson_id__in={entry["lesson"] for entry in entries},
+        )
+    }
+    updated, created = [], []
+    for entry in entries:
+        row = existing.get((entry["user"], entry["lesson"]))
+        if row is None:
+            row = LessonProgress(user_id=entry["user"], lesson_id=entry["lesson"])
+            created.append(row)
+        else:
+            entry["completed"] = entry["completed"] or row.completed
+            updated.append(row)
+        row.course_id = entry["course"]
+        row.position_seconds = entry["position"]
+        row.duration_seconds = entry["duration"]
+        row.completed = entry["completed"]
+        row.updated_at = datetime.fromtimestamp(entry["updated_at"], tz=dt_timezone.utc)
+
+    if updated:
+        LessonProgress.objects.bulk_update(
+            updated, ['course', 'position_seconds', 'duration_seconds', 'completed', 'updated_at'], batch_size=500
+        )
+    if created:
+        LessonProgress.objects.bulk_create(created, batch_size=500)
+    return len(entries)
+
+
+def get_course_progress(user_id, course_id, lesson_ids):
+    """
+    合并数据库与缓存中尚未落库的进度
+    :return: {"percent", "completed_lessons", "total_lessons", "resume_lesson_id", "resume_position",
+              "lessons": {lesson_id: {"position", "duration", "completed", "percent"}}}
+    """
+    progress = {}
+    rows = LessonProgress.objects.filter(user_id=user_id, course_id=course_id).values_list(
+        'lesson_id', 'position_seconds', 'duration_seconds', 'completed', 'updated_at'
+    )
+    for lesson_id, position, duration, completed, updated_at in rows:
+        progress[lesson_id] = (position, duration, completed, updated_at.timestamp())
+
+    cached = cache.get_many([_entry_key(user_id, lesson_id) for lesson_id in lesson_ids])
+    for entry in cached.values():
+        row = progress.get(entry["lesson"])
+        if row is None or entry["updated_at"] >= row[3]:
+            completed = entry["completed"] or bool(row and row[2])
+            progress[entry["lesson"]] = (entry["position"], entry["duration"], completed, entry["updated_at"])
+
+    lessons, resume, completed_count = {}, None, 0
+    for lesson_id in lesson_ids:
+        if lesson_id not in progress:
+            continue
+        position, duration, completed, updated_at = progress[lesson_id]
+        percent = 100 if completed else (min(99, position * 100 // duration) if duration else 0)
+        lessons[lesson_id] = {"position": position, "duration": duration, "completed": completed, "percent": percent}
+        completed_count += completed
+        # 优先续播最近观看且未看完的课时
+        if resume is None or (not completed, updated_at) > (not progress[resume][2], progress[resume][3]):
+            resume = lesson_id
+
+    total = len(lesson_ids)
+    return {
+        "percent": completed_count * 100 // total if total else 0,
+        "completed_lessons": completed_count,
+        "total_lessons": total,
+        "resume_lesson_id": resume,
+        "resume_position": progress[resume][0] if resume is not None and not progress[resume][2] else 0,
+        "lessons": lessons,
+    }
@@ -0,0 +1,158 @@
+"""
+课程全文检索
+
+- 分词：中文连续片段按二元（bigram）切分，英文/数字按单词切分并转小写，
+  索引与查询使用同一套规则，因此无需数据库支持中文分词
+- SQLite：FTS5 外部内容表 course_search_fts，bm25 排序
+- PostgreSQL：'simple' 配置的 tsvector 表达式索引 + pg_trgm 标题相似度
+- 其他数据库或关键词无法分词（如只有标点）时返回 None，由调用方回退到 icontains 搜索
+- 结果按相关度截取前 SEARCH_RESULT_LIMIT 条，超出时由调用方在响应中标明
+"""
+import re
+import threading
+import logging
+from django.db import connection, transaction
+
+logger = logging.getLogger('apps.courses')
+
+SEARCH_RESULT_LIMIT = 1000
+
+_CJK_RE = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]')
+_TOKEN_RE = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[0-9A-Za-z]+')
+
+# 与迁移 0004 中的索引表达式保持一致，否则 PostgreSQL 无法命中索引；分词规则变化时需重建索引
+PG_VECTOR_SQL = (
+    "setweight(to_tsvector('simple', i.title), 'A') || "
+    "setweight(to_tsvector('simple', i.instructor), 'B') || "
+    "setweight(to_tsvector('simple', i.outline), 'C') || "
+    "setweight(to_tsvector('simple', i.description), 'D')"
+)
+
+
+def tokenize(text):
+    """
+    将文本切分为检索词
+    e.g. "Django 机器学习" -> ["django", "机器", "器学", "学习"]
+    """
+    tokens = []
+    for match in _TOKEN_RE.finditer(text or ''):
+        run = match.group()
+        if _CJK_RE.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run.lower())
+    return tokens
+
+
+def _join_tokens(*texts):
+    return ' '.join(token for text in texts for token in tokenize(text))
+
+
+def build_document(course):
+    """根据课程及其章节、课时生成检索文档字段"""
+    outline = []
+    for chapter in course.chapters.all():
+        outline.append(chapter.title)
+        outline.extend(lesson.title for lesson in chapter.lessons.all())
+    return {
+        'title': _join_tokens(course.title),
+        'instructor': _join_tokens(course.instructor),
+        'outline': _join_tokens(*outline),
+        'description': _join_tokens(course.description),
+    }
+
+
+def index_course(course_id):
+    """重建单个课程的检索文档，课程不存在时删除文档"""
+    from .models import Course, CourseSearchIndex
+
+    course = (
+        Course.objects.filter(pk=course_id)
+        .prefetch_related('chapters__lessons')
+        .first()
+    )
+    if course is None:
+        CourseSearchIndex.objects.filter(course_id=course_id).delete()
+        return
+    CourseSearchIndex.objects.update_or_create(course=course, defaults=build_document(course))
+
+
+_pending = threading.local()
+
+
+def _flush_pending():
+    course_ids = getattr(_pending, 'course_ids', None) or set()
+    _pending.course_ids = set()
+    for course_id in course_ids:
+        try:
+            index_course(course_id)
+        except Exception as e:
+            logger.error(f"Course search index failed: course={course_id} {str(e)}")
+
+
+def schedule_index(course_id):
+    """
+    事务提交后重建课程索引，同一事务内的多次变更只重建一次
+    """
+    if not hasattr(_pending, 'course_ids'):
+        _pending.course_ids = set()
+    _pending.course_ids.add(course_id)
+    transaction.on_commit(_flush_pending)
+
+
+def _is_prefix_token(token):
+    # 英文词允许前缀匹配；单个汉字无法命中二元词，也按前缀匹配
+    return not _CJK_RE.match(token) or len(token) == 1
+
+
+def _sqlite_match_expression(tokens):
+    parts = []
+    for token in tokens:
+        phrase = '"' + token.replace('"', '""') + '"'
+        parts.append(phrase + '*' if _is_prefix_token(token) else phrase)
+    return ' AND '.join(parts)
+
+
+def _search_sqlite(tokens, limit):
+    sql = (
+        "SELECT rowid FROM course_search_fts WHERE course_search_fts MATCH %s "
+        "ORDER BY bm25(course_search_fts, 10.0, 5.0, 3.0, 1.0) LIMIT %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [_sqlite_match_expression(tokens), limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _search_postgresql(query, tokens, limit):
+    # 分词结果只包含汉字、字母和数字，可以直接拼接为 tsquery
+    tsquery = ' & '.join(token + ':*' if _is_prefix_token(token) else token for token in tokens)
+    sql = (
+        f"SELECT i.course_id, ts_rank({PG_VECTOR_SQL}, q) + similarity(c.title, %s) AS rank "
+        "FROM course_search_index i JOIN courses c ON c.id = i.course_id, "
+        "to_tsquery('simple', %s) q "
+        f"WHERE ({PG_VECTOR_SQL}) @@ q OR c.title %% %s "
+        "ORDER BY rank DESC LIMIT %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [query, tsquery, query, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_course_ids(query, limit=SEARCH_RESULT_LIMIT):
+    """
+    全文检索课程
+    :param query: 用户输入的关键词
+    :param limit: 最多返回的结果数
+    :return: 按相关度排序的课程 ID 列表；无法分词或当前数据库不支持时返回 None
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return None
+    if connection.vendor == 'sqlite':
+        return _search_sqlite(tokens, limit)
+    if connection.vendor == 'postgresql':
+        return _search_postgresql(query, tokens, limit)
+    return None
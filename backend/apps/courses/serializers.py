@@ -1,9 +1,26 @@
 from rest_framework import serializers
 from rest_framework_recursive.fields import RecursiveField
 from .models import CourseCategory, Course, CourseChapter, CourseLesson
-from apps.membership.models import MembershipPlan
+from apps.common.images import best_variant
+from apps.membership.services import get_plan_name
 
-class CourseCategorySerializer(serializers.ModelSerializer):
+
+def cover_variant(request, cover):
+    """?cover_size=320 时返回不小于该宽度的封面派生图（WebP）"""
+    size = request.GET.get('cover_size', '') if request else ''
+    if not cover or not size.isdigit():
+        return cover
+    return best_variant(cover, int(size))
+
+
+class CoverVariantMixin:
+    """按请求的 cover_size 将 cover 替换为派生图"""
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data['cover'] = cover_variant(self.context.get('request'), data.get('cover'))
+        return data
+
+class CourseCategorySerializer(CoverVariantMixin, serializers.ModelSerializer):
     children = RecursiveField(many=True, required=False)
 
     class Meta:
@@ -20,27 +37,37 @@ class CourseCategorySerializer(serializers.ModelSerializer):
             data.pop('children')
         return super().to_internal_value(data)
 
-class CourseSerializer(serializers.ModelSerializer):
+class CourseSerializer(CoverVariantMixin, serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.name', read_only=True)
     access_level_name = serializers.SerializerMethodField()
     
     class Meta:
         model = Course
         fields = '__all__'
+        read_only_fields = ['chapter_count', 'lesson_count', 'total_duration_seconds']
     
     def get_access_level_name(self, obj):
         if obj.access_level == 0:
             return "免费"
-        try:
-            plan = MembershipPlan.objects.filter(level=obj.access_level).first()
-            return plan.name if plan else f"VIP Lv.{obj.access_level}"
-        except Exception:
-            return f"VIP Lv.{obj.access_level}"
+        return get_plan_name(obj.access_level, self.context)
 
 class CourseLessonSerializer(serializers.ModelSerializer):
     class Meta:
         model = CourseLesson
         fields = '__all__'
+        read_only_fields = ['media_synced_at']
+
+class LessonImportRowSerializer(serializers.ModelSerializer):
+    """批量导入的单行课时数据，章节/课程由导入逻辑统一校验"""
+    chapter = serializers.IntegerField(required=False)
+
+    class Meta:
+        model = CourseLesson
+        fields = [
+            'chapter', 'title', 'description', 'cover', 'video_file_id',
+            'video_url', 'duration', 'resolution', 'sort_order',
+        ]
+        extra_kwargs = {'sort_order': {'required': False}}
 
 class CourseChapterSerializer(serializers.ModelSerializer):
     lessons = CourseLessonSerializer(many=True, read_only=True)
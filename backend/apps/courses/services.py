@@ -0,0 +1,279 @@
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Q, Case, Count, F, IntegerField, Max, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from apps.membership.entitlements import invalidate_lesson_levels
+from .models import Course, CourseChapter, CourseLesson, parse_duration, format_duration
+from .search import schedule_index
+from .serializers import LessonImportRowSerializer
+from .snapshots import schedule_snapshot_rebuild
+
+logger = logging.getLogger(__name__)
+
+LESSON_IMPORT_MAX_ROWS = 2000
+LESSON_IMPORT_BATCH_SIZE = 200
+MEDIA_SYNC_RETRY_AFTER = timedelta(days=1)
+
+
+def apply_course_stats_delta(course_id, chapters=0, lessons=0, seconds=0):
+    """
+    以 F() 表达式增量更新课程冗余统计，同时刷新 updated_at 并更新目录快照，使列表/详情缓存失效
+    """
+    if not course_id or not (chapters or lessons or seconds):
+        return
+    Course.objects.filter(pk=course_id).update(
+        chapter_count=F('chapter_count') + chapters,
+        lesson_count=F('lesson_count') + lessons,
+        total_duration_seconds=F('total_duration_seconds') + seconds,
+        updated_at=timezone.now(),
+    )
+    schedule_snapshot_rebuild(course_ids=[course_id])
+
+
+def move_chapter_lessons(chapter_id, old_course_id, new_course_id):
+    """
+    章节移到其他课程后，其课时随之迁移：更新课时冗余的 course 字段并转移章节数、课时数与总时长
+    update() 不发送信号，提交后统一刷新播放鉴权映射与两门课程的检索索引
+    """
+    lessons = CourseLesson.objects.filter(chapter_id=chapter_id, course_id=old_course_id)
+    stats = lessons.aggregate(count=Count('id'), seconds=Sum('duration_seconds'))
+    count, seconds = stats['count'], stats['seconds'] or 0
+    if count:
+        lessons.update(course_id=new_course_id, updated_at=timezone.now())
+    apply_course_stats_delta(old_course_id, chapters=-1, lessons=-count, seconds=-seconds)
+    apply_course_stats_delta(new_course_id, chapters=1, lessons=count, seconds=seconds)
+    transaction.on_commit(lambda: _refresh_outline_caches({old_course_id, new_course_id}))
+
+
+def _stat_subquery(model, expression):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(course=OuterRef('pk')).order_by()
+            .values('course').annotate(value=expression).values('value')
+        ),
+        Value(0),
+    )
+
+
+def rebuild_course_stats(queryset=None):
+    """
+    从章节/课时表重新计算课程统计，返回更新的课程数
+    """
+    queryset = Course.objects.all() if queryset is None else queryset
+    return queryset.update(
+        chapter_count=_stat_subquery(CourseChapter, Count('id')),
+        lesson_count=_stat_subquery(CourseLesson, Count('id')),
+        total_duration_seconds=_stat_subquery(CourseLesson, Sum('duration_seconds')),
+    )
+
+
+def bulk_import_lessons(rows, course_id=None, chapter_id=None):
+    """
+    批量导入课时（全部成功或全部失败）
+    :param rows: 课时数据列表，每行可单独指定 chapter，否则使用 chapter_id
+    :param course_id: 所属课程，未指定时由章节推断；指定时所有章节必须属于该课程
+    :param chapter_id: 默认章节
+    :return: (创建的课时列表, 错误列表 [{"row": 行号, "errors": {...}}])
+    """
+    if not rows:
+        return [], [{"row": 0, "errors": {"lessons": ["没有可导入的课时"]}}]
+    if len(rows) > LESSON_IMPORT_MAX_ROWS:
+        return [], [{"row": 0, "errors": {"lessons": [f"单次最多导入 {LESSON_IMPORT_MAX_ROWS} 条课时"]}}]
+
+    errors = []
+    validated = []
+    for index, row in enumerate(rows, start=1):
+        s = LessonImportRowSerializer(data=row)
+        if not s.is_valid():
+            errors.append({"row": index, "errors": s.errors})
+            continue
+        data = dict(s.validated_data)
+        data['chapter'] = data.get('chapter') or chapter_id
+        if not data['chapter']:
+            errors.append({"row": index, "errors": {"chapter": ["缺少所属章节"]}})
+            continue
+        validated.append((index, data))
+
+    # 一次查询取出涉及的章节、所属课程及当前最大排序值
+    chapter_ids = {data['chapter'] for _, data in validated}
+    chapters = {
+        pk: (chapter_course_id, max_sort or 0)
+        for pk, chapter_course_id, max_sort in CourseChapter.objects.filter(pk__in=chapter_ids)
+        .annotate(max_sort=Max('lessons__sort_order'))
+        .values_list('id', 'course_id', 'max_sort')
+    }
+
+    next_sort = {pk: max_sort for pk, (_, max_sort) in chapters.items()}
+    lessons = []
+    for index, data in validated:
+        chapter = chapters.get(data['chapter'])
+        if chapter is None:
+            errors.append({"row": index, "errors": {"chapter": ["章节不存在"]}})
+            continue
+        if course_id and chapter[0] != int(course_id):
+            errors.append({"row": index, "errors": {"chapter": ["章节不属于该课程"]}})
+            continue
+        if data.get('sort_order') is None:
+            next_sort[data['chapter']] += 1
+            data['sort_order'] = next_sort[data['chapter']]
+        data['duration_seconds'] = parse_duration(data.get('duration') or '') or 0
+        lessons.append(CourseLesson(
+            course_id=chapter[0],
+            chapter_id=data.pop('chapter'),
+            **data,
+        ))
+
+    if errors:
+        return [], sorted(errors, key=lambda e: e['row'])
+
+    # bulk_create 不触发信号，统计、检索索引、快照与播放鉴权映射在此统一更新
+    with transaction.atomic():
+        created = CourseLesson.objects.bulk_create(lessons, batch_size=LESSON_IMPORT_BATCH_SIZE)
+        totals = defaultdict(lambda: [0, 0])
+        for lesson in created:
+            totals[lesson.course_id][0] += 1
+            totals[lesson.course_id][1] += lesson.duration_seconds
+        for lesson_course_id, (count, seconds) in totals.items():
+            apply_course_stats_delta(lesson_course_id, lessons=count, seconds=seconds)
+            schedule_index(lesson_course_id)
+        transaction.on_commit(invalidate_lesson_levels)
+    return created, []
+
+
+def apply_sort_order(queryset, ids):
+    """
+    按 ids 的顺序将 sort_order 重写为 1..n，单条 CASE UPDATE 完成
+    同时刷新 updated_at，课程详情的条件请求校验值随之一次性失效
+    :param queryset: 排序范围内的全部记录（某课程的章节或某章节的课时）
+    :param ids: 新顺序的记录 ID，必须与范围内记录完全一致
+    :return: 更新的记录数
+    """
+    try:
+        ids = [int(pk) for pk in ids]
+    except (TypeError, ValueError):
+        raise ValueError("ids 必须为整数列表")
+    rows = dict(queryset.values_list('id', 'course_id'))
+    if len(ids) != len(set(ids)) or set(ids) != set(rows):
+        raise ValueError("ids 必须包含且仅包含该范围内的全部记录")
+    if not ids:
+        return 0
+
+    position = Case(
+        *[When(pk=pk, then=Value(index)) for index, pk in enumerate(ids, start=1)],
+        output_field=IntegerField(),
+    )
+    with transaction.atomic():
+        updated = queryset.model.objects.filter(pk__in=ids).update(sort_order=position, updated_at=timezone.now())
+        # update() 不发送信号，提交后统一刷新播放鉴权映射、目录快照与检索索引
+        transaction.on_commit(lambda: _refresh_outline_caches(set(rows.values())))
+    return updated
+
+
+def _refresh_outline_caches(course_ids):
+    invalidate_lesson_levels()
+    schedule_snapshot_rebuild(course_ids=course_ids)
+    for course_id in course_ids:
+        schedule_index(course_id)
+
+
+def lessons_needing_media_sync(queryset=None, force=False):
+    """
+    需要同步媒体信息的课时：从未同步（含更换过视频），或同步后仍缺少信息且超过重试间隔
+    """
+    queryset = CourseLesson.objects.all() if queryset is None else queryset
+    queryset = queryset.exclude(video_file_id='')
+    if force:
+        return queryset
+    missing = Q(duration='') | Q(resolution='') | Q(cover='')
+    return queryset.filter(
+        Q(media_synced_at__isnull=True)
+        | (missing & Q(media_synced_at__lt=timezone.now() - MEDIA_SYNC_RETRY_AFTER))
+    )
+
+
+def sync_lesson_media(queryset=None, force=False, batch_size=None, workers=4, service=None):
+    """
+    从 VOD 批量同步课时时长、分辨率与封面
+    按 FileId 去重分批查询，最多 workers 个批次并发，结果一次 bulk_update 写回
+    :return: {"lessons", "updated", "missing", "failed_batches"}
+    """
+    from apps.common.services.vod import MEDIA_INFO_BATCH_SIZE, get_vod_service
+
+    service = service or get_vod_service()
+    batch_size = min(batch_size or MEDIA_INFO_BATCH_SIZE, MEDIA_INFO_BATCH_SIZE)
+    lessons = list(lessons_needing_media_sync(queryset, force).only(
+        'id', 'course_id', 'video_file_id', 'duration', 'duration_seconds', 'resolution', 'cover', 'media_synced_at'
+    ))
+    summary = {"lessons": len(lessons), "updated": 0, "missing": 0, "failed_batches": 0}
+    if not lessons:
+        return summary
+
+    file_ids = sorted({lesson.video_file_id for lesson in lessons})
+    batches = [file_ids[i:i + batch_size] for i in range(0, len(file_ids), batch_size)]
+
+    def fetch(batch):
+        try:
+            return batch, service.describe_media_infos(batch)
+        except Exception as e:
+            logger.warning(f"VOD media info batch failed ({len(batch)} files): {str(e)}")
+            return batch, None
+
+    media = {}
+    fetched = set()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for batch, result in pool.map(fetch, batches):
+            if result is None:
+                summary["failed_batches"] += 1
+                continue
+            fetched.update(batch)
+            media.update(result)
+
+    now = timezone.now()
+    changed, synced = [], []
+    deltas = defaultdict(int)
+    for lesson in lessons:
+        if lesson.video_file_id not in fetched:
+            continue  # 批次失败，下次重试
+        info = media.get(lesson.video_file_id)
+        lesson.media_synced_at = now
+        if info is None:
+            summary["missing"] += 1
+            synced.append(lesson)
+            continue
+        before = (lesson.duration, lesson.duration_seconds, lesson.resolution, lesson.cover)
+        if info["duration"]:
+            seconds = int(round(info["duration"]))
+            deltas[lesson.course_id] += seconds - lesson.duration_seconds
+            lesson.duration = format_duration(seconds)
+            lesson.duration_seconds = seconds
+        if info["width"] and info["height"]:
+            lesson.resolution = f"{info['width']}x{info['height']}"
+        # 管理员手动设置的封面优先
+        if info["cover_url"] and not lesson.cover:
+            lesson.cover = info["cover_url"]
+        # 只统计内容实际变化的课时，未变化的仅记录同步时间
+        if (lesson.duration, lesson.duration_seconds, lesson.resolution, lesson.cover) == before:
+            synced.append(lesson)
+            continue
+        lesson.updated_at = now
+        changed.append(lesson)
+    summary["updated"] = len(changed)
+
+    # bulk_update 不触发信号，课程统计与缓存在此统一更新
+    with transaction.atomic():
+        CourseLesson.objects.bulk_update(
+            changed,
+            ['duration', 'duration_seconds', 'resolution', 'cover', 'media_synced_at', 'updated_at'],
+            batch_size=LESSON_IMPORT_BATCH_SIZE,
+        )
+        CourseLesson.objects.bulk_update(synced, ['media_synced_at'], batch_size=LESSON_IMPORT_BATCH_SIZE)
+        for course_id, seconds in deltas.items():
+            apply_course_stats_delta(course_id, seconds=seconds)
+        if changed:
+            schedule_snapshot_rebuild(course_ids={lesson.course_id for lesson in changed})
+    return summary
+
@@ -0,0 +1,89 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from apps.common.tree import invalidate_category_tree
+from apps.membership.entitlements import invalidate_lesson_levels
+from .models import CourseCategory, Course, CourseChapter, CourseLesson
+from .search import schedule_index
+from .services import apply_course_stats_delta, move_chapter_lessons
+from .snapshots import invalidate_snapshots, schedule_snapshot_rebuild
+
+
+@receiver([post_save, post_delete], sender=CourseCategory)
+def course_category_changed(sender, instance, **kwargs):
+    invalidate_category_tree(CourseCategory)
+    invalidate_snapshots()
+    transaction.on_commit(lambda: invalidate_category_tree(CourseCategory))
+
+
+@receiver(post_save, sender=Course)
+def course_saved(sender, instance, **kwargs):
+    schedule_index(instance.pk)
+
+    # 发布、下架或已发布课程的展示字段变化才会改变目录快照
+    old_category_id, was_published = getattr(instance, '_loaded_catalog', (None, False))
+    listing = instance.listing_values()
+    if (was_published or instance.is_published) and listing != getattr(instance, '_loaded_listing', None):
+        schedule_snapshot_rebuild(category_ids=[old_category_id, instance.category_id], course_ids=[instance.pk])
+    instance._loaded_catalog = (instance.category_id, instance.is_published)
+    instance._loaded_listing = listing
+
+
+@receiver(post_delete, sender=Course)
+def course_deleted(sender, instance, **kwargs):
+    if instance.is_published:
+        schedule_snapshot_rebuild(category_ids=[instance.category_id], course_ids=[instance.pk])
+
+
+@receiver([post_save, post_delete], sender=CourseChapter)
+@receiver([post_save, post_delete], sender=CourseLesson)
+def course_outline_changed(sender, instance, **kwargs):
+    schedule_index(instance.course_id)
+    # 章节/课时移到其他课程后，原课程的大纲不应再包含其标题
+    old_course_id = getattr(instance, '_loaded_course_id', None)
+    if old_course_id is not None and old_course_id != instance.course_id:
+        schedule_index(old_course_id)
+    instance._loaded_course_id = instance.course_id
+
+
+@receiver([post_save, post_delete], sender=Course)
+@receiver([post_save, post_delete], sender=CourseLesson)
+def lesson_levels_changed(sender, instance, **kwargs):
+    # 课程访问等级、课时视频或归属变化都会影响播放鉴权映射
+    invalidate_lesson_levels()
+    transaction.on_commit(invalidate_lesson_levels)
+
+
+@receiver(post_save, sender=CourseChapter)
+def chapter_saved(sender, instance, created, **kwargs):
+    old_course_id = getattr(instance, '_loaded_stats', instance.course_id)
+    if created:
+        apply_course_stats_delta(instance.course_id, chapters=1)
+    elif old_course_id != instance.course_id:
+        move_chapter_lessons(instance.pk, old_course_id, instance.course_id)
+    instance._loaded_stats = instance.course_id
+
+
+@receiver(post_delete, sender=CourseChapter)
+def chapter_deleted(sender, instance, **kwargs):
+    apply_course_stats_delta(instance.course_id, chapters=-1)
+
+
+@receiver(post_save, sender=CourseLesson)
+def lesson_saved(sender, instance, created, **kwargs):
+    if created:
+        apply_course_stats_delta(instance.course_id, lessons=1, seconds=instance.duration_seconds)
+    else:
+        old_course_id, old_seconds = getattr(instance, '_loaded_stats', (instance.course_id, instance.duration_seconds))
+        if old_course_id != instance.course_id:
+            apply_course_stats_delta(old_course_id, lessons=-1, seconds=-(old_seconds or 0))
+            apply_course_stats_delta(instance.course_id, lessons=1, seconds=instance.duration_seconds)
+        else:
+            apply_course_stats_delta(instance.course_id, seconds=instance.duration_seconds - (old_seconds or 0))
+    instance._loaded_stats = (instance.course_id, instance.duration_seconds)
+
+
+@receiver(post_delete, sender=CourseLesson)
+def lesson_deleted(sender, instance, **kwargs):
+    apply_course_stats_delta(instance.course_id, lessons=-1, seconds=-instance.duration_seconds)
+
@@ -0,0 +1,241 @@
+"""
+已发布课程目录快照
+
+按 (分类, 排序) 将已发布课程预先序列化为紧凑 JSON 存入缓存（可选同时写入磁盘），
+CourseListView 对匹配的请求直接使用快照分页返回，不访问数据库。
+课程发布、下架、编辑或课时统计变化后，在事务提交时只替换已缓存快照中变化课程的条目
+（未缓存的快照在下次请求时生成）；分类或套餐名称变化时整体切换版本。
+每次替换前递增修改计数，生成快照期间计数变化说明读取的数据可能早于该次修改，写入后删除该快照。
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+from apps.membership.services import get_plan_names_version
+
+logger = logging.getLogger('apps.courses')
+
+SNAPSHOT_VERSION_KEY = "courses:snapshot:version"
+SNAPSHOT_TIMEOUT = 60 * 60 * 24
+SNAPSHOT_MAX_COURSES = 2000
+SNAPSHOT_PATCH_LOCK_KEY = "courses:snapshot:patch:lock"
+SNAPSHOT_PATCH_LOCK_TIMEOUT = 60
+SNAPSHOT_CHANGES_KEY = "courses:snapshot:changes"
+# '' 表示默认排序（模型 Meta.ordering）
+SNAPSHOT_ORDERINGS = ('', 'sort_order', '-sort_order', 'created_at', '-created_at')
+
+
+def _snapshot_version():
+    version = cache.get(SNAPSHOT_VERSION_KEY)
+    if version is None:
+        cache.add(SNAPSHOT_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        version = cache.get(SNAPSHOT_VERSION_KEY)
+    # 套餐名称出现在 access_level_name 中，其版本变化同样使快照失效
+    return f"{version}:{get_plan_names_version()}"
+
+
+def _snapshot_changes():
+    return cache.get(SNAPSHOT_CHANGES_KEY) or 0
+
+
+def _bump_snapshot_changes():
+    cache.add(SNAPSHOT_CHANGES_KEY, 0, timeout=None)
+    cache.incr(SNAPSHOT_CHANGES_KEY)
+
+
+def _snapshot_name(category_id, ordering):
+    return f"{category_id or 'all'}:{ordering or 'default'}"
+
+
+def _snapshot_key(version, category_id, ordering):
+    return f"courses:snapshot:{version}:{_snapshot_name(category_id, ordering)}"
+
+
+def _snapshot_path(category_id, ordering):
+    directory = getattr(settings, 'COURSE_SNAPSHOT_DIR', '')
+    if not directory:
+        return None
+    name = _snapshot_name(category_id, ordering).replace(':', '_')
+    return os.path.join(directory, f"{name}.json")
+
+
+def _store_snapshot(version, category_id, ordering, results):
+    """生成快照 blob 并写入缓存（及磁盘）"""
+    body = json.dumps(results, ensure_ascii=False, separators=(',', ':'))
+    snapshot = {
+        'version': version,
+        'etag': hashlib.md5(body.encode('utf-8')).hexdigest(),
+        'results': results,
+    }
+    blob = json.dumps(snapshot, ensure_ascii=False, separators=(',', ':'))
+    cache.set(_snapshot_key(version, category_id, ordering), blob, timeout=SNAPSHOT_TIMEOUT)
+
+    path = _snapshot_path(category_id, ordering)
+    if path:
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(blob)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Course snapshot write failed: {path} {str(e)}")
+    return json.loads(blob)
+
+
+def _drop_snapshot(version, category_id, ordering):
+    """删除快照，下次请求时重新生成"""
+    cache.delete(_snapshot_key(version, category_id, ordering))
+    path = _snapshot_path(category_id, ordering)
+    if path:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Course snapshot delete failed: {path} {str(e)}")
+
+
+def build_snapshot(category_id=None, ordering=''):
+    """
+    从数据库生成快照并写入缓存（及磁盘）
+    :return: 快照 dict；分类不存在或课程数超过上限时返回 None
+    """
+    from .models import Course, CourseCategory
+    from .serializers import CourseSerializer
+
+    if category_id and not CourseCategory.objects.filter(pk=category_id).exists():
+        return None
+
+    version = _snapshot_version()
+    changes = _snapshot_changes()
+    queryset = Course.objects.filter(is_published=True).select_related('category')
+    if category_id:
+        queryset = queryset.filter(category_id=category_id)
+    if ordering:
+        queryset = queryset.order_by(ordering)
+
+    courses = list(queryset[:SNAPSHOT_MAX_COURSES + 1])
+    if len(courses) > SNAPSHOT_MAX_COURSES:
+        return None
+    snapshot = _store_snapshot(version, category_id, ordering, CourseSerializer(courses, many=True).data)
+    # 生成期间已有修改提交并完成替换，先写入再比较，替换晚于写入时会作用在本快照上
+    if _snapshot_changes() != changes:
+        _drop_snapshot(version, category_id, ordering)
+    return snapshot
+
+
+def get_snapshot(category_id=None, ordering=''):
+    """
+    读取快照：缓存 -> 磁盘，均未命中时返回 None（不访问数据库）
+    """
+    version = _snapshot_version()
+    blob = cache.get(_snapshot_key(version, category_id, ordering))
+    if blob is None:
+        path = _snapshot_path(category_id, ordering)
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding='utf-8') as f:
+                blob = f.read()
+        except OSError:
+            return None
+        snapshot = json.loads(blob)
+        if snapshot.get('version') != version:
+            return None
+        cache.set(_snapshot_key(version, category_id, ordering), blob, timeout=SNAPSHOT_TIMEOUT)
+        return snapshot
+    return json.loads(blob)
+
+
+def invalidate_snapshots():
+    """分类或全局信息变化时调用，使全部快照失效"""
+    cache.set(SNAPSHOT_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+def _sort_results(results, ordering):
+    """按快照排序方式在内存中排序，与数据库排序一致（多字段时从末位字段起依次稳定排序）"""
+    from .models import Course
+
+    fields = [ordering] if ordering else list(Course._meta.ordering)
+    for field in reversed(fields):
+        name = field.lstrip('-')
+        results.sort(
+            key=lambda c: parse_datetime(c[name]) if isinstance(c[name], str) else c[name],
+            reverse=field.startswith('-'),
+        )
+
+
+def patch_snapshots(course_ids, category_ids=()):
+    """
+    将已缓存快照中指定课程的条目替换为最新数据（新增、移出或重新排序），
+    未缓存的快照不处理，由下次请求生成
+    :param course_ids: 变化的课程，已删除或未发布的课程从快照中移除
+    :param category_ids: 课程原先所属的分类
+    """
+    from .models import Course
+    from .serializers import CourseSerializer
+
+    version = _snapshot_version()
+    courses = list(Course.objects.filter(pk__in=course_ids, is_published=True).select_related('category'))
+    entries = CourseSerializer(courses, many=True).data
+    targets = set(category_ids) | {course.category_id for course in courses} | {None}
+
+    # 并发更新同一快照会丢失修改，拿不到锁时直接删除受影响快照
+    locked = cache.add(SNAPSHOT_PATCH_LOCK_KEY, 1, timeout=SNAPSHOT_PATCH_LOCK_TIMEOUT)
+    try:
+        for category_id in targets:
+            for ordering in SNAPSHOT_ORDERINGS:
+                snapshot = get_snapshot(category_id, ordering) if locked else None
+                if snapshot is None:
+                    _drop_snapshot(version, category_id, ordering)
+                    continue
+                results = [c for c in snapshot['results'] if c['id'] not in course_ids]
+                results += [c for c in entries if category_id is None or c['category'] == category_id]
+                if len(results) > SNAPSHOT_MAX_COURSES:
+                    _drop_snapshot(version, category_id, ordering)
+                    continue
+                _sort_results(results, ordering)
+                _store_snapshot(version, category_id, ordering, results)
+    finally:
+        if locked:
+            cache.delete(SNAPSHOT_PATCH_LOCK_KEY)
+
+
+_pending = threading.local()
+
+
+def _flush_pending():
+    category_ids = getattr(_pending, 'category_ids', None) or set()
+    course_ids = getattr(_pending, 'course_ids', None) or set()
+    _pending.category_ids = set()
+    _pending.course_ids = set()
+    if not course_ids:
+        return
+    _bump_snapshot_changes()
+    try:
+        patch_snapshots(course_ids, category_ids)
+    except Exception as e:
+        # 部分快照可能未更新，整体切换版本后按需重新生成
+        logger.error(f"Course snapshot patch failed: courses={sorted(course_ids)} {str(e)}")
+        invalidate_snapshots()
+
+
+def schedule_snapshot_rebuild(category_ids=(), course_ids=()):
+    """
+    事务提交后更新受影响的快照，同一事务内的多次变更合并为一次
+    :param category_ids: 课程原先所属的分类
+    :param course_ids: 变化的课程
+    """
+    if not hasattr(_pending, 'category_ids'):
+        _pending.category_ids = set()
+        _pending.course_ids = set()
+    _pending.category_ids.update(c for c in category_ids if c)
+    _pending.course_ids.update(c for c in course_ids if c)
+    transaction.on_commit(_flush_pending)
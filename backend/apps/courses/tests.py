@@ -1,12 +1,27 @@
 from django.contrib.auth import get_user_model
+from io import StringIO
+from django.core.management import call_command
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APITestCase
 from rest_framework import status
+from unittest.mock import patch
+from apps.common.services.vod import VodService
+from apps.common.services.vod_fake import FakeVodServer
 from .models import CourseCategory, Course, CourseChapter, CourseLesson
+from .services import sync_lesson_media
+from .models import LessonProgress
+from .progress import flush_progress, PROGRESS_SEQ_KEY, PROGRESS_FLUSHED_KEY
+from apps.membership.entitlements import get_lesson_levels
 
 User = get_user_model()
 
 class CourseManagementTests(APITestCase):
     def setUp(self):
+        # 清理分类树、目录快照等缓存，避免测试间相互影响
+        cache.clear()
         # 创建管理员
         self.admin = User.objects.create_superuser(
             phone='13800138000',
@@ -126,3 +141,532 @@ class CourseManagementTests(APITestCase):
         self.assertEqual(res_detail_admin.status_code, status.HTTP_200_OK)
         self.assertEqual(len(res_detail_admin.data['data']['chapters']), 1)
         self.assertEqual(res_detail_admin.data['data']['chapters'][0]['lessons'][0]['title'], "环境搭建")
+
+    def test_course_detail_constant_queries(self):
+        """测试课程详情查询次数不随章节/课时数量增长"""
+        course = Course.objects.create(
+            title="大纲课程", category=self.category, instructor="D", is_published=True
+        )
+        for i in range(5):
+            chapter = CourseChapter.objects.create(course=course, title=f"第{i}章", sort_order=i)
+            for j in range(3):
+                CourseLesson.objects.create(
+                    chapter=chapter, course=course, title=f"课时{i}-{j}",
+                    video_file_id=f"{i}{j}", sort_order=j
+                )
+
+        # 条件请求校验值、课程 + 分类、章节、课时 各一次查询
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/api/courses/{course.id}/detail/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        chapters = response.data['data']['chapters']
+        self.assertEqual(len(chapters), 5)
+        self.assertEqual([l['title'] for l in chapters[1]['lessons']], ["课时1-0", "课时1-1", "课时1-2"])
+
+    def test_course_search_fulltext(self):
+        """测试课程全文检索（中文分词、课时标题、相关度排序）"""
+        with self.captureOnCommitCallbacks(execute=True):
+            Course.objects.create(
+                title="机器学习入门", category=self.category, instructor="张三", is_published=True
+            )
+            web = Course.objects.create(
+                title="Web 开发", category=self.category, instructor="李四", is_published=True,
+                description="包含一节机器学习部署的内容"
+            )
+            chapter = CourseChapter.objects.create(course=web, title="部署")
+            CourseLesson.objects.create(
+                chapter=chapter, course=web, title="Docker 容器化", video_file_id="1"
+            )
+
+        response = self.client.get('/api/courses/list/', {'search': '机器学习'})
+        titles = [c['title'] for c in response.data['data']['results']]
+        self.assertEqual(titles, ["机器学习入门", "Web 开发"])
+
+        response = self.client.get('/api/courses/list/', {'search': 'dock'})
+        titles = [c['title'] for c in response.data['data']['results']]
+        self.assertEqual(titles, ["Web 开发"])
+
+        response = self.client.get('/api/courses/list/', {'search': '量子'})
+        self.assertEqual(response.data['data']['results'], [])
+
+        # 只有标点的关键词无法分词，回退到 icontains 搜索
+        response = self.client.get('/api/courses/list/', {'search': ' '})
+        self.assertEqual(len(response.data['data']['results']), 2)
+        Course.objects.create(title="C++ / Rust", category=self.category, instructor="王五", is_published=True)
+        response = self.client.get('/api/courses/list/', {'search': '/'})
+        self.assertEqual([c['title'] for c in response.data['data']['results']], ["C++ / Rust"])
+
+        # 超过结果上限时在 meta 中标明截断
+        self.assertNotIn('search', response.data['meta'])
+        with patch('apps.courses.filters.SEARCH_RESULT_LIMIT', 1):
+            response = self.client.get('/api/courses/list/', {'search': '机器学习'})
+        self.assertEqual([c['title'] for c in response.data['data']['results']], ["机器学习入门"])
+        self.assertTrue(response.data['meta']['search']['truncated'])
+
+    def test_course_search_outline_move(self):
+        """测试课时移到其他课程后原课程不再命中其标题"""
+        with self.captureOnCommitCallbacks(execute=True):
+            source = Course.objects.create(title="课程A", category=self.category, instructor="E", is_published=True)
+            target = Course.objects.create(title="课程B", category=self.category, instructor="E", is_published=True)
+            source_chapter = CourseChapter.objects.create(course=source, title="第一章")
+            target_chapter = CourseChapter.objects.create(course=target, title="第一章")
+            CourseLesson.objects.create(chapter=source_chapter, course=source, title="Kubernetes 入门", video_file_id="1")
+
+        lesson = CourseLesson.objects.get(title="Kubernetes 入门")
+        with self.captureOnCommitCallbacks(execute=True):
+            lesson.chapter = target_chapter
+            lesson.course = target
+            lesson.save()
+
+        response = self.client.get('/api/courses/list/', {'search': 'kubernetes'})
+        titles = [c['title'] for c in response.data['data']['results']]
+        self.assertEqual(titles, ["课程B"])
+
+    def test_course_list_cursor_pagination(self):
+        """测试课程列表键集分页（不执行 COUNT，翻页无重复无遗漏）"""
+        for i in range(5):
+            Course.objects.create(
+                title=f"课程{i}", category=self.category, instructor="E",
+                is_published=True, sort_order=i % 2
+            )
+
+        seen = []
+        cursor = ''
+        while True:
+            response = self.client.get('/api/courses/list/', {'cursor': cursor, 'page_size': 2})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pagination = response.data['meta']['pagination']
+            seen.extend(c['title'] for c in response.data['data']['results'])
+            if not pagination['has_more']:
+                break
+            cursor = pagination['next_cursor']
+
+        expected = list(Course.objects.filter(is_published=True).order_by('sort_order', '-created_at', '-id').values_list('title', flat=True))
+        self.assertEqual(seen, expected)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/api/courses/list/', {'cursor': cursor, 'page_size': 2})
+        self.assertFalse(any('COUNT(' in q['sql'] for q in ctx.captured_queries))
+
+        response = self.client.get('/api/courses/list/', {'cursor': 'invalid'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        # 游标不能与排序、搜索参数组合，避免静默忽略
+        for params in ({'ordering': '-created_at'}, {'search': '课程'}):
+            response = self.client.get('/api/courses/list/', {'cursor': '', **params})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(response.data['code'], 'VALIDATION_ERROR')
+
+    def test_course_detail_conditional_get(self):
+        """测试课程详情 ETag / 304"""
+        course = Course.objects.create(
+            title="缓存课程", category=self.category, instructor="F", is_published=True
+        )
+        chapter = CourseChapter.objects.create(course=course, title="第一章")
+        lesson = CourseLesson.objects.create(chapter=chapter, course=course, title="课时", video_file_id="1")
+        url = f'/api/courses/{course.id}/detail/'
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # 删除后最近更新时间可能回退，不提供 Last-Modified，仅以 ETag 校验
+        self.assertFalse(response.has_header('Last-Modified'))
+        lesson.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+        response = self.client.get('/api/courses/list/')
+        response = self.client.get('/api/courses/list/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_course_stats_incremental(self):
+        """测试课程章节数、课时数、总时长增量维护与重建"""
+        course = Course.objects.create(title="统计课程", category=self.category, instructor="G")
+        chapter = CourseChapter.objects.create(course=course, title="第一章")
+        lesson = CourseLesson.objects.create(
+            chapter=chapter, course=course, title="课时1", video_file_id="1", duration="08:50"
+        )
+        CourseLesson.objects.create(
+            chapter=chapter, course=course, title="课时2", video_file_id="2", duration="1:00:00"
+        )
+        course.refresh_from_db()
+        self.assertEqual((course.chapter_count, course.lesson_count, course.total_duration_seconds), (1, 2, 530 + 3600))
+
+        lesson = CourseLesson.objects.get(pk=lesson.pk)
+        lesson.duration = "10:00"
+        lesson.save()
+        course.refresh_from_db()
+        self.assertEqual(course.total_duration_seconds, 600 + 3600)
+
+        lesson.duration = ""
+        lesson.save()
+        course.refresh_from_db()
+        self.assertEqual((lesson.duration_seconds, course.total_duration_seconds), (0, 3600))
+
+        chapter.delete()
+        course.refresh_from_db()
+        self.assertEqual((course.chapter_count, course.lesson_count, course.total_duration_seconds), (0, 0, 0))
+
+        Course.objects.filter(pk=course.pk).update(lesson_count=99)
+        call_command('rebuild_course_stats', stdout=StringIO())
+        course.refresh_from_db()
+        self.assertEqual(course.lesson_count, 0)
+
+    def test_course_stats_chapter_move(self):
+        """测试章节移到其他课程时连同课时统计一起转移"""
+        source = Course.objects.create(title="原课程", category=self.category, instructor="G", is_published=True)
+        target = Course.objects.create(title="新课程", category=self.category, instructor="G", is_published=True)
+        chapter = CourseChapter.objects.create(course=source, title="第一章")
+        CourseLesson.objects.create(chapter=chapter, course=source, title="Terraform 实战", video_file_id="1", duration="01:00")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            chapter = CourseChapter.objects.get(pk=chapter.pk)
+            chapter.course = target
+            chapter.save()
+
+        def stats(course):
+            return Course.objects.values_list('chapter_count', 'lesson_count', 'total_duration_seconds').get(pk=course.pk)
+
+        self.assertEqual(stats(source), (0, 0, 0))
+        self.assertEqual(stats(target), (1, 1, 60))
+        self.assertEqual(CourseLesson.objects.get().course_id, target.id)
+        response = self.client.get('/api/courses/list/', {'search': 'terraform'})
+        self.assertEqual([c['title'] for c in response.data['data']['results']], ["新课程"])
+
+        chapter.delete()
+        self.assertEqual(stats(target), (0, 0, 0))
+
+    def test_course_list_snapshot(self):
+        """测试目录快照：匿名列表请求不访问数据库，发布课程后快照重建"""
+        Course.objects.create(
+            title="快照课程", category=self.category, instructor="H", is_published=True, sort_order=1
+        )
+        self.client.get('/api/courses/list/', {'category': self.category.id})
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/courses/list/', {'category': self.category.id})
+        self.assertEqual([c['title'] for c in response.data['data']['results']], ["快照课程"])
+        self.assertEqual(response.data['meta']['pagination']['total'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            course = Course.objects.create(
+                title="新课程", category=self.category, instructor="H", sort_order=0
+            )
+            course.is_published = True
+            course.save()
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/courses/list/', {'category': self.category.id})
+        self.assertEqual([c['title'] for c in response.data['data']['results']], ["新课程", "快照课程"])
+
+        # 统计变化与排序调整只替换已缓存快照中的对应条目
+        self.client.get('/api/courses/list/', {'category': self.category.id, 'ordering': '-sort_order'})
+        with self.captureOnCommitCallbacks(execute=True):
+            CourseChapter.objects.create(course=course, title="第一章")
+            course = Course.objects.get(pk=course.pk)
+            course.sort_order = 2
+            course.save()
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/courses/list/', {'category': self.category.id})
+        results = response.data['data']['results']
+        self.assertEqual([(c['title'], c['chapter_count']) for c in results], [("快照课程", 0), ("新课程", 1)])
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/courses/list/', {'category': self.category.id, 'ordering': '-sort_order'})
+        self.assertEqual([c['title'] for c in response.data['data']['results']], ["新课程", "快照课程"])
+
+        # 生成期间有修改提交时，生成的快照不保留
+        from .snapshots import build_snapshot, get_snapshot, _bump_snapshot_changes, _store_snapshot
+
+        def store_after_commit(*args):
+            _bump_snapshot_changes()
+            return _store_snapshot(*args)
+        cache.clear()
+        with patch('apps.courses.snapshots._store_snapshot', side_effect=store_after_commit):
+            self.assertEqual(len(build_snapshot(self.category.id)['results']), 2)
+        self.assertIsNone(get_snapshot(self.category.id))
+        self.assertIsNotNone(build_snapshot(self.category.id))
+        self.assertIsNotNone(get_snapshot(self.category.id))
+
+        # 展示字段未变化的保存不更新快照
+        with patch('apps.courses.snapshots.patch_snapshots') as patch_snapshots:
+            with self.captureOnCommitCallbacks(execute=True):
+                Course.objects.get(pk=course.pk).save()
+        patch_snapshots.assert_not_called()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            course = Course.objects.get(pk=course.pk)
+            course.is_published = False
+            course.save()
+
+        response = self.client.get('/api/courses/list/', {'category': self.category.id, 'ordering': '-created_at'})
+        self.assertEqual([c['title'] for c in response.data['data']['results']], ["快照课程"])
+
+    def test_cover_size_variants(self):
+        """测试课程与分类按 cover_size 返回封面派生图"""
+        from apps.common.models import ImageDerivative
+        cover = "/media/covers/a.png"
+        ImageDerivative.objects.create(original=cover, widths=[320, 640])
+        self.category.cover = cover
+        self.category.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            Course.objects.create(title="封面课程", category=self.category, instructor="K", is_published=True, cover=cover)
+
+        response = self.client.get('/api/courses/list/', {'category': self.category.id, 'cover_size': 400})
+        self.assertEqual(response.data['data']['results'][0]['cover'], "/media/covers/a@640w.webp")
+        response = self.client.get('/api/courses/list/', {'search': '封面', 'cover_size': 300})
+        self.assertEqual(response.data['data']['results'][0]['cover'], "/media/covers/a@320w.webp")
+        response = self.client.get('/api/courses/list/', {'category': self.category.id})
+        self.assertEqual(response.data['data']['results'][0]['cover'], cover)
+
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get('/api/courses/categories/', {'cover_size': 300})
+        self.assertEqual(response.data['data'][0]['cover'], "/media/covers/a@320w.webp")
+
+        # 派生图生成后详情的 ETag 随封面地址变化，不会继续以 304 返回原图地址
+        course = Course.objects.create(title="新封面", category=self.category, instructor="K", is_published=True, cover="/media/covers/b.png")
+        url = f'/api/courses/{course.id}/detail/'
+        etag = self.client.get(url, {'cover_size': 300})['ETag']
+        ImageDerivative.objects.create(original="/media/covers/b.png", widths=[320])
+        cache.clear()
+        response = self.client.get(url, {'cover_size': 300}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['data']['cover'], "/media/covers/b@320w.webp")
+
+    def test_lesson_bulk_import(self):
+        """测试课时批量导入（JSON / CSV、章节课程一致性校验）"""
+        self.client.force_authenticate(user=self.admin)
+        course = Course.objects.create(title="导入课程", category=self.category, instructor="I")
+        other = Course.objects.create(title="其他课程", category=self.category, instructor="I")
+        chapter = CourseChapter.objects.create(course=course, title="第一章")
+        other_chapter = CourseChapter.objects.create(course=other, title="其他章节")
+
+        lessons = [
+            {"title": f"课时{i}", "video_file_id": str(i), "duration": "10:00"} for i in range(300)
+        ]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/courses/lessons/bulk-import/', {
+                "course": course.id, "chapter": chapter.id, "lessons": lessons
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        # 章节校验只查询一次，插入按批执行
+        self.assertEqual(sum(q['sql'].startswith('SELECT') for q in ctx.captured_queries), 1)
+        self.assertLess(sum(q['sql'].startswith('INSERT') for q in ctx.captured_queries), 10)
+        self.assertEqual(response.data['data']['created'], 300)
+        course.refresh_from_db()
+        self.assertEqual((course.lesson_count, course.total_duration_seconds), (300, 300 * 600))
+        self.assertEqual(
+            list(chapter.lessons.order_by('sort_order').values_list('title', flat=True)[:2]), ["课时0", "课时1"]
+        )
+
+        response = self.client.post('/api/courses/lessons/bulk-import/', {
+            "course": course.id,
+            "lessons": [
+                {"title": "缺少视频", "chapter": chapter.id},
+                {"title": "错误章节", "chapter": other_chapter.id, "video_file_id": "x"},
+            ]
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual([e['row'] for e in response.data['data']['errors']], [1, 2])
+        self.assertEqual(course.lessons.count(), 300)
+
+        csv_file = SimpleUploadedFile(
+            "lessons.csv", "title,video_file_id,duration\nCSV课时,abc,01:30\n".encode('utf-8-sig'), content_type="text/csv"
+        )
+        response = self.client.post('/api/courses/lessons/bulk-import/', {
+            "chapter": chapter.id, "file": csv_file
+        }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(CourseLesson.objects.filter(title="CSV课时", duration_seconds=90, course=course).exists())
+
+    def test_reorder_chapters_and_lessons(self):
+        """测试章节/课时批量排序"""
+        self.client.force_authenticate(user=self.admin)
+        course = Course.objects.create(title="排序课程", category=self.category, instructor="J")
+        chapters = [CourseChapter.objects.create(course=course, title=f"章{i}", sort_order=i) for i in range(3)]
+        lessons = [
+            CourseLesson.objects.create(chapter=chapters[0], course=course, title=f"课{i}", video_file_id=str(i), sort_order=i)
+            for i in range(3)
+        ]
+        first = CourseLesson.objects.create(chapter=chapters[2], course=course, title="首课", video_file_id="f")
+
+        new_order = [chapters[2].id, chapters[0].id, chapters[1].id]
+        response = self.client.post('/api/courses/chapters/reorder/', {"course": course.id, "ids": new_order}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(course.chapters.values_list('id', flat=True)), new_order)
+
+        get_lesson_levels()
+        new_order = [lessons[1].id, lessons[2].id, lessons[0].id]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/courses/lessons/reorder/', {"chapter": chapters[0].id, "ids": new_order}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(chapters[0].lessons.values_list('id', flat=True)), new_order)
+        # 批量更新不发送信号，缓存的播放鉴权映射同样按新顺序返回
+        # 映射中的课时按章节分组，章节顺序在前
+        self.assertEqual([row[0] for row in get_lesson_levels()["courses"][course.id][1]], [first.id] + new_order)
+
+        response = self.client.post('/api/courses/lessons/reorder/', {"chapter": chapters[0].id, "ids": new_order[:2]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+
+class LessonMediaSyncTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        category = CourseCategory.objects.create(name="分类")
+        self.course = Course.objects.create(title="课程", category=category, instructor="T")
+        chapter = CourseChapter.objects.create(course=self.course, title="章节")
+        for i in range(45):
+            CourseLesson.objects.create(chapter=chapter, course=self.course, title=f"课{i}", video_file_id=f"f{i % 44}")
+        CourseLesson.objects.filter(video_file_id="f0").update(cover="https://custom/cover.jpg")
+        self.media = {f"f{i}": {"Duration": 60 + i, "Width": 1280, "Height": 720, "CoverUrl": f"https://vod/{i}.jpg"} for i in range(43)}
+
+    def test_batched_sync_with_bounded_concurrency(self):
+        """测试按 FileId 分批并发查询 VOD 并批量写回"""
+        with FakeVodServer(self.media, latency=0.05) as server:
+            env = {
+                "TENCENT_SECRET_ID": "id", "TENCENT_SECRET_KEY": "key",
+                "TENCENT_VOD_SUB_APP_ID": "1500000000", "TENCENT_VOD_ENDPOINT": server.endpoint,
+            }
+            with patch.dict('os.environ', env):
+                summary = sync_lesson_media(workers=2, service=VodService())
+            self.assertEqual(server.requests, 3)
+            self.assertLessEqual(server.max_in_flight, 2)
+
+        self.assertEqual(summary, {"lessons": 45, "updated": 44, "missing": 1, "failed_batches": 0})
+        lessons = CourseLesson.objects.filter(video_file_id="f0")
+        self.assertEqual({(l.duration, l.resolution, l.cover) for l in lessons}, {("01:00", "1280x720", "https://custom/cover.jpg")})
+        self.assertEqual(CourseLesson.objects.get(video_file_id="f5").cover, "https://vod/5.jpg")
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.total_duration_seconds, sum(60 + i for i in range(43)) + 60)
+
+        # 已同步的课时不再重复查询，更换视频后重新同步
+        self.assertEqual(sync_lesson_media(service=object())["lessons"], 0)
+        lesson = CourseLesson.objects.get(video_file_id="f5")
+        lesson.video_file_id = "f6"
+        lesson.save()
+        self.assertEqual(sync_lesson_media(service=FakeService())["lessons"], 1)
+
+        # 强制重新同步时只统计内容实际变化的课时，并为这些课时所属课程更新目录快照
+        class StaticService:
+            def describe_media_infos(self, file_ids):
+                return {
+                    file_id: {"duration": 60 + int(file_id[1:]) + (file_id == "f1"), "width": 1280, "height": 720,
+                              "cover_url": f"https://vod/{file_id[1:]}.jpg"}
+                    for file_id in file_ids if int(file_id[1:]) < 43
+                }
+        with patch('apps.courses.services.schedule_snapshot_rebuild') as rebuild:
+            summary = sync_lesson_media(force=True, service=StaticService())
+        # f1 时长变化；原 f5 课时换成 f6 后取得新的时长
+        self.assertEqual((summary["lessons"], summary["updated"]), (45, 2))
+        rebuild.assert_called_with(course_ids={self.course.id})
+        self.assertEqual(CourseLesson.objects.get(video_file_id="f1").duration_seconds, 62)
+
+
+class LessonProgressTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(phone='13900139001', password='userpassword')
+        category = CourseCategory.objects.create(name="分类")
+        self.course = Course.objects.create(title="课程", category=category, instructor="T", is_published=True)
+        chapter = CourseChapter.objects.create(course=self.course, title="章节")
+        self.lessons = [
+            CourseLesson.objects.create(chapter=chapter, course=self.course, title=f"课{i}", video_file_id=f"f{i}")
+            for i in range(4)
+        ]
+        self.client.force_authenticate(user=self.user)
+
+    def heartbeat(self, lesson, position, duration=600):
+        return self.client.post(f'/api/courses/lessons/{lesson.id}/progress/', {"position": position, "duration": duration}, format='json')
+
+    @patch('apps.courses.progress.is_cache_shared', return_value=True)
+    def test_heartbeats_buffered_and_flushed(self, _):
+        """测试心跳先写缓存、批量落库，课程详情返回续播位置与完成度"""
+        url = f'/api/courses/{self.course.id}/detail/'
+        etag = self.client.get(url)['ETag']
+
+        self.heartbeat(self.lessons[0], 10)
+        with self.assertNumQueries(0):
+            for position in (20, 30):
+                self.assertEqual(self.heartbeat(self.lessons[0], position).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.heartbeat(self.lessons[1], 590).data['data']['completed'], True)
+        self.assertFalse(LessonProgress.objects.exists())
+
+        # 未落库的进度同样体现在详情中，ETag 随心跳变化
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        progress = response.data['data']['progress']
+        self.assertEqual(progress['resume_lesson_id'], self.lessons[0].id)
+        self.assertEqual(progress['resume_position'], 30)
+        self.assertEqual((progress['completed_lessons'], progress['total_lessons'], progress['percent']), (1, 4, 25))
+
+        with self.assertNumQueries(2):
+            self.assertEqual(flush_progress(), 2)
+        self.assertEqual(flush_progress(), 0)
+        self.assertEqual(LessonProgress.objects.get(lesson=self.lessons[0]).position_seconds, 30)
+
+        # 回看片头不会撤销看完状态
+        self.heartbeat(self.lessons[1], 5)
+        self.assertEqual(flush_progress(), 1)
+        row = LessonProgress.objects.get(lesson=self.lessons[1])
+        self.assertEqual((row.position_seconds, row.completed), (5, True))
+        self.assertEqual(LessonProgress.objects.count(), 2)
+
+        response = self.client.get(url)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        self.assertEqual(response.data['data']['progress']['lessons'][self.lessons[1].id]['percent'], 100)
+
+    def test_progress_requires_access(self):
+        """测试无权限课时不能上报进度"""
+        self.course.access_level = 2
+        self.course.save()
+        response = self.heartbeat(self.lessons[0], 10)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client.post('/api/courses/lessons/999999/progress/', {"position": 1}).status_code, 404)
+
+        # 未发布课程的课时仅管理员可上报
+        self.course.access_level = 0
+        self.course.is_published = False
+        self.course.save()
+        self.assertEqual(self.heartbeat(self.lessons[0], 10).status_code, status.HTTP_404_NOT_FOUND)
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(self.heartbeat(self.lessons[0], 10).status_code, status.HTTP_200_OK)
+
+    @patch('apps.courses.progress.is_cache_shared', return_value=True)
+    def test_flush_drains_in_batches(self, _):
+        """测试落库分批进行直到追上最新序号，尚未写入的标记被跳过"""
+        self.heartbeat(self.lessons[0], 10)
+        # 模拟另一请求已领取序号 2，尚未写入标记
+        cache.incr(PROGRESS_SEQ_KEY)
+        self.heartbeat(self.lessons[1], 20)
+        self.assertEqual(flush_progress(batch_size=1), 2)
+        self.assertEqual(cache.get(PROGRESS_FLUSHED_KEY), 3)
+        self.assertFalse(cache.has_key("progress:dirty:3"))
+        self.assertEqual(LessonProgress.objects.get(lesson=self.lessons[1]).position_seconds, 20)
+
+        # 跳过的课时在下一次心跳时落库
+        self.heartbeat(self.lessons[1], 25)
+        self.assertEqual(flush_progress(), 1)
+        self.assertEqual(LessonProgress.objects.get(lesson=self.lessons[1]).position_seconds, 25)
+
+    def test_heartbeat_written_directly_without_shared_cache(self):
+        """测试进程内缓存下心跳直接写数据库，详情 ETag 随进度变化"""
+        url = f'/api/courses/{self.course.id}/detail/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.heartbeat(self.lessons[0], 590).data['data']['completed'], True)
+        self.heartbeat(self.lessons[0], 5)
+        row = LessonProgress.objects.get(lesson=self.lessons[0])
+        self.assertEqual((row.position_seconds, row.completed), (5, True))
+        self.assertIsNone(cache.get(PROGRESS_SEQ_KEY))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+
+class FakeService:
+    def describe_media_infos(self, file_ids):
+        return {}
+
@@ -2,7 +2,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     CategoryViewSet, CourseAdminViewSet, ChapterViewSet, LessonViewSet,
-    CourseListView, CourseDetailView, LessonAuthView
+    CourseListView, CourseDetailView, LessonAuthView, LessonProgressView
 )
 
 router = DefaultRouter()
@@ -19,4 +19,5 @@ urlpatterns = [
     path('list/', CourseListView.as_view(), name='course-list'),
     path('<int:pk>/detail/', CourseDetailView.as_view(), name='course-detail'),
     path('lessons/<int:pk>/auth/', LessonAuthView.as_view(), name='lesson-auth'),
+    path('lessons/<int:pk>/progress/', LessonProgressView.as_view(), name='lesson-progress'),
 ]
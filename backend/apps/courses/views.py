@@ -5,23 +5,35 @@ import hmac
 import hashlib
 import logging
 import os
+import csv
+import io
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.views import APIView
 from rest_framework.generics import ListAPIView, RetrieveAPIView
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework.decorators import action
-from django.db.models import Q
-from django.utils import timezone
+from django.db.models import Q, Prefetch, Max, OuterRef, Subquery
+from django.utils.cache import patch_vary_headers
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters
+from rest_framework.utils.urls import replace_query_param, remove_query_param
 
 from config.response import ok, error
 from apps.common.services.vod import VodService
-from apps.common.views import UnifiedModelViewSet
+from apps.membership.services import get_plan_names_version
+from apps.membership.entitlements import get_lesson_levels, check_access
+from apps.common.views import UnifiedModelViewSet, ConditionalGetMixin
+from apps.common.pagination import CatalogPagination
+from apps.common.tree import get_category_tree
 from .models import CourseCategory, Course, CourseChapter, CourseLesson
+from .filters import CourseSearchFilter
+from .search import SEARCH_RESULT_LIMIT
+from .services import bulk_import_lessons, apply_sort_order
+from .progress import record_heartbeat, get_course_progress, get_progress_version
+from .snapshots import SNAPSHOT_ORDERINGS, get_snapshot, build_snapshot
 from .serializers import (
     CourseCategorySerializer, CourseSerializer, CourseDetailSerializer,
-    CourseChapterSerializer, CourseLessonSerializer
+    CourseChapterSerializer, CourseLessonSerializer, cover_variant
 )
 
 # --- 管理端接口 ---
@@ -32,10 +44,19 @@ class CategoryViewSet(UnifiedModelViewSet):
     permission_classes = [IsAdminUser]
 
     def list(self, request, *args, **kwargs):
-        # 仅返回一级分类，子分类通过 RecursiveField 嵌套返回
-        queryset = self.get_queryset().filter(parent__isnull=True)
-        serializer = self.get_serializer(queryset, many=True)
-        return ok(serializer.data)
+        # 一次查询构建整棵分类树，仅返回一级分类，子分类通过 RecursiveField 嵌套返回
+        tree = get_category_tree(self.get_queryset(), self.get_serializer_class())
+        if request.query_params.get('cover_size'):
+            tree = _with_cover_variants(request, tree)
+        return ok(tree)
+
+
+def _with_cover_variants(request, nodes):
+    """缓存的分类树不含请求信息，按 cover_size 逐层替换封面"""
+    return [
+        dict(node, cover=cover_variant(request, node.get('cover')), children=_with_cover_variants(request, node.get('children') or []))
+        for node in nodes
+    ]
 
 class CourseAdminViewSet(UnifiedModelViewSet):
     queryset = Course.objects.all()
@@ -45,6 +66,7 @@ class CourseAdminViewSet(UnifiedModelViewSet):
     filterset_fields = ['category', 'status', 'is_published']
     search_fields = ['title', 'instructor']
     ordering_fields = ['sort_order', 'created_at']
+    pagination_class = CatalogPagination
 
 class ChapterViewSet(UnifiedModelViewSet):
     queryset = CourseChapter.objects.all()
@@ -54,6 +76,18 @@ class ChapterViewSet(UnifiedModelViewSet):
     filterset_fields = ['course']
     pagination_class = None
 
+    @action(detail=False, methods=['post'])
+    def reorder(self, request):
+        """按给定顺序批量调整课程下的章节排序: {"course": 1, "ids": [3, 1, 2]}"""
+        course_id = request.data.get('course')
+        if not course_id or not Course.objects.filter(pk=course_id).exists():
+            return error("NOT_FOUND", "课程不存在", status=404)
+        try:
+            apply_sort_order(CourseChapter.objects.filter(course_id=course_id), request.data.get('ids') or [])
+        except ValueError as e:
+            return error("VALIDATION_ERROR", str(e), status=422)
+        return ok(message="排序已更新")
+
 class LessonViewSet(UnifiedModelViewSet):
     queryset = CourseLesson.objects.all()
     serializer_class = CourseLessonSerializer
@@ -62,70 +96,256 @@ class LessonViewSet(UnifiedModelViewSet):
     filterset_fields = ['chapter', 'course']
     pagination_class = None
 
+    @action(detail=False, methods=['post'])
+    def reorder(self, request):
+        """按给定顺序批量调整章节下的课时排序: {"chapter": 1, "ids": [3, 1, 2]}"""
+        chapter_id = request.data.get('chapter')
+        if not chapter_id or not CourseChapter.objects.filter(pk=chapter_id).exists():
+            return error("NOT_FOUND", "章节不存在", status=404)
+        try:
+            apply_sort_order(CourseLesson.objects.filter(chapter_id=chapter_id), request.data.get('ids') or [])
+        except ValueError as e:
+            return error("VALIDATION_ERROR", str(e), status=422)
+        return ok(message="排序已更新")
+
+    @action(detail=False, methods=['post'], url_path='bulk-import')
+    def bulk_import(self, request):
+        """
+        批量导入课时
+        JSON: {"course": 1, "chapter": 2, "lessons": [{...}, ...]}
+        CSV:  multipart 上传 file（表头为课时字段名，可含 chapter 列），course/chapter 通过表单或查询参数传递
+        """
+        course_id = request.data.get('course') or request.query_params.get('course')
+        chapter_id = request.data.get('chapter') or request.query_params.get('chapter')
+        try:
+            course_id = int(course_id) if course_id else None
+            chapter_id = int(chapter_id) if chapter_id else None
+        except (TypeError, ValueError):
+            return error("VALIDATION_ERROR", "course/chapter 参数无效", status=422)
+
+        file_obj = request.FILES.get('file')
+        if file_obj:
+            try:
+                reader = csv.DictReader(io.StringIO(file_obj.read().decode('utf-8-sig')))
+                rows = [{k.strip(): v for k, v in row.items() if k and v not in (None, '')} for row in reader]
+            except (UnicodeDecodeError, csv.Error) as e:
+                return error("VALIDATION_ERROR", f"CSV 解析失败: {str(e)}", status=422)
+        else:
+            rows = request.data.get('lessons')
+            if not isinstance(rows, list):
+                return error("VALIDATION_ERROR", "lessons 必须为列表", status=422)
+
+        created, errors = bulk_import_lessons(rows, course_id=course_id, chapter_id=chapter_id)
+        if errors:
+            return error("VALIDATION_ERROR", "课时数据校验失败", data={"errors": errors}, status=422)
+        return ok({"created": len(created)}, status=201)
+
 # --- 客户端接口 ---
 
-class CourseListView(ListAPIView):
-    queryset = Course.objects.filter(is_published=True)
+def _outline_subquery(model, expression):
+    return Subquery(
+        model.objects.filter(course=OuterRef('pk')).order_by()
+        .values('course').annotate(value=expression).values('value')
+    )
+
+
+class CourseListView(ConditionalGetMixin, ListAPIView):
+    queryset = Course.objects.filter(is_published=True).select_related('category')
     serializer_class = CourseSerializer
     permission_classes = [AllowAny]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, CourseSearchFilter, filters.OrderingFilter]
     filterset_fields = ['category']
     search_fields = ['title', 'instructor']
     ordering_fields = ['sort_order', 'created_at']
+    pagination_class = CatalogPagination
+
+    snapshot_params = {'category', 'ordering', 'page', 'cover_size'}
+
+    def get_snapshot_response(self, request):
+        """
+        仅包含分类、排序、页码（及封面尺寸）参数的请求直接使用目录快照分页，不访问数据库
+        快照未命中时从数据库生成一次；不适用时返回 None
+        """
+        params = request.query_params
+        if set(params.keys()) - self.snapshot_params:
+            return None
+        category = params.get('category') or None
+        ordering = params.get('ordering', '')
+        page = params.get('page', '1')
+        if (category is not None and not category.isdigit()) or ordering not in SNAPSHOT_ORDERINGS or not page.isdigit():
+            return None
+
+        category_id = int(category) if category else None
+        snapshot = get_snapshot(category_id, ordering) or build_snapshot(category_id, ordering)
+        if snapshot is None:
+            return None
+
+        results = snapshot['results']
+        page, page_size, count = int(page), self.paginator.page_size, len(results)
+        num_pages = max(1, -(-count // page_size))
+        if page < 1 or page > num_pages:
+            return None
+        page_results = results[(page - 1) * page_size:page * page_size]
+        parts = [request.get_full_path(), snapshot['etag']]
+        if params.get('cover_size'):
+            # 快照不含请求信息，在当前页上替换封面；派生图生成后校验值随之变化
+            page_results = [dict(c, cover=cover_variant(request, c['cover'])) for c in page_results]
+            parts.append([c['cover'] for c in page_results])
+
+        def render():
+            url = request.build_absolute_uri()
+            data = {
+                'count': count,
+                'next': replace_query_param(url, 'page', page + 1) if page < num_pages else None,
+                'previous': None,
+                'results': page_results,
+            }
+            if page == 2:
+                data['previous'] = remove_query_param(url, 'page')
+            elif page > 2:
+                data['previous'] = replace_query_param(url, 'page', page - 1)
+            meta = {'pagination': {'total': count, 'page': page, 'page_size': page_size}}
+            return ok(data, meta=meta)
+
+        return self.conditional_response(request, parts, render)
 
     def list(self, request, *args, **kwargs):
-        response = super().list(request, *args, **kwargs)
-        return ok(response.data)
+        response = self.get_snapshot_response(request)
+        if response is not None:
+            return response
+
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        meta = {'pagination': self.paginator.get_pagination_meta()}
+        if getattr(self, 'search_truncated', False):
+            # 检索结果超过上限时只返回相关度最高的部分
+            meta['search'] = {'truncated': True, 'limit': SEARCH_RESULT_LIMIT}
+
+        # 以分页信息与当前页课程、分类的更新时间作为校验值，命中时跳过序列化
+        parts = [request.get_full_path(), meta, get_plan_names_version()]
+        parts += [(course.pk, course.updated_at, course.category.updated_at, cover_variant(request, course.cover)) for course in page]
 
-class CourseDetailView(RetrieveAPIView):
+        def render():
+            serializer = self.get_serializer(page, many=True)
+            return ok(self.get_paginated_response(serializer.data).data, meta=meta)
+        return self.conditional_response(request, parts, render)
+
+class CourseDetailView(ConditionalGetMixin, RetrieveAPIView):
     queryset = Course.objects.all()
     serializer_class = CourseDetailSerializer
     permission_classes = [AllowAny]
 
     def get_queryset(self):
+        queryset = Course.objects.select_related('category').prefetch_related(
+            Prefetch(
+                'chapters',
+                queryset=CourseChapter.objects.order_by('sort_order', 'id').prefetch_related(
+                    Prefetch('lessons', queryset=CourseLesson.objects.order_by('sort_order', 'id'))
+                ),
+            )
+        )
         if self.request.user.is_staff:
-            return Course.objects.all()
-        return Course.objects.filter(is_published=True)
+            return queryset
+        return queryset.filter(is_published=True)
+
+    def get_validators(self, request):
+        """
+        返回校验值，课程不存在时返回 None
+        取课程、分类、章节、课时的最近更新时间与数量（数量用于感知删除），单次查询
+        封面派生图生成后地址会变化，当前选用的封面地址也计入校验值
+        """
+        queryset = Course.objects.all() if request.user.is_staff else Course.objects.filter(is_published=True)
+        state = queryset.filter(pk=self.kwargs['pk']).annotate(
+            chapter_updated=_outline_subquery(CourseChapter, Max('updated_at')),
+            lesson_updated=_outline_subquery(CourseLesson, Max('updated_at')),
+        ).values(
+            'id', 'updated_at', 'category__updated_at', 'chapter_count', 'chapter_updated',
+            'lesson_count', 'lesson_updated', 'cover',
+        ).first()
+        if state is None:
+            return None
+
+        state['cover'] = cover_variant(request, state['cover'])
+        parts = list(state.values()) + [get_plan_names_version()]
+        if request.user.is_authenticated:
+            # 登录用户的响应包含个人学习进度，心跳会切换进度版本
+            parts += [request.user.pk, get_progress_version(request.user.pk, state['id'])]
+        return parts
 
     def retrieve(self, request, *args, **kwargs):
-        instance = self.get_object()
-        serializer = self.get_serializer(instance)
-        return ok(serializer.data)
+        def render():
+            instance = self.get_object()
+            data = self.get_serializer(instance).data
+            if request.user.is_authenticated:
+                lesson_ids = [lesson.id for chapter in instance.chapters.all() for lesson in chapter.lessons.all()]
+                data['progress'] = get_course_progress(request.user.pk, instance.pk, lesson_ids)
+            return ok(data)
+        response = self.conditional_response(request, self.get_validators(request), render)
+        if request.user.is_authenticated and response.status_code in (200, 304):
+            response['Cache-Control'] = 'private, no-cache'
+            patch_vary_headers(response, ['Authorization'])
+        return response
 
 class LessonAuthView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, pk):
-        try:
-            lesson = CourseLesson.objects.get(pk=pk)
-            course = lesson.course
-            user = request.user
-
-            # 权限检查
-            if course.access_level > 0:
-                # 1. 检查会员是否过期
-                if not user.membership_expire_at or user.membership_expire_at < timezone.now():
-                    return error("AUTH_EXPIRED", "会员已过期，请续费", status=403)
-                
-                # 2. 检查会员等级
-                if user.level < course.access_level:
-                    return error("PERMISSION_DENIED", f"需要Lv.{course.access_level}及以上会员", status=403)
-
-            # 生成播放签名 (Key 防盗链)
-            # 注意：此处仅为示例，实际需根据腾讯云 Key 防盗链规则生成
-            # 通常需要: 路径(dir), 密钥(key), 过期时间(t), 试看(us)等
-            # 假设简单返回 fileId 和 允许播放
-            
-            # 如果需要后端生成播放签名(假设开启了Key防盗链)
-            # 参考: https://cloud.tencent.com/document/product/266/14047
-            # 这里暂时只返回 fileId，前端直接使用 FileID 播放 (需配置 Referer 白名单)
-            
-            return ok({
-                "allow": True,
-                "file_id": lesson.video_file_id,
-                "app_id": os.environ.get("TENCENT_VOD_APP_ID"),
-                # "psign": "...", 
-            })
-
-        except CourseLesson.DoesNotExist:
+        # 课时等级映射与用户权益快照均走缓存，稳定状态下无需查询数据库
+        lesson = get_lesson_levels()["lessons"].get(pk)
+        if lesson is None:
             return error("NOT_FOUND", "课时不存在", status=404)
+        file_id, access_level = lesson
+
+        denied = check_access(request.user, access_level)
+        if denied:
+            return error(*denied, status=403)
+
+        # 生成播放签名 (Key 防盗链)
+        # 注意：此处仅为示例，实际需根据腾讯云 Key 防盗链规则生成
+        # 通常需要: 路径(dir), 密钥(key), 过期时间(t), 试看(us)等
+        # 假设简单返回 fileId 和 允许播放
+        
+        # 如果需要后端生成播放签名(假设开启了Key防盗链)
+        # 参考: https://cloud.tencent.com/document/product/266/14047
+        # 这里暂时只返回 fileId，前端直接使用 FileID 播放 (需配置 Referer 白名单)
+        
+        return ok({
+            "allow": True,
+            "file_id": file_id,
+            "app_id": os.environ.get("TENCENT_VOD_APP_ID"),
+            # "psign": "...", 
+        })
+
+class LessonProgressView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, pk):
+        """
+        上报播放心跳: {"position": 120, "duration": 530, "completed": false}
+        进度先写缓存，定期批量落库
+        """
+        levels = get_lesson_levels()
+        lesson = levels["lessons"].get(pk)
+        # 与课程详情一致：未发布课程的课时仅管理员可见
+        if lesson is None or (levels["lesson_courses"][pk] in levels["unpublished_courses"] and not request.user.is_staff):
+            return error("NOT_FOUND", "课时不存在", status=404)
+
+        denied = check_access(request.user, lesson[1])
+        if denied:
+            return error(*denied, status=403)
+
+        try:
+            position = int(float(request.data.get('position', 0)))
+            duration = int(float(request.data.get('duration') or 0))
+        except (TypeError, ValueError):
+            return error("VALIDATION_ERROR", "position/duration 参数无效", status=422)
+        if position < 0 or duration < 0:
+            return error("VALIDATION_ERROR", "position/duration 不能为负数", status=422)
+        if duration:
+            position = min(position, duration)
+
+        entry = record_heartbeat(
+            request.user.pk, pk, levels["lesson_courses"][pk], position, duration,
+            completed=request.data.get('completed') in (True, 'true', '1', 1),
+        )
+        return ok({"position": entry["position"], "completed": entry["completed"]})
@@ -0,0 +1,42 @@
+import threading
+import time
+from rest_framework.exceptions import APIException
+
+
+class FakeAlipayGateway:
+    """
+    本地支付宝网关替身，实现 reconcile_payments 使用的 query_trade，用于离线开发与测试。
+    用法:
+        gateway = FakeAlipayGateway({"VIP2026...": {"trade_status": "TRADE_SUCCESS", "total_amount": "30.00"}})
+        reconcile_payments(gateway=gateway)
+    未登记的订单视为支付宝侧无交易（返回 None），failures 中的订单号模拟网关错误。
+    同时统计请求数、最大并发数与请求时间，便于验证并发上限与限速。
+    """
+    def __init__(self, trades=None, latency=0.0, failures=()):
+        self.trades = trades or {}
+        self.latency = latency
+        self.failures = set(failures)
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.request_times = []
+        self._lock = threading.Lock()
+
+    def query_trade(self, order_no):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            self.request_times.append(time.monotonic())
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            if order_no in self.failures:
+                raise APIException("支付宝错误: 系统繁忙")
+            trade = self.trades.get(order_no)
+            if trade is None:
+                return None
+            return {"code": "10000", "out_trade_no": order_no, "trade_no": f"FAKE{order_no}", **trade}
+        finally:
+            with self._lock:
+                self.in_flight -= 1
@@ -6,19 +6,29 @@ from alipay.aop.api.domain.AlipayTradeRefundModel import AlipayTradeRefundModel
 from alipay.aop.api.request.AlipayTradeRefundRequest import AlipayTradeRefundRequest
 from alipay.aop.api.domain.AlipayTradeQueryModel import AlipayTradeQueryModel
 from alipay.aop.api.request.AlipayTradeQueryRequest import AlipayTradeQueryRequest
+from alipay.aop.api.util.SignatureUtils import get_sign_content, fill_private_key_marker, fill_public_key_marker
 from django.conf import settings
 from django.db import transaction
 from django.utils import timezone
 from decimal import Decimal
+import base64
 import logging
+import threading
 import traceback
 import json
+import rsa
 from rest_framework.exceptions import ValidationError, APIException
 from apps.membership.models import MemberOrder
-from apps.membership.services import process_payment_success, check_and_expire_order
+from apps.membership.services import process_payment_success, check_and_expire_order, PAID_TRADE_STATUSES
 
 logger = logging.getLogger(__name__)
 
+ALIPAY_REQUIRED_KEYS = ('app_id', 'app_private_key', 'alipay_public_key', 'server_url')
+
+# 进程内缓存：(配置指纹, 客户端, 支付宝公钥)，ALIPAY_CONFIG 变化时重建
+_alipay_client_local = {"state": None}
+_alipay_client_lock = threading.Lock()
+
 class AlipayService:
     """支付宝服务"""
 
@@ -51,6 +61,72 @@ class AlipayService:
 
         logger.debug(f"订单参数验证通过: {order.order_no}, 金额: {order.amount}")
 
+    @staticmethod
+    def _validate_config(alipay_config):
+        """
+        校验支付宝配置并解析密钥
+
+        Returns:
+            rsa.PublicKey: 支付宝公钥
+
+        Raises:
+            APIException: 配置缺失、字段为空或密钥格式错误
+        """
+        if not alipay_config:
+            raise APIException('支付宝配置不存在，请在settings.py中配置ALIPAY_CONFIG')
+
+        # return_url 和 notify_url 允许为空
+        for key in ALIPAY_REQUIRED_KEYS:
+            if not alipay_config.get(key):
+                raise APIException(f'支付宝配置缺少必要字段或为空: {key}')
+
+        try:
+            rsa.PrivateKey.load_pkcs1(fill_private_key_marker(alipay_config['app_private_key']), format='PEM')
+        except Exception as e:
+            raise APIException(f'支付宝应用私钥格式错误: {str(e)}')
+        try:
+            return rsa.PublicKey.load_pkcs1_openssl_pem(fill_public_key_marker(alipay_config['alipay_public_key']))
+        except Exception as e:
+            raise APIException(f'支付宝公钥格式错误: {str(e)}')
+
+    @staticmethod
+    def _get_client_state():
+        """
+        返回缓存的 (配置指纹, 客户端, 支付宝公钥)，进程内复用，配置变化时重新校验并创建
+
+        Raises:
+            APIException: 支付宝配置不完整或客户端创建失败
+        """
+        alipay_config = getattr(settings, 'ALIPAY_CONFIG', {}) or {}
+        fingerprint = tuple(alipay_config.get(key) for key in ALIPAY_REQUIRED_KEYS)
+        state = _alipay_client_local["state"]
+        if state is not None and state[0] == fingerprint:
+            return state
+
+        with _alipay_client_lock:
+            state = _alipay_client_local["state"]
+            if state is not None and state[0] == fingerprint:
+                return state
+
+            public_key = AlipayService._validate_config(alipay_config)
+            try:
+                # 创建支付宝客户端配置
+                client_config = AlipayClientConfig()
+                client_config.server_url = alipay_config['server_url']
+                client_config.app_id = alipay_config['app_id']
+                client_config.app_private_key = alipay_config['app_private_key']
+                client_config.alipay_public_key = alipay_config['alipay_public_key']
+
+                # 创建客户端
+                client = DefaultAlipayClient(alipay_client_config=client_config, logger=logger)
+            except Exception as e:
+                raise APIException(f'创建支付宝客户端失败: {str(e)}')
+
+            state = (fingerprint, client, public_key)
+            _alipay_client_local["state"] = state
+            logger.info("支付宝客户端已创建")
+            return state
+
     @staticmethod
     def _get_alipay_client():
         """
@@ -62,36 +138,38 @@ class AlipayService:
         Raises:
             APIException: 支付宝配置不完整或SDK未安装
         """
+        return AlipayService._get_client_state()[1]
 
-        # 检查支付宝配置
-        alipay_config = getattr(settings, 'ALIPAY_CONFIG', {})
-
-        if not alipay_config:
-            raise APIException('支付宝配置不存在，请在settings.py中配置ALIPAY_CONFIG')
+    @staticmethod
+    def verify_notify(params):
+        """
+        校验支付宝异步通知签名
 
-        required_keys = ['app_id', 'app_private_key', 'alipay_public_key', 'server_url']
-        for key in required_keys:
-            if key not in alipay_config or not alipay_config[key]:
-                # 允许 return_url 和 notify_url 为空
-                pass
-            elif not alipay_config[key]:
-                 # 检查必要字段是否为空字符串
-                 raise APIException(f'支付宝配置缺少必要字段或为空: {key}')
+        Args:
+            params: 通知参数（已 URL 解码的 dict）
 
+        Returns:
+            bool: 签名有效时返回 True；app_id 由 record_notification 核对并记录
+        """
+        sign = params.get('sign')
+        if not sign:
+            return False
         try:
-            # 创建支付宝客户端配置
-            client_config = AlipayClientConfig()
-            client_config.server_url = alipay_config['server_url']
-            client_config.app_id = alipay_config['app_id']
-            client_config.app_private_key = alipay_config['app_private_key']
-            client_config.alipay_public_key = alipay_config['alipay_public_key']
-
-            # 创建客户端
-            client = DefaultAlipayClient(alipay_client_config=client_config, logger=logger)
-
-            return client
+            public_key = AlipayService._get_client_state()[2]
+        except APIException as e:
+            logger.error(f"支付宝异步通知无法验签: {str(e)}")
+            return False
+
+        # 除 sign、sign_type 及空值外的参数按字母序拼接后验签
+        content = get_sign_content({
+            k: v for k, v in params.items() if k not in ('sign', 'sign_type') and v not in (None, '')
+        })
+        try:
+            rsa.verify(content.encode('utf-8'), base64.b64decode(sign), public_key)
+            return True
         except Exception as e:
-            raise APIException(f'创建支付宝客户端失败: {str(e)}')
+            logger.warning(f"支付宝异步通知验签失败: {str(e)}")
+            return False
 
     @staticmethod
     def create_payment_request(order):
@@ -157,12 +235,13 @@ class AlipayService:
             raise APIException(f"支付宝服务调用失败: {str(e)}")
 
     @staticmethod
-    def _parse_alipay_response(response_content):
+    def _parse_alipay_response(response_content, missing_sub_code=None):
         """
         安全解析支付宝响应
 
         Args:
             response_content: 支付宝返回的响应内容
+            missing_sub_code: 表示"对象不存在"的错误子码，命中时返回 None 而不是抛出异常
 
         Returns:
             dict: 解析后的业务数据
@@ -188,6 +267,9 @@ class AlipayService:
         else:
             biz_response = response_dict
 
+        if missing_sub_code and biz_response.get('sub_code') == missing_sub_code:
+            return None
+
         # 检查是否有错误响应
         if biz_response.get('code') != '10000':
             error_msg = biz_response.get('sub_msg', biz_response.get('msg', '未知错误'))
@@ -247,6 +329,65 @@ class AlipayService:
             logger.error(f"支付宝退款失败: {str(e)}\n{traceback.format_exc()}")
             raise APIException(f"退款失败: {str(e)}")
     @staticmethod
+    def query_trade(order_no):
+        """
+        调用 alipay.trade.query 查询交易
+
+        Args:
+            order_no: 订单号
+
+        Returns:
+            dict: 交易信息；用户尚未扫码付款（支付宝侧无交易）时返回 None
+
+        Raises:
+            APIException: 查询失败
+        """
+        client = AlipayService._get_alipay_client()
+
+        # 构建查询请求
+        model = AlipayTradeQueryModel()
+        model.out_trade_no = str(order_no)
+
+        request = AlipayTradeQueryRequest(biz_model=model)
+
+        # 执行请求，execute 返回验签后的业务响应 JSON 字符串
+        response_content = client.execute(request)
+
+        return AlipayService._parse_alipay_response(response_content, missing_sub_code="ACQ.TRADE_NOT_EXIST")
+
+    @staticmethod
+    def fulfil_trade(order, response):
+        """
+        校验支付金额后为已付款交易履约，可重复调用
+
+        Args:
+            order: 订单对象
+            response: 支付宝交易信息（trade_status 为已付款）
+
+        Returns:
+            bool: 本次是否完成了履约
+
+        Raises:
+            ValidationError: 支付金额不一致
+        """
+        # 验证支付金额是否一致 (防止恶意篡改金额)
+        total_amount = response.get("total_amount")
+        if total_amount and Decimal(total_amount) != order.amount:
+            logger.critical(f"支付金额不一致! 订单: {order.order_no}, 订单金额: {order.amount}, 支付宝金额: {total_amount}")
+            raise ValidationError(f"支付金额不一致: 订单{order.amount} vs 实付{total_amount}")
+
+        with transaction.atomic():
+            # 锁定订单，避免与异步通知、其他对账进程重复履约
+            order = MemberOrder.objects.select_for_update().get(pk=order.pk)
+            # 只有未支付（或意外已过期但实际已支付）的订单才处理
+            # 允许 EXPIRED 状态是因为可能存在用户打开支付页面后超过30分钟才支付的情况，此时支付宝已扣款，我们应尽量履约
+            if order.status not in ["PENDING", "EXPIRED"]:
+                return False
+            # 传递完整响应给 process_payment_success 以记录交易流水
+            process_payment_success(order, "ALIPAY", external_data=response)
+            return True
+
+    @staticmethod
     def query_payment_status(order_no):
         """
         查询支付宝支付结果并同步本地状态
@@ -262,39 +403,12 @@ class AlipayService:
             except MemberOrder.DoesNotExist:
                 raise ValidationError("订单不存在")
 
-            client = AlipayService._get_alipay_client()
-
-            # 构建查询请求
-            model = AlipayTradeQueryModel()
-            model.out_trade_no = str(order_no)
-
-            request = AlipayTradeQueryRequest(biz_model=model)
-
-            # 执行请求
-            # execute 返回的是字典（如果 client 配置正确）还是字符串？
-            # DefaultAlipayClient.execute returns the response content string usually, unless configured otherwise.
-            # Actually alipay-sdk-python `execute` returns the response body string.
-            response_content = client.execute(request)
-            
-            response = AlipayService._parse_alipay_response(response_content)
-
+            response = AlipayService.query_trade(order_no) or {}
             trade_status = response.get("trade_status")
 
             # 支付成功
-            if trade_status in ["TRADE_SUCCESS", "TRADE_FINISHED"]:
-                # 验证支付金额是否一致 (防止恶意篡改金额)
-                total_amount = response.get("total_amount")
-                if total_amount and Decimal(total_amount) != order.amount:
-                    logger.critical(f"支付金额不一致! 订单: {order.order_no}, 订单金额: {order.amount}, 支付宝金额: {total_amount}")
-                    # 不抛出异常，而是返回错误状态，避免前端误以为支付成功
-                    # 或者抛出异常阻断流程
-                    raise ValidationError(f"支付金额不一致: 订单{order.amount} vs 实付{total_amount}")
-
-                # 只有未支付（或意外已过期但实际已支付）的订单才处理
-                # 允许 EXPIRED 状态是因为可能存在用户打开支付页面后超过30分钟才支付的情况，此时支付宝已扣款，我们应尽量履约
-                if order.status in ["PENDING", "EXPIRED"]:
-                     # 传递完整响应给 process_payment_success 以记录交易流水
-                     process_payment_success(order, "ALIPAY", external_data=response)
+            if trade_status in PAID_TRADE_STATUSES:
+                AlipayService.fulfil_trade(order, response)
             else:
                 # 如果未支付成功，检查本地订单是否应该过期
                 check_and_expire_order(order)
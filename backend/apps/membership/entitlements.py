@@ -0,0 +1,111 @@
+import uuid
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from apps.courses.models import CourseLesson
+
+LESSON_LEVELS_VERSION_KEY = "entitlement:lesson_levels:version"
+# 映射结构变化时更换前缀，避免读取旧进程写入的缓存
+LESSON_LEVELS_DATA_KEY = "entitlement:lesson_levels:v2:{version}"
+LESSON_LEVELS_CACHE_TIMEOUT = 60 * 60 * 24
+USER_ENTITLEMENT_CACHE_TIMEOUT = 60 * 60
+
+# 进程内缓存：只有当共享缓存中的版本号变化时才重新加载
+_lesson_levels_local = {"version": None, "levels": None}
+
+
+def _get_lesson_levels_version():
+    version = cache.get(LESSON_LEVELS_VERSION_KEY)
+    if version is None:
+        cache.add(LESSON_LEVELS_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        version = cache.get(LESSON_LEVELS_VERSION_KEY)
+    return version
+
+
+def get_lesson_levels():
+    """
+    返回播放鉴权所需的映射：
+    - lessons: {lesson_id: (video_file_id, 所需等级)}
+    - files: {video_file_id: 所需等级}，同一视频被多个课时引用时取最低等级
+    - courses: {course_id: (所需等级, [(lesson_id, chapter_id, video_file_id), ...])}，课时按章节顺序、章节内顺序排列
+    - lesson_courses: {lesson_id: course_id}
+    - unpublished_courses: {course_id, ...} 未发布的课程，仅管理员可访问其课时
+    """
+    version = _get_lesson_levels_version()
+    if version is not None and _lesson_levels_local["version"] == version:
+        return _lesson_levels_local["levels"]
+
+    levels = cache.get(LESSON_LEVELS_DATA_KEY.format(version=version))
+    if levels is None:
+        levels = {"lessons": {}, "files": {}, "courses": {}, "lesson_courses": {}, "unpublished_courses": set()}
+        rows = CourseLesson.objects.values_list(
+            "id", "chapter_id", "course_id", "video_file_id", "course__access_level", "course__is_published"
+        ).order_by("chapter__sort_order", "chapter_id", "sort_order", "id")
+        for lesson_id, chapter_id, course_id, file_id, level, published in rows:
+            levels["lessons"][lesson_id] = (file_id, level)
+            levels["lesson_courses"][lesson_id] = course_id
+            if not published:
+                levels["unpublished_courses"].add(course_id)
+            levels["courses"].setdefault(course_id, (level, []))[1].append((lesson_id, chapter_id, file_id))
+            if file_id:
+                levels["files"][file_id] = min(level, levels["files"].get(file_id, level))
+        cache.set(LESSON_LEVELS_DATA_KEY.format(version=version), levels, timeout=LESSON_LEVELS_CACHE_TIMEOUT)
+
+    _lesson_levels_local["version"] = version
+    _lesson_levels_local["levels"] = levels
+    return levels
+
+
+def invalidate_lesson_levels():
+    """课时或课程权限变更后调用：切换版本号，使所有进程的本地映射失效"""
+    cache.set(LESSON_LEVELS_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+    _lesson_levels_local["version"] = None
+    _lesson_levels_local["levels"] = None
+
+
+def _user_entitlement_key(user_id):
+    return f"entitlement:user:v2:{user_id}"
+
+
+def get_user_entitlement(user):
+    """
+    返回用户权益快照 {"level", "expire_at"}，expire_at 为时间戳或 None。
+    快照由已加载的用户对象生成，用户保存（等级、到期时间变化）后失效。
+    """
+    key = _user_entitlement_key(user.pk)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        expire_at = user.membership_expire_at
+        snapshot = {
+            "level": user.level,
+            "expire_at": expire_at.timestamp() if expire_at else None,
+        }
+        cache.set(key, snapshot, timeout=USER_ENTITLEMENT_CACHE_TIMEOUT)
+    return snapshot
+
+
+def invalidate_user_entitlement(user_id):
+    """会员权益变更后调用，事务提交后再失效一次，避免并发请求回填旧快照"""
+    key = _user_entitlement_key(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def check_access(user, required_level):
+    """
+    检查用户是否满足所需会员等级。
+    :return: None 表示允许访问，否则返回 (错误码, 提示信息)
+    """
+    if not required_level:
+        return None
+    if not user or not user.is_authenticated:
+        return "PERMISSION_DENIED", f"需要Lv.{required_level}及以上会员"
+
+    snapshot = get_user_entitlement(user)
+    # 1. 检查会员是否过期
+    if not snapshot["expire_at"] or snapshot["expire_at"] < timezone.now().timestamp():
+        return "AUTH_EXPIRED", "会员已过期，请续费"
+    # 2. 检查会员等级
+    if snapshot["level"] < required_level:
+        return "PERMISSION_DENIED", f"需要Lv.{required_level}及以上会员"
+    return None
@@ -1,13 +1,19 @@
+import time
 from django.core.management.base import BaseCommand
-from django.utils import timezone
-from datetime import timedelta
-from apps.membership.models import MemberOrder
-from apps.membership.services import ORDER_EXPIRATION_MINUTES
+from apps.membership.services import EXPIRE_BATCH_SIZE, expire_due_orders
 
 class Command(BaseCommand):
-    help = 'Expire pending orders older than 30 minutes'
+    help = 'Expire pending orders whose payment deadline has passed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep sweeping until interrupted')
+        parser.add_argument('--interval', type=int, default=30, help='Seconds between sweeps in --loop mode')
+        parser.add_argument('--batch-size', type=int, default=EXPIRE_BATCH_SIZE, help='Orders updated per statement')
 
     def handle(self, *args, **options):
-        threshold = timezone.now() - timedelta(minutes=ORDER_EXPIRATION_MINUTES)
-        count = MemberOrder.objects.filter(status="PENDING", created_at__lt=threshold).update(status="EXPIRED")
-        self.stdout.write(self.style.SUCCESS(f'Successfully expired {count} orders'))
+        while True:
+            count = expire_due_orders(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Successfully expired {count} orders'))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
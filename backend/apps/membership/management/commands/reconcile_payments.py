@@ -0,0 +1,25 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from apps.membership.notifications import process_pending_notifications
+from apps.membership.services import RECONCILE_LOOKBACK_HOURS, reconcile_candidates, reconcile_payments
+
+
+class Command(BaseCommand):
+    help = 'Query Alipay for unpaid orders and fulfil the ones that were actually paid'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=RECONCILE_LOOKBACK_HOURS, help='Only check orders created within this many hours')
+        parser.add_argument('--workers', type=int, default=4, help='Concurrent gateway queries')
+        parser.add_argument('--rate', type=float, default=10, help='Maximum gateway queries per second (0 for unlimited)')
+
+    def handle(self, *args, **options):
+        # 先补处理未完成的异步通知，已履约的订单不再进入对账
+        replayed = process_pending_notifications()
+        queryset = reconcile_candidates(timezone.now() - timedelta(hours=options['hours']))
+        summary = reconcile_payments(queryset, workers=options['workers'], rate=options['rate'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Reconciled {summary['orders']} orders: {summary['paid']} paid, {summary['unpaid']} unpaid, "
+            f"{summary['mismatched']} amount mismatches, {summary['failed']} failed; "
+            f"replayed {len(replayed)} pending notifications"
+        ))
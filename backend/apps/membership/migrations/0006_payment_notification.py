@@ -0,0 +1,80 @@
+# Generated by Django 5.2.9 on 2026-10-18 02:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("membership", "0005_paymenttransaction"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PaymentNotification",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("platform", models.CharField(max_length=20, verbose_name="支付平台")),
+                (
+                    "trade_no",
+                    models.CharField(
+                        max_length=64, unique=True, verbose_name="第三方交易号"
+                    ),
+                ),
+                (
+                    "order_no",
+                    models.CharField(
+                        db_index=True, max_length=64, verbose_name="订单号"
+                    ),
+                ),
+                (
+                    "trade_status",
+                    models.CharField(max_length=32, verbose_name="交易状态"),
+                ),
+                ("payload", models.TextField(verbose_name="原始通知内容")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("RECEIVED", "待处理"),
+                            ("PROCESSED", "已处理"),
+                            ("FAILED", "处理失败"),
+                        ],
+                        default="RECEIVED",
+                        max_length=10,
+                        verbose_name="处理状态",
+                    ),
+                ),
+                (
+                    "error_message",
+                    models.CharField(
+                        blank=True, max_length=255, verbose_name="失败原因"
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="接收时间"),
+                ),
+                (
+                    "processed_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="处理时间"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "支付异步通知",
+                "verbose_name_plural": "支付异步通知",
+                "db_table": "payment_notifications",
+                "ordering": ["-created_at"],
+            },
+        ),
+    ]
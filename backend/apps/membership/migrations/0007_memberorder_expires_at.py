@@ -0,0 +1,36 @@
+# Generated by Django 5.2.9 on 2026-10-18 02:41
+
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def backfill_expires_at(apps, schema_editor):
+    MemberOrder = apps.get_model("membership", "MemberOrder")
+    MemberOrder.objects.filter(expires_at__isnull=True).update(
+        expires_at=models.F("created_at") + timedelta(minutes=30)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("membership", "0006_payment_notification"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="memberorder",
+            name="expires_at",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="支付截止时间"
+            ),
+        ),
+        migrations.RunPython(backfill_expires_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="memberorder",
+            index=models.Index(
+                fields=["status", "expires_at"], name="member_order_status_expiry"
+            ),
+        ),
+    ]
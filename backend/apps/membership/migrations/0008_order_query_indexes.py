@@ -0,0 +1,39 @@
+# Generated by Django 5.2.9 on 2026-10-18 02:43
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("membership", "0007_memberorder_expires_at"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="memberorder",
+            index=models.Index(
+                fields=["user", "status"], name="member_order_user_status"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="memberorder",
+            index=models.Index(
+                fields=["status", "created_at"], name="member_order_status_created"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="memberorder",
+            index=models.Index(
+                fields=["user", "-created_at"], name="member_order_user_created"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="paymenttransaction",
+            index=models.Index(
+                fields=["external_transaction_id"], name="payment_txn_external_id"
+            ),
+        ),
+    ]
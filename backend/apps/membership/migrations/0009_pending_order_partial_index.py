@@ -0,0 +1,30 @@
+from django.db import migrations, models
+
+# 只覆盖待支付订单的部分索引，体积随待支付订单数而非订单总数增长。
+# MySQL 等不支持部分索引的数据库跳过，由 0008 中的 (user, status) 复合索引承担同样的查询。
+PENDING_USER_INDEX = models.Index(
+    fields=["user", "expires_at"],
+    condition=models.Q(status="PENDING"),
+    name="member_order_pending_user",
+)
+
+
+def add_partial_index(apps, schema_editor):
+    if schema_editor.connection.features.supports_partial_indexes:
+        schema_editor.add_index(apps.get_model("membership", "MemberOrder"), PENDING_USER_INDEX)
+
+
+def remove_partial_index(apps, schema_editor):
+    if schema_editor.connection.features.supports_partial_indexes:
+        schema_editor.remove_index(apps.get_model("membership", "MemberOrder"), PENDING_USER_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("membership", "0008_order_query_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(add_partial_index, remove_partial_index),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.9 on 2026-10-18 03:40
+
+import json
+
+from django.db import migrations, models
+
+
+def backfill_notify_id(apps, schema_editor):
+    # 已有通知取原始内容中的 notify_id，缺失时以交易号与状态区分（与 record_notification 一致）
+    PaymentNotification = apps.get_model("membership", "PaymentNotification")
+    for notification in PaymentNotification.objects.all():
+        try:
+            notify_id = json.loads(notification.payload).get("notify_id")
+        except ValueError:
+            notify_id = None
+        notification.notify_id = (notify_id or f"{notification.trade_no}:{notification.trade_status}")[:64]
+        notification.save(update_fields=["notify_id"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("membership", "0009_pending_order_partial_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="paymentnotification",
+            name="notify_id",
+            field=models.CharField(default="", max_length=64, verbose_name="通知ID"),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_notify_id, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="paymentnotification",
+            name="notify_id",
+            field=models.CharField(max_length=64, unique=True, verbose_name="通知ID"),
+        ),
+        migrations.AlterField(
+            model_name="paymentnotification",
+            name="trade_no",
+            field=models.CharField(db_index=True, max_length=64, verbose_name="第三方交易号"),
+        ),
+        migrations.AlterField(
+            model_name="paymentnotification",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("RECEIVED", "待处理"),
+                    ("PROCESSED", "已处理"),
+                    ("FAILED", "处理失败"),
+                    ("REVIEW", "待人工核对"),
+                    ("IGNORED", "无需处理"),
+                ],
+                default="RECEIVED",
+                max_length=10,
+                verbose_name="处理状态",
+            ),
+        ),
+    ]
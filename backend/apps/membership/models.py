@@ -1,6 +1,11 @@
+from datetime import timedelta
 from django.db import models
+from django.utils import timezone
 from apps.users.models import User
 
+# 待支付订单的支付时限（分钟）
+ORDER_EXPIRATION_MINUTES = 30
+
 class MembershipPlan(models.Model):
     UNIT_CHOICES = (
         ("DAY", "天"),
@@ -80,6 +85,7 @@ class MemberOrder(models.Model):
     payment_method = models.CharField(max_length=20, choices=PAYMENT_METHOD_CHOICES, null=True, blank=True, verbose_name="支付方式")
     
     paid_at = models.DateTimeField(null=True, blank=True, verbose_name="支付时间")
+    expires_at = models.DateTimeField(null=True, blank=True, verbose_name="支付截止时间")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间")
 
@@ -88,10 +94,26 @@ class MemberOrder(models.Model):
         ordering = ["-created_at"]
         verbose_name = "会员订单"
         verbose_name_plural = verbose_name
+        indexes = [
+            # expire_due_orders: status='PENDING' AND expires_at <= now
+            models.Index(fields=["status", "expires_at"], name="member_order_status_expiry"),
+            # OrderCreateView: 用户的待支付订单
+            models.Index(fields=["user", "status"], name="member_order_user_status"),
+            # reconcile_candidates: status IN (...) AND created_at >= since
+            models.Index(fields=["status", "created_at"], name="member_order_status_created"),
+            # OrderListView: 用户订单按时间倒序分页
+            models.Index(fields=["user", "-created_at"], name="member_order_user_created"),
+        ]
 
     def __str__(self):
         return f"Order {self.order_no} - {self.user.phone}"
 
+    def save(self, *args, **kwargs):
+        # 创建时记录支付截止时间，超时后由 expire_due_orders 批量置为已过期
+        if self.expires_at is None:
+            self.expires_at = (self.created_at or timezone.now()) + timedelta(minutes=ORDER_EXPIRATION_MINUTES)
+        super().save(*args, **kwargs)
+
 class PaymentTransaction(models.Model):
     TRANSACTION_TYPE_CHOICES = (
         ("PAYMENT", "支付"),
@@ -117,6 +139,39 @@ class PaymentTransaction(models.Model):
         ordering = ["-created_at"]
         verbose_name = "支付流水"
         verbose_name_plural = verbose_name
+        indexes = [
+            # 按第三方交易号查找流水（对账、退款排查）
+            models.Index(fields=["external_transaction_id"], name="payment_txn_external_id"),
+        ]
 
     def __str__(self):
         return f"{self.transaction_type} - {self.order.order_no} - {self.amount}"
+
+class PaymentNotification(models.Model):
+    STATUS_CHOICES = (
+        ("RECEIVED", "待处理"),
+        ("PROCESSED", "已处理"),
+        ("FAILED", "处理失败"),
+        ("REVIEW", "待人工核对"),
+        ("IGNORED", "无需处理"),
+    )
+
+    platform = models.CharField(max_length=20, verbose_name="支付平台")
+    notify_id = models.CharField(max_length=64, unique=True, verbose_name="通知ID")
+    trade_no = models.CharField(max_length=64, db_index=True, verbose_name="第三方交易号")
+    order_no = models.CharField(max_length=64, db_index=True, verbose_name="订单号")
+    trade_status = models.CharField(max_length=32, verbose_name="交易状态")
+    payload = models.TextField(verbose_name="原始通知内容")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="RECEIVED", verbose_name="处理状态")
+    error_message = models.CharField(max_length=255, blank=True, verbose_name="失败原因")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="接收时间")
+    processed_at = models.DateTimeField(null=True, blank=True, verbose_name="处理时间")
+
+    class Meta:
+        db_table = "payment_notifications"
+        ordering = ["-created_at"]
+        verbose_name = "支付异步通知"
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return f"{self.platform} {self.trade_no} - {self.trade_status}"
@@ -0,0 +1,127 @@
+"""
+支付异步通知
+
+回调视图只做验签，验签通过的通知按 notify_id 去重后连同处理结果全部保存，随即应答：
+- 已付款状态（TRADE_SUCCESS / TRADE_FINISHED）保存为 RECEIVED，
+  履约（process_payment_success）在事务提交后交给后台线程执行；
+- 其余交易状态或该交易已履约的通知保存为 IGNORED；
+- app_id、金额不一致或订单不存在的通知保存为 REVIEW，留待人工核对，不自动重试。
+履约出错的通知保留为 FAILED，可通过 process_pending_notifications 重新处理。
+"""
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+from django.db import connections, transaction
+from django.utils import timezone
+from .models import MemberOrder, PaymentNotification
+from .services import process_payment_success, PAID_TRADE_STATUSES
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='payment-notify')
+
+
+def _initial_outcome(params, app_id):
+    """:return: (状态, 说明)"""
+    if app_id is not None and params.get("app_id") != app_id:
+        logger.critical(f"支付通知 app_id 不一致! 交易号: {params.get('trade_no')}, 通知 app_id: {params.get('app_id')}")
+        return "REVIEW", f"app_id 不一致: {params.get('app_id')}"[:255]
+    if params.get("trade_status") not in PAID_TRADE_STATUSES or not params.get("trade_no"):
+        return "IGNORED", f"交易状态 {params.get('trade_status')} 无需处理"[:255]
+    if PaymentNotification.objects.filter(trade_no=params["trade_no"], status="PROCESSED").exists():
+        return "IGNORED", "该交易已履约"
+    return "RECEIVED", ""
+
+
+def record_notification(platform, params, app_id=None):
+    """
+    保存已验签的异步通知及其初步处理结果，同一 notify_id 只保存一次
+    :param app_id: 期望的应用 ID，不一致时保存为待人工核对
+    :return: 需要履约时返回通知对象，重复或无需处理时返回 None
+    """
+    # 没有 notify_id 时以交易号与状态区分，同一状态的重发仍会去重
+    notify_id = params.get("notify_id") or f"{params.get('trade_no', '')}:{params.get('trade_status', '')}"
+    status, message = _initial_outcome(params, app_id)
+    notification, created = PaymentNotification.objects.get_or_create(
+        notify_id=notify_id[:64],
+        defaults={
+            "platform": platform,
+            "trade_no": params.get("trade_no", ""),
+            "order_no": params.get("out_trade_no", ""),
+            "trade_status": params.get("trade_status", ""),
+            "payload": json.dumps(params, ensure_ascii=False),
+            "status": status,
+            "error_message": message,
+            "processed_at": timezone.now() if status != "RECEIVED" else None,
+        },
+    )
+    if notification.status not in ("RECEIVED", "FAILED"):
+        return None
+    return notification
+
+
+def schedule_fulfilment(notification_id):
+    """事务提交后在后台线程履约，不阻塞回调应答"""
+    transaction.on_commit(lambda: _executor.submit(_run, notification_id))
+
+
+def _run(notification_id):
+    try:
+        fulfil_notification(notification_id)
+    except Exception:
+        logger.exception(f"Payment notification {notification_id} fulfilment failed")
+    finally:
+        if threading.current_thread() is not threading.main_thread():
+            connections.close_all()
+
+
+def fulfil_notification(notification_id):
+    """
+    根据通知完成订单履约，可重复调用
+    :return: 处理后的通知状态
+    """
+    with transaction.atomic():
+        notification = PaymentNotification.objects.select_for_update().get(pk=notification_id)
+        if notification.status == "PROCESSED":
+            return notification.status
+
+        params = json.loads(notification.payload)
+        failure, status = None, "FAILED"
+        try:
+            order = MemberOrder.objects.select_for_update().get(order_no=notification.order_no)
+        except MemberOrder.DoesNotExist:
+            order, failure, status = None, "订单不存在", "REVIEW"
+
+        if order is not None:
+            # 验证支付金额是否一致 (防止恶意篡改金额)
+            try:
+                amount_matches = Decimal(params.get("total_amount") or "0") == order.amount
+            except InvalidOperation:
+                amount_matches = False
+            if not amount_matches:
+                logger.critical(f"支付金额不一致! 订单: {order.order_no}, 订单金额: {order.amount}, 通知金额: {params.get('total_amount')}")
+                failure = f"支付金额不一致: 订单{order.amount} vs 实付{params.get('total_amount')}"
+                status = "REVIEW"
+            # 过期订单同样履约：用户可能在订单过期后才完成支付
+            elif order.status in ["PENDING", "EXPIRED"]:
+                try:
+                    process_payment_success(order, notification.platform, external_data=params)
+                except Exception as e:
+                    logger.exception(f"订单 {order.order_no} 履约失败")
+                    failure = str(e)[:255]
+
+        notification.status = status if failure else "PROCESSED"
+        notification.error_message = failure or ""
+        notification.processed_at = timezone.now()
+        notification.save(update_fields=["status", "error_message", "processed_at"])
+        return notification.status
+
+
+def process_pending_notifications(limit=100):
+    """重新处理未完成的通知（进程重启丢失的队列任务等），待人工核对与无需处理的通知不重试"""
+    ids = list(
+        PaymentNotification.objects.filter(status__in=["RECEIVED", "FAILED"]).order_by("created_at").values_list("id", flat=True)[:limit]
+    )
+    return {notification_id: fulfil_notification(notification_id) for notification_id in ids}
@@ -1,7 +1,7 @@
 from rest_framework import serializers
 from django.utils import timezone
-from datetime import timedelta
 from .models import MembershipPlan, MemberOrder
+from .services import order_deadline
 
 class MembershipPlanSerializer(serializers.ModelSerializer):
     class Meta:
@@ -20,7 +20,7 @@ class MemberOrderSerializer(serializers.ModelSerializer):
         fields = "__all__"
         read_only_fields = [
             "order_no", "user", "plan_name", "plan_days", 
-            "amount", "status", "paid_at", "created_at", "updated_at"
+            "amount", "status", "paid_at", "expires_at", "created_at", "updated_at"
         ]
 
     def get_plan_detail(self, obj):
@@ -32,7 +32,5 @@ class MemberOrderSerializer(serializers.ModelSerializer):
     def get_remaining_seconds(self, obj):
         if obj.status != 'PENDING':
             return 0
-        expire_time = obj.created_at + timedelta(minutes=30)
-        now = timezone.now()
-        remaining = (expire_time - now).total_seconds()
+        remaining = (order_deadline(obj) - timezone.now()).total_seconds()
         return max(0, int(remaining))
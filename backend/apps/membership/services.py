@@ -1,27 +1,117 @@
+import uuid
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from django.utils import timezone
 from datetime import timedelta
+from django.core.cache import cache
 from django.db import transaction
-from .models import MemberOrder, PaymentTransaction
+from .models import MembershipPlan, MemberOrder, PaymentTransaction, ORDER_EXPIRATION_MINUTES
+from .entitlements import invalidate_user_entitlement
 
-ORDER_EXPIRATION_MINUTES = 30
+logger = logging.getLogger(__name__)
+
+EXPIRE_BATCH_SIZE = 500
+
+# 第三方交易已付款的状态
+PAID_TRADE_STATUSES = ("TRADE_SUCCESS", "TRADE_FINISHED")
+# 对账回溯时长：支付宝交易在此之前早已关闭
+RECONCILE_LOOKBACK_HOURS = 48
+
+PLAN_NAMES_VERSION_KEY = "membership:plan_names:version"
+PLAN_NAMES_CACHE_TIMEOUT = 60 * 60 * 24
+
+# 进程内缓存：只有当共享缓存中的版本号变化时才重新加载
+_plan_names_local = {"version": None, "names": {}}
+
+
+def get_plan_names_version():
+    version = cache.get(PLAN_NAMES_VERSION_KEY)
+    if version is None:
+        cache.add(PLAN_NAMES_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        version = cache.get(PLAN_NAMES_VERSION_KEY)
+    return version
+
+
+def get_plan_name_map():
+    """
+    返回 {level: 套餐名称} 映射。
+    每个等级取排序（level, price）后的第一个套餐，与 filter(level=...).first() 语义一致。
+    """
+    version = get_plan_names_version()
+    if version is not None and _plan_names_local["version"] == version:
+        return _plan_names_local["names"]
+
+    names = cache.get(f"membership:plan_names:{version}")
+    if names is None:
+        names = {}
+        for level, name in MembershipPlan.objects.order_by("level", "price").values_list("level", "name"):
+            names.setdefault(level, name)
+        cache.set(f"membership:plan_names:{version}", names, timeout=PLAN_NAMES_CACHE_TIMEOUT)
+
+    _plan_names_local["version"] = version
+    _plan_names_local["names"] = names
+    return names
+
+
+def get_plan_name(level, context=None):
+    """
+    根据会员等级返回套餐名称，找不到时返回 VIP Lv.x
+    :param context: 序列化器 context；映射缓存在其中，同一次序列化只检查一次版本号
+    """
+    if context is None:
+        names = get_plan_name_map()
+    else:
+        names = context.get("plan_names")
+        if names is None:
+            names = context["plan_names"] = get_plan_name_map()
+    return names.get(level) or f"VIP Lv.{level}"
+
+
+def invalidate_plan_names():
+    """套餐变更后调用：切换版本号，使所有进程的本地映射失效"""
+    cache.set(PLAN_NAMES_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+    _plan_names_local["version"] = None
+    _plan_names_local["names"] = {}
+
+def order_deadline(order):
+    """订单支付截止时间，兼容尚未记录 expires_at 的旧订单"""
+    return order.expires_at or order.created_at + timedelta(minutes=ORDER_EXPIRATION_MINUTES)
 
 def check_and_expire_order(order):
     """
-    Check if the order is expired and update status if necessary.
-    Returns True if the order was expired during this check, or is already expired.
+    Check whether the order is past its payment deadline.
+    Only the in-memory instance is marked EXPIRED; the row itself is expired by
+    expire_due_orders, so read paths never write.
+    Returns True if the order is expired (already or by deadline).
     Returns False if the order is still valid (PENDING and within time) or in other final states.
     """
     if order.status == "EXPIRED":
         return True
-        
-    if order.status == "PENDING":
-        if timezone.now() > order.created_at + timedelta(minutes=ORDER_EXPIRATION_MINUTES):
-            order.status = "EXPIRED"
-            order.save()
-            return True
-            
+
+    if order.status == "PENDING" and timezone.now() >= order_deadline(order):
+        order.status = "EXPIRED"
+        return True
+
     return False
 
+def expire_due_orders(queryset=None, now=None, batch_size=EXPIRE_BATCH_SIZE):
+    """
+    将已到支付截止时间的待支付订单批量置为已过期
+    按 (status, expires_at) 索引分批取 id，再以 status='PENDING' 为条件更新，期间已支付或取消的订单不受影响
+    :return: 过期的订单数
+    """
+    now = now or timezone.now()
+    queryset = MemberOrder.objects.all() if queryset is None else queryset
+    due = queryset.filter(status="PENDING", expires_at__lte=now).order_by("expires_at")
+    total = 0
+    while True:
+        ids = list(due.values_list("id", flat=True)[:batch_size])
+        if not ids:
+            return total
+        total += MemberOrder.objects.filter(id__in=ids, status="PENDING").update(status="EXPIRED", updated_at=now)
+
 @transaction.atomic
 def process_payment_success(order, payment_method, external_data=None):
     """
@@ -102,3 +192,69 @@ def process_payment_success(order, payment_method, external_data=None):
         user.membership_reference_days = order.plan_days
         
     user.save()
+    invalidate_user_entitlement(user.pk)
+
+
+class RateLimiter:
+    """限制每秒调用次数，多个线程共享同一个实例"""
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def reconcile_candidates(since=None):
+    """需要对账的订单：回溯时间内仍未支付（含已过期）的订单"""
+    since = since or timezone.now() - timedelta(hours=RECONCILE_LOOKBACK_HOURS)
+    return MemberOrder.objects.filter(status__in=["PENDING", "EXPIRED"], created_at__gte=since)
+
+
+def reconcile_payments(queryset=None, workers=4, rate=10, gateway=None):
+    """
+    批量向支付网关查询订单并补发已付款订单的权益
+    最多 workers 个并发查询，整体不超过每秒 rate 次；履约在当前线程串行执行
+    :param gateway: 提供 query_trade(order_no) 的网关，默认 AlipayService
+    :return: {"orders", "paid", "unpaid", "mismatched", "failed"}
+    """
+    from rest_framework.exceptions import ValidationError
+    from .alipay_service import AlipayService
+
+    gateway = gateway or AlipayService
+    orders = list((reconcile_candidates() if queryset is None else queryset).select_related("user", "plan"))
+    summary = {"orders": len(orders), "paid": 0, "unpaid": 0, "mismatched": 0, "failed": 0}
+    limiter = RateLimiter(rate)
+
+    def fetch(order):
+        limiter.wait()
+        try:
+            return order, gateway.query_trade(order.order_no), None
+        except Exception as e:
+            return order, None, e
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for order, trade, exc in pool.map(fetch, orders):
+            if exc is not None:
+                logger.warning(f"对账查询失败: {order.order_no}: {str(exc)}")
+                summary["failed"] += 1
+            elif not trade or trade.get("trade_status") not in PAID_TRADE_STATUSES:
+                summary["unpaid"] += 1
+            else:
+                try:
+                    AlipayService.fulfil_trade(order, trade)
+                    summary["paid"] += 1
+                except ValidationError:
+                    summary["mismatched"] += 1
+                except Exception as e:
+                    logger.error(f"对账履约失败: {order.order_no}: {str(e)}")
+                    summary["failed"] += 1
+    return summary
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import MembershipPlan
+from .services import invalidate_plan_names
+from .entitlements import invalidate_user_entitlement
+
+
+@receiver([post_save, post_delete], sender=MembershipPlan)
+def membership_plan_changed(sender, instance, **kwargs):
+    # 立即失效一次，事务提交后再失效一次，避免其他进程在提交前读到旧数据并写回缓存
+    invalidate_plan_names()
+    transaction.on_commit(invalidate_plan_names)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def user_entitlement_changed(sender, instance, update_fields=None, **kwargs):
+    # 等级与会员到期时间保存在用户上，后台修改、支付、退款等任何路径保存后都使权益快照失效
+    if update_fields is not None and not {'level', 'membership_expire_at'} & set(update_fields):
+        return
+    invalidate_user_entitlement(instance.pk)
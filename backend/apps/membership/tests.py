@@ -1,10 +1,22 @@
 from django.contrib.auth import get_user_model
 from rest_framework.test import APITestCase
 from rest_framework import status
-from .models import MembershipPlan, MemberOrder
+from django.core.cache import cache
+from .models import MembershipPlan, MemberOrder, PaymentNotification, PaymentTransaction
+from .services import get_plan_name, get_plan_names_version, process_payment_success, reconcile_payments, reconcile_candidates
+from .alipay_fake import FakeAlipayGateway
+from apps.courses.models import CourseCategory, Course, CourseChapter, CourseLesson
 from django.utils import timezone
 from datetime import timedelta
+from django.test import override_settings
+from django.db import connection
+import re
+from django.core.management import call_command
+from io import StringIO
+from unittest.mock import patch
+import base64
 import time
+from urllib.parse import urlencode
 from decimal import Decimal
 
 User = get_user_model()
@@ -159,8 +171,8 @@ class MembershipTests(APITestCase):
             amount=30.00,
             status="PENDING"
         )
-        # 手动模拟创建时间，因为 auto_now_add 可能会覆盖
-        MemberOrder.objects.filter(id=order.id).update(created_at=expired_time)
+        # 手动模拟创建时间与支付截止时间，因为 auto_now_add 可能会覆盖
+        MemberOrder.objects.filter(id=order.id).update(created_at=expired_time, expires_at=expired_time + timedelta(minutes=30))
         
         # 尝试创建另一个 - 应该成功，因为旧的已过期
         data = {"plan_id": self.plan_monthly.id}
@@ -171,6 +183,34 @@ class MembershipTests(APITestCase):
         order.refresh_from_db()
         self.assertEqual(order.status, 'EXPIRED')
 
+    def test_expire_due_orders_sweep(self):
+        """测试读接口只在内存中计算过期，定时清理按截止时间条件更新"""
+        self.authenticate_user()
+        past = timezone.now() - timedelta(minutes=1)
+        orders = {}
+        for order_no, order_status, expires_at in (
+            ("DUE_PENDING", "PENDING", past),
+            ("DUE_PAID", "PAID", past),
+            ("NOT_DUE", "PENDING", None),
+        ):
+            orders[order_no] = MemberOrder.objects.create(
+                order_no=order_no, user=self.user, plan=self.plan_monthly, plan_name=self.plan_monthly.name,
+                plan_days=30, amount=30.00, status=order_status, expires_at=expires_at
+            )
+        self.assertGreater(orders["NOT_DUE"].expires_at, timezone.now() + timedelta(minutes=29))
+
+        response = self.client.get('/api/membership/orders/detail/', {"order_no": "DUE_PENDING"})
+        self.assertEqual(response.data['data']['status'], 'EXPIRED')
+        self.assertEqual(response.data['data']['remaining_seconds'], 0)
+        orders["DUE_PENDING"].refresh_from_db()
+        self.assertEqual(orders["DUE_PENDING"].status, 'PENDING')
+
+        out = StringIO()
+        call_command('expire_orders', stdout=out)
+        self.assertIn('expired 1 orders', out.getvalue())
+        statuses = dict(MemberOrder.objects.values_list("order_no", "status"))
+        self.assertEqual(statuses, {"DUE_PENDING": "EXPIRED", "DUE_PAID": "PAID", "NOT_DUE": "PENDING"})
+
     def test_upgrade_order_calculation(self):
         self.authenticate_user()
         # 设置用户为月度会员
@@ -290,4 +330,311 @@ class MembershipTests(APITestCase):
         # 过期时间应回到当前时间附近（因为我们增加了30天然后移除了30天）
         # 允许执行时间的微小偏差
         time_diff = abs((self.user.membership_expire_at - timezone.now()).total_seconds())
-        self.assertTrue(time_diff < 60) 
+        self.assertTrue(time_diff < 60)
+
+
+class PlanNameResolverTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.plan = MembershipPlan.objects.create(name="Monthly Plan", price=30.00, level=1)
+
+    def test_resolve_without_queries(self):
+        """测试套餐名称映射加载后不再查询数据库"""
+        self.assertEqual(get_plan_name(1), "Monthly Plan")
+        with self.assertNumQueries(0):
+            self.assertEqual(get_plan_name(1), "Monthly Plan")
+            self.assertEqual(get_plan_name(9), "VIP Lv.9")
+
+        # 同一序列化 context 内只检查一次版本号
+        context = {}
+        with patch('apps.membership.services.get_plan_names_version', wraps=get_plan_names_version) as version:
+            for _ in range(3):
+                self.assertEqual(get_plan_name(1, context), "Monthly Plan")
+        self.assertEqual(version.call_count, 1)
+
+    def test_invalidate_on_plan_change(self):
+        """测试套餐保存或删除后映射失效"""
+        self.assertEqual(get_plan_name(1), "Monthly Plan")
+        self.plan.name = "Gold"
+        self.plan.save()
+        self.assertEqual(get_plan_name(1), "Gold")
+        self.plan.delete()
+        self.assertEqual(get_plan_name(1), "VIP Lv.1")
+
+
+class EntitlementTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(phone='18888888888', password='password123')
+        self.plan = MembershipPlan.objects.create(name="Monthly Plan", price=30.00, duration_days=30, level=1)
+        category = CourseCategory.objects.create(name="分类")
+        self.course = Course.objects.create(title="会员课程", category=category, instructor="T", access_level=1)
+        chapter = CourseChapter.objects.create(course=self.course, title="章节")
+        self.lesson = CourseLesson.objects.create(chapter=chapter, course=self.course, title="课时", video_file_id="f1")
+        self.client.force_authenticate(user=self.user)
+
+    def test_play_auth_cached_and_invalidated_by_payment(self):
+        """测试播放鉴权稳定状态下无查询，支付成功与退款后权益快照失效"""
+        url = f'/api/courses/lessons/{self.lesson.id}/auth/'
+        self.assertEqual(self.client.get(url).data['code'], "AUTH_EXPIRED")
+
+        order = MemberOrder.objects.create(
+            order_no="ENTITLE_TEST", user=self.user, plan=self.plan, plan_name=self.plan.name,
+            plan_days=30, amount=30.00, status="PENDING"
+        )
+        process_payment_success(order, "MOCK")
+        self.user.refresh_from_db()
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['data']['file_id'], "f1")
+
+        admin = User.objects.create_superuser(phone='19999999999', password='password123')
+        self.client.force_authenticate(user=admin)
+        self.client.post('/api/membership/orders/action/', {"order_no": "ENTITLE_TEST", "action": "refund"})
+        self.user.refresh_from_db()
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_lesson_levels_follow_course_access_level(self):
+        """测试课程访问等级变更后播放鉴权映射失效"""
+        url = f'/api/courses/lessons/{self.lesson.id}/auth/'
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+        self.course.access_level = 0
+        self.course.save()
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get('/api/courses/lessons/0/auth/').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_user_save_invalidates_entitlement(self):
+        """测试直接修改用户等级与到期时间后权益快照失效，管理员身份不绕过等级检查"""
+        url = f'/api/courses/lessons/{self.lesson.id}/auth/'
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+        self.user.level = 1
+        self.user.membership_expire_at = timezone.now() + timedelta(days=1)
+        self.user.save(update_fields=['level', 'membership_expire_at'])
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+
+
+def make_alipay_keys():
+    """生成测试用 RSA 密钥：返回 (应用私钥 PEM, 支付宝公钥 PEM)，公钥为 X.509 SubjectPublicKeyInfo 格式"""
+    import rsa
+    from rsa import asn1
+    from pyasn1.codec.der import encoder
+    from pyasn1.type import univ
+
+    public_key, private_key = rsa.newkeys(1024)
+    header = asn1.PubKeyHeader()
+    header['oid'] = univ.ObjectIdentifier('1.2.840.113549.1.1.1')
+    spki = asn1.OpenSSLPubKey()
+    spki['header'] = header
+    spki['key'] = univ.BitString.fromOctetString(public_key.save_pkcs1('DER'))
+    public_pem = "-----BEGIN PUBLIC KEY-----\n" + base64.b64encode(encoder.encode(spki)).decode() + "\n-----END PUBLIC KEY-----"
+    return private_key.save_pkcs1().decode(), public_pem
+
+
+class AlipayClientTests(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.private_key, cls.public_key = make_alipay_keys()
+
+    def config(self, **overrides):
+        config = {"app_id": "2021000000000000", "alipay_public_key": self.public_key, "app_private_key": self.private_key,
+                  "server_url": "https://openapi.alipaydev.com/gateway.do"}
+        config.update(overrides)
+        return config
+
+    def test_client_cached_until_config_changes(self):
+        """测试支付宝客户端进程内复用，配置变化时重建，配置无效时立即报错"""
+        from rest_framework.exceptions import APIException
+        from .alipay_service import AlipayService
+
+        with override_settings(ALIPAY_CONFIG=self.config()):
+            client = AlipayService._get_alipay_client()
+            with patch('apps.membership.alipay_service.rsa.PublicKey.load_pkcs1_openssl_pem') as load:
+                self.assertIs(AlipayService._get_alipay_client(), client)
+            load.assert_not_called()
+        with override_settings(ALIPAY_CONFIG=self.config(app_id="2021000000000001")):
+            self.assertIsNot(AlipayService._get_alipay_client(), client)
+
+        for config in ({}, self.config(app_private_key=""), self.config(alipay_public_key="not-a-key")):
+            with override_settings(ALIPAY_CONFIG=config):
+                with self.assertRaises(APIException):
+                    AlipayService._get_alipay_client()
+
+
+class ImmediateExecutor:
+    def submit(self, fn, *args):
+        fn(*args)
+
+
+@patch('apps.membership.notifications._executor', ImmediateExecutor())
+class AlipayNotifyTests(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.private_key, cls.public_key = make_alipay_keys()
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(phone='18888888888', password='password123')
+        plan = MembershipPlan.objects.create(name="Monthly Plan", price=30.00, duration_days=30, level=1)
+        self.order = MemberOrder.objects.create(
+            order_no="NOTIFY_TEST", user=self.user, plan=plan, plan_name=plan.name,
+            plan_days=30, amount=Decimal("30.00"), status="PENDING"
+        )
+        config = {"app_id": "2021000000000000", "alipay_public_key": self.public_key, "app_private_key": self.private_key,
+                  "server_url": "https://openapi.alipaydev.com/gateway.do"}
+        self.settings_override = override_settings(ALIPAY_CONFIG=config)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def post_notify(self, params):
+        # 支付宝以 application/x-www-form-urlencoded 回调
+        return self.client.post('/api/membership/alipay/notify/', urlencode(params), content_type='application/x-www-form-urlencoded')
+
+    def notify(self, **overrides):
+        from alipay.aop.api.util.SignatureUtils import get_sign_content, sign_with_rsa2
+        params = {
+            "app_id": "2021000000000000", "trade_no": "2026101822001400000001", "out_trade_no": "NOTIFY_TEST",
+            "trade_status": "TRADE_SUCCESS", "total_amount": "30.00", "notify_id": "n1", "charset": "utf-8",
+        }
+        params.update(overrides)
+        params["sign"] = sign_with_rsa2(self.private_key, get_sign_content(params), "utf-8")
+        params["sign_type"] = "RSA2"
+        return params
+
+    def test_notify_fulfils_once(self):
+        """测试异步通知验签后应答 success，后台履约且按 trade_no 去重"""
+        params = self.notify()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post_notify(params)
+        self.assertEqual(response.content, b"success")
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, "PAID")
+        self.assertEqual(self.order.transactions.get().external_transaction_id, params["trade_no"])
+        notification = PaymentNotification.objects.get()
+        self.assertEqual((notification.status, notification.order_no), ("PROCESSED", "NOTIFY_TEST"))
+
+        # 支付宝重发与后续 TRADE_FINISHED 通知不会重复履约，后者记录为无需处理
+        for retry in (params, self.notify(trade_status="TRADE_FINISHED", notify_id="n2")):
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                self.assertEqual(self.post_notify(retry).content, b"success")
+            self.assertEqual(callbacks, [])
+        self.assertEqual(PaymentNotification.objects.get(notify_id="n2").status, "IGNORED")
+        self.assertEqual(PaymentNotification.objects.count(), 2)
+        self.assertEqual(self.order.transactions.count(), 1)
+
+    def test_notify_rejects_bad_signature_and_amount(self):
+        """测试签名错误返回 failure；金额、app_id 不一致与未付款通知均记录并应答 success，不履约"""
+        params = self.notify()
+        params["total_amount"] = "0.01"
+        response = self.post_notify(params)
+        self.assertEqual(response.content, b"failure")
+        self.assertFalse(PaymentNotification.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post_notify(self.notify(total_amount="0.01"))
+        self.assertEqual(response.content, b"success")
+        self.assertEqual(PaymentNotification.objects.get(notify_id="n1").status, "REVIEW")
+
+        cases = (
+            (self.notify(app_id="2021000000000001", notify_id="n2"), "REVIEW"),
+            (self.notify(trade_status="WAIT_BUYER_PAY", trade_no="2026101822001400000002", notify_id="n3"), "IGNORED"),
+        )
+        for params, expected in cases:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                self.assertEqual(self.post_notify(params).content, b"success")
+            self.assertEqual(callbacks, [])
+            self.assertEqual(PaymentNotification.objects.get(notify_id=params["notify_id"]).status, expected)
+
+        # 待人工核对的通知不会被自动重放
+        from .notifications import process_pending_notifications
+        self.assertEqual(process_pending_notifications(), {})
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, "PENDING")
+
+
+class ReconcilePaymentsTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(phone='18888888888', password='password123')
+        self.plan = MembershipPlan.objects.create(name="Monthly Plan", price=30.00, duration_days=30, level=1)
+        for i in range(12):
+            MemberOrder.objects.create(
+                order_no=f"RECON{i:02d}", user=self.user, plan=self.plan, plan_name=self.plan.name,
+                plan_days=30, amount=Decimal("30.00"), status="EXPIRED" if i % 2 else "PENDING"
+            )
+        MemberOrder.objects.filter(order_no="RECON11").update(created_at=timezone.now() - timedelta(days=3))
+        MemberOrder.objects.filter(order_no="RECON10").update(status="PAID")
+
+    def test_concurrent_reconcile_with_rate_limit(self):
+        """测试批量对账并发受限、限速，并为已付款订单履约"""
+        paid = {"trade_status": "TRADE_SUCCESS", "total_amount": "30.00"}
+        trades = {f"RECON{i:02d}": paid for i in range(5)}
+        trades["RECON05"] = {"trade_status": "TRADE_SUCCESS", "total_amount": "0.01"}
+        trades["RECON06"] = {"trade_status": "WAIT_BUYER_PAY", "total_amount": "30.00"}
+        trades["RECON10"] = paid
+        gateway = FakeAlipayGateway(trades, latency=0.02, failures={"RECON07"})
+
+        summary = reconcile_payments(workers=3, rate=100, gateway=gateway)
+        self.assertEqual(summary, {"orders": 10, "paid": 5, "unpaid": 3, "mismatched": 1, "failed": 1})
+        self.assertEqual(gateway.requests, 10)
+        self.assertLessEqual(gateway.max_in_flight, 3)
+        self.assertGreaterEqual(gateway.request_times[-1] - gateway.request_times[0], 0.08)
+
+        self.assertEqual(MemberOrder.objects.filter(status="PAID").count(), 6)
+        self.assertEqual(MemberOrder.objects.get(order_no="RECON03").transactions.get().external_transaction_id, "FAKERECON03")
+        self.assertEqual(MemberOrder.objects.get(order_no="RECON05").status, "EXPIRED")
+
+        # 再次对账只剩未付款订单，不会重复履约
+        summary = reconcile_payments(rate=0, gateway=FakeAlipayGateway(trades))
+        self.assertEqual(summary, {"orders": 5, "paid": 0, "unpaid": 4, "mismatched": 1, "failed": 0})
+        self.assertEqual(MemberOrder.objects.get(order_no="RECON05").transactions.count(), 0)
+
+
+class OrderQueryPlanTests(APITestCase):
+    """热点查询必须走索引，避免后续改动退化为全表扫描"""
+    def setUp(self):
+        self.user = User.objects.create_user(phone='18888888888', password='password123')
+        plan = MembershipPlan.objects.create(name="Monthly Plan", price=30.00, duration_days=30, level=1)
+        for i, order_status in enumerate(("PENDING", "PAID", "EXPIRED", "CANCELLED")):
+            order = MemberOrder.objects.create(
+                order_no=f"PLAN{i}", user=self.user, plan=plan, plan_name=plan.name,
+                plan_days=30, amount=30.00, status=order_status
+            )
+        PaymentTransaction.objects.create(order=order, transaction_type="PAYMENT", amount=30.00, platform="ALIPAY", external_transaction_id="T1")
+
+    def assertUsesIndex(self, queryset, ordered=False):
+        table = queryset.model._meta.db_table
+        if connection.vendor == 'sqlite':
+            plan = queryset.explain()
+            self.assertIn("INDEX", plan, plan)
+            self.assertIsNone(re.search(rf"SCAN {table}\s*$", plan, re.MULTILINE), plan)
+            if ordered:
+                self.assertNotIn("TEMP B-TREE", plan, plan)
+        elif connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+            plan = queryset.explain()
+            self.assertNotIn(f"Seq Scan on {table}", plan, plan)
+            if ordered:
+                self.assertNotIn("Sort Key", plan, plan)
+        else:
+            self.skipTest(f"No plan assertions for {connection.vendor}")
+
+    def test_hot_queries_use_indexes(self):
+        now = timezone.now()
+        # OrderCreateView / expire_due_orders(用户)
+        self.assertUsesIndex(MemberOrder.objects.filter(user=self.user, status="PENDING"))
+        self.assertUsesIndex(MemberOrder.objects.filter(user=self.user, status="PENDING", expires_at__lte=now))
+        # expire_due_orders
+        self.assertUsesIndex(MemberOrder.objects.filter(status="PENDING", expires_at__lte=now).order_by("expires_at"), ordered=True)
+        # reconcile_payments
+        self.assertUsesIndex(reconcile_candidates())
+        # OrderListView
+        self.assertUsesIndex(MemberOrder.objects.filter(user=self.user).order_by("-created_at"), ordered=True)
+        self.assertUsesIndex(PaymentTransaction.objects.filter(external_transaction_id="T1"))
@@ -7,6 +7,7 @@ from .views import (
     OrderListView,
     OrderActionView,
     OrderPaymentQueryView,
+    AlipayNotifyView,
 )
 
 urlpatterns = [
@@ -17,4 +18,5 @@ urlpatterns = [
     path('orders/list/', OrderListView.as_view(), name='order-list'),
     path('orders/action/', OrderActionView.as_view(), name='order-action'),
     path('orders/query-status/', OrderPaymentQueryView.as_view(), name='order-query-status'),
+    path('alipay/notify/', AlipayNotifyView.as_view(), name='alipay-notify'),
 ]
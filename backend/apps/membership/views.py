@@ -7,10 +7,15 @@ from django.contrib.auth import get_user_model
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
+from rest_framework.parsers import FormParser
+from django.http import HttpResponse
+from django.conf import settings
 from config.response import ok, error
 from .models import MembershipPlan, MemberOrder
 from .serializers import MembershipPlanSerializer, MemberOrderSerializer
-from .services import check_and_expire_order, process_payment_success
+from .services import check_and_expire_order, expire_due_orders, process_payment_success
+from .notifications import record_notification, schedule_fulfilment
+from .entitlements import invalidate_user_entitlement
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from decimal import Decimal
 
@@ -122,17 +127,10 @@ class OrderCreateView(APIView):
                      return error("VALIDATION_ERROR", "不支持降级购买", status=422)
             
             # 检查是否存在待支付订单
-            # 1. 查找该用户的所有待支付订单
-            pending_orders = MemberOrder.objects.filter(user=user, status="PENDING")
-            has_valid_pending_order = False
-            
-            for pending_order in pending_orders:
-                # 2. 检查是否过期（如果超时，此函数将状态更新为已过期）
-                is_expired = check_and_expire_order(pending_order)
-                if not is_expired:
-                    # 如果未过期，说明订单仍然有效且待支付
-                    has_valid_pending_order = True
-                    break
+            # 1. 先将该用户已超过支付截止时间的待支付订单置为已过期（条件更新）
+            expire_due_orders(MemberOrder.objects.filter(user=user))
+            # 2. 剩余的待支付订单仍然有效
+            has_valid_pending_order = MemberOrder.objects.filter(user=user, status="PENDING").exists()
             
             if has_valid_pending_order:
                 return error("VALIDATION_ERROR", "您存在未支付的订单，请先支付或取消后再下单", status=422)
@@ -164,7 +162,7 @@ class OrderDetailView(APIView):
             if not request.user.is_staff and order.user != request.user:
                 return error("PERMISSION_DENIED", "无权查看此订单", status=403)
             
-            # 检查并在必要时设置过期
+            # 按支付截止时间计算是否过期（仅内存，不写库）
             check_and_expire_order(order)
             
             return ok(MemberOrderSerializer(order).data)
@@ -185,7 +183,7 @@ class OrderPayView(APIView):
         except MemberOrder.DoesNotExist:
             return error("NOT_FOUND", "订单不存在", status=404)
         
-        # 首先检查过期情况（如果过期则更新状态）
+        # 首先检查是否已过支付截止时间
         if check_and_expire_order(order):
             return error("VALIDATION_ERROR", "订单已过期", status=422)
             
@@ -244,6 +242,29 @@ class OrderPaymentQueryView(APIView):
                 "error": str(e)
             }, message=f"查询支付宝失败，仅返回本地状态")
 
+class AlipayNotifyView(APIView):
+    """
+    支付宝异步通知 (ALIPAY_CONFIG['notify_url'])
+    验签通过的通知连同处理结果全部保存后立即应答 success，履约在后台执行；
+    app_id、金额不一致的通知保存为待人工核对，同样应答 success，避免支付宝反复重发。
+    只有验签失败时应答 failure，支付宝会按退避策略重发。
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+    parser_classes = [FormParser]
+
+    def post(self, request):
+        from .alipay_service import AlipayService
+        params = request.data.dict()
+        if not AlipayService.verify_notify(params):
+            return HttpResponse("failure", content_type="text/plain", status=400)
+
+        with transaction.atomic():
+            notification = record_notification("ALIPAY", params, app_id=settings.ALIPAY_CONFIG.get('app_id'))
+            if notification is not None:
+                schedule_fulfilment(notification.pk)
+        return HttpResponse("success", content_type="text/plain")
+
 class OrderListView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -266,6 +287,8 @@ class OrderListView(APIView):
             paginator.page_size = page_size
 
         result_page = paginator.paginate_queryset(orders, request)
+        for order in result_page:
+            check_and_expire_order(order)
         serializer = MemberOrderSerializer(result_page, many=True)
         
         # 使用 UnifiedModelViewSet 类似的返回结构
@@ -375,6 +398,7 @@ class OrderActionView(APIView):
                 user.membership_reference_amount = max(0, user.membership_reference_amount - order.amount)
                 
                 user.save()
+                invalidate_user_entitlement(user.pk)
                 
             return ok(message="订单已退款，会员权益已扣除")
             
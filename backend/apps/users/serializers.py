@@ -63,28 +63,28 @@ class UserSerializer(serializers.ModelSerializer):
             
         from django.utils import timezone
         if obj.membership_expire_at and obj.membership_expire_at > timezone.now():
-            try:
-                from apps.membership.models import MembershipPlan
-                plan = MembershipPlan.objects.filter(level=obj.level).first()
-                if plan:
-                    return plan.name
-            except ImportError:
-                pass
-            return f"VIP Lv.{obj.level}"
+            from apps.membership.services import get_plan_name
+            return get_plan_name(obj.level, self.context)
             
         return "普通用户"
 
     def get_avatar(self, obj):
         if not obj.avatar:
             return ""
-        if obj.avatar.startswith("http"):
-            return obj.avatar
-        # Build absolute URL for relative paths
         request = self.context.get("request")
+        avatar = obj.avatar
+        # ?avatar_size=64 返回不小于该宽度的派生图
+        size = request.GET.get("avatar_size", "") if request else ""
+        if size.isdigit():
+            from apps.common.images import best_variant
+            avatar = best_variant(avatar, int(size))
+        if avatar.startswith("http"):
+            return avatar
+        # Build absolute URL for relative paths
         if request:
             from django.conf import settings
-            return request.build_absolute_uri(settings.MEDIA_URL + obj.avatar)
-        return obj.avatar
+            return request.build_absolute_uri(settings.MEDIA_URL + avatar)
+        return avatar
 
     def get_phone(self, obj):
         if not obj.phone:
@@ -256,12 +256,17 @@ class AvatarUploadView(APIView):
              return error("VALIDATION_ERROR", "仅支持图片文件", status=422)
 
         file_name = f"avatars/{request.user.id}_{int(random.random()*10000)}{ext}"
-        path = default_storage.save(file_name, ContentFile(file.read()))
+        content = file.read()
+        path = default_storage.save(file_name, ContentFile(content))
         
         # 保存相对路径到数据库
         user = request.user
         user.avatar = path
         user.save()
+
+        # 后台生成小尺寸派生图，UserSerializer 按请求尺寸选择
+        from apps.common.images import schedule_derivatives, load_from_default_storage, save_to_default_storage
+        schedule_derivatives(path, path, 'avatar', load_from_default_storage, save_to_default_storage)
         
         # 返回绝对URL用于立即显示
         url = request.build_absolute_uri(settings.MEDIA_URL + path)
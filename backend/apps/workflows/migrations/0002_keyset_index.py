@@ -0,0 +1,19 @@
+# Generated by Django 5.2.9 on 2026-10-18 02:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("workflows", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="workflow",
+            index=models.Index(
+                fields=["sort_order", "-created_at", "-id"], name="workflows_keyset_idx"
+            ),
+        ),
+    ]
@@ -61,6 +61,10 @@ class Workflow(TimeStampedModel):
         verbose_name = "工作流"
         verbose_name_plural = verbose_name
         ordering = ['sort_order', '-created_at']
+        indexes = [
+            # 键集分页 (sort_order, created_at, id)
+            models.Index(fields=['sort_order', '-created_at', '-id'], name='workflows_keyset_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -1,7 +1,7 @@
 from rest_framework import serializers
 from rest_framework_recursive.fields import RecursiveField
 from .models import WorkflowCategory, Workflow
-from apps.membership.models import MembershipPlan
+from apps.membership.services import get_plan_name
 
 class WorkflowCategorySerializer(serializers.ModelSerializer):
     children = RecursiveField(many=True, required=False)
@@ -38,8 +38,4 @@ class WorkflowSerializer(serializers.ModelSerializer):
     def get_access_level_name(self, obj):
         if obj.access_level == 0:
             return "免费"
-        try:
-            plan = MembershipPlan.objects.filter(level=obj.access_level).first()
-            return plan.name if plan else f"VIP Lv.{obj.access_level}"
-        except Exception:
-            return f"VIP Lv.{obj.access_level}"
+        return get_plan_name(obj.access_level, self.context)
@@ -0,0 +1,11 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from apps.common.tree import invalidate_category_tree
+from .models import WorkflowCategory
+
+
+@receiver([post_save, post_delete], sender=WorkflowCategory)
+def workflow_category_changed(sender, instance, **kwargs):
+    invalidate_category_tree(WorkflowCategory)
+    transaction.on_commit(lambda: invalidate_category_tree(WorkflowCategory))
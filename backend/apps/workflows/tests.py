@@ -1,3 +1,33 @@
-from django.test import TestCase
+from django.core.cache import cache
+from rest_framework.test import APITestCase
+from rest_framework import status
+from .models import WorkflowCategory
 
-# Create your tests here.
+
+class WorkflowCategoryTreeTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.root = WorkflowCategory.objects.create(name="自动化", sort_order=1)
+        WorkflowCategory.objects.create(name="办公", parent=self.root, sort_order=2)
+        WorkflowCategory.objects.create(name="营销", parent=self.root, sort_order=1)
+        WorkflowCategory.objects.create(name="数据", sort_order=2)
+
+    def test_category_tree_single_query_and_cached(self):
+        """测试分类树一次查询构建，再次请求命中缓存"""
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/workflows/categories/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.data['data']
+        self.assertEqual([c['name'] for c in data], ["自动化", "数据"])
+        self.assertEqual([c['name'] for c in data[0]['children']], ["营销", "办公"])
+        self.assertEqual(data[1]['children'], [])
+
+        with self.assertNumQueries(0):
+            self.client.get('/api/workflows/categories/')
+
+    def test_category_tree_invalidated_on_write(self):
+        """测试分类变更后分类树缓存失效"""
+        self.client.get('/api/workflows/categories/')
+        WorkflowCategory.objects.create(name="客服", parent=self.root, sort_order=3)
+        response = self.client.get('/api/workflows/categories/')
+        self.assertEqual(len(response.data['data'][0]['children']), 3)
@@ -2,6 +2,9 @@ from rest_framework.permissions import IsAdminUser, AllowAny
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters
 from apps.common.views import UnifiedModelViewSet
+from apps.common.pagination import CatalogPagination
+from apps.common.tree import get_category_tree
+from apps.membership.entitlements import check_access
 from config.response import ok
 from .models import WorkflowCategory, Workflow
 from .serializers import WorkflowCategorySerializer, WorkflowSerializer
@@ -17,10 +20,8 @@ class WorkflowCategoryViewSet(UnifiedModelViewSet):
         return [IsAdminUser()]
 
     def list(self, request, *args, **kwargs):
-        # 仅返回一级分类，子分类通过 RecursiveField 嵌套返回
-        queryset = self.get_queryset().filter(parent__isnull=True)
-        serializer = self.get_serializer(queryset, many=True)
-        return ok(serializer.data)
+        # 一次查询构建整棵分类树，仅返回一级分类，子分类通过 RecursiveField 嵌套返回
+        return ok(get_category_tree(self.get_queryset(), self.get_serializer_class()))
 
 class WorkflowViewSet(UnifiedModelViewSet):
     queryset = Workflow.objects.all()
@@ -30,8 +31,19 @@ class WorkflowViewSet(UnifiedModelViewSet):
     filterset_fields = ['category', 'status']
     search_fields = ['title', 'description', 'tags']
     ordering_fields = ['sort_order', 'created_at']
+    pagination_class = CatalogPagination
 
     def get_permissions(self):
         if self.action in ['list', 'retrieve']:
             return [AllowAny()]
         return [IsAdminUser()]
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        data = self.get_serializer(instance).data
+        # 未满足访问等级时不返回演示视频与附件
+        data['has_access'] = check_access(request.user, instance.access_level) is None
+        if not data['has_access']:
+            data['video_url'] = None
+            data['attachment'] = None
+        return ok(data)
@@ -191,6 +191,14 @@ else:
         }
     }
 
+# Course catalog snapshots (optional on-disk copy, empty to disable)
+# 课程目录快照（可选磁盘副本目录，留空则仅使用缓存）
+COURSE_SNAPSHOT_DIR = env("COURSE_SNAPSHOT_DIR", default="")
+
+# Lesson progress heartbeats are buffered in the cache and flushed in batches (seconds)
+# 学习进度心跳先写缓存，按此间隔批量写入数据库（秒）
+LESSON_PROGRESS_FLUSH_INTERVAL = env.int("LESSON_PROGRESS_FLUSH_INTERVAL", default=30)
+
 REST_FRAMEWORK = {
     'EXCEPTION_HANDLER': 'config.response.unified_exception_handler',
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
@@ -23,6 +23,19 @@ export function getVodPlaySignature(fileId) {
   })
 }
 
+// 批量获取课程（或某章节）全部课时的VOD播放签名
+export function getVodPlaySignatures(courseId, chapterId) {
+  return request({
+    url: '/common/vod/signature/',
+    method: 'get',
+    params: {
+      type: 'play',
+      course_id: courseId,
+      chapter_id: chapterId
+    }
+  })
+}
+
 // 通用文件上传 (支持 type 参数: avatar, course_cover, category_cover, material, etc.)
 export function uploadFile(formData, type = 'file') {
   return request({
@@ -35,3 +48,21 @@ export function uploadFile(formData, type = 'file') {
     }
   })
 }
+
+// 直传对象存储：获取预签名地址 -> 浏览器 PUT 上传 -> 完成回调，返回 { url, key }
+export async function directUpload(file, type = 'file') {
+  const presign = await request({
+    url: '/common/upload/presign/',
+    method: 'post',
+    data: { filename: file.name, type }
+  })
+  const res = await fetch(presign.put_url, { method: presign.method, body: file })
+  if (!res.ok) {
+    throw new Error(`上传失败: ${res.status}`)
+  }
+  return request({
+    url: '/common/upload/complete/',
+    method: 'post',
+    data: { upload_token: presign.upload_token }
+  })
+}
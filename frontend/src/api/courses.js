@@ -98,6 +98,15 @@ export function deleteChapter(id) {
   })
 }
 
+// 批量调整章节排序 ({ course, ids })
+export function reorderChapters(data) {
+  return request({
+    url: '/courses/chapters/reorder/',
+    method: 'post',
+    data
+  })
+}
+
 // ================== 课时管理 ==================
 
 export function createLesson(data) {
@@ -123,6 +132,24 @@ export function deleteLesson(id) {
   })
 }
 
+// 批量导入课时 (JSON: { course, chapter, lessons } 或 FormData: file/course/chapter)
+export function bulkImportLessons(data) {
+  return request({
+    url: '/courses/lessons/bulk-import/',
+    method: 'post',
+    data
+  })
+}
+
+// 批量调整课时排序 ({ chapter, ids })
+export function reorderLessons(data) {
+  return request({
+    url: '/courses/lessons/reorder/',
+    method: 'post',
+    data
+  })
+}
+
 // ================== 客户端API ==================
 
 export function getClientCourseList(params) {
@@ -146,3 +173,11 @@ export function getLessonPlayAuth(id) {
     method: 'get'
   })
 }
+
+export function reportLessonProgress(id, data) {
+  return request({
+    url: `/courses/lessons/${id}/progress/`,
+    method: 'post',
+    data
+  })
+}